@@ -1,15 +1,26 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import secrets
+import uuid
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
-import models, schemas
+import models, schemas, database
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+CLAIMS_CACHE_SIZE = 10000
+
+# Verified access-token claims, keyed by token digest, so repeat requests
+# skip the signature check until the token expires
+_claims_cache = OrderedDict()
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
@@ -20,6 +31,10 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def hash_passwords(passwords: list) -> list:
+    # Module-level so it can be shipped to a process pool
+    return [pwd_context.hash(p) for p in passwords]
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,20 +45,91 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def decode_access_token(token: str) -> Optional[str]:
+    """Email claim of a valid access token, or None"""
+    key = token_digest(token)
+    cached = _claims_cache.get(key)
+    if cached:
+        email, expires = cached
+        if expires > time.time():  # exp is UTC epoch seconds
+            _claims_cache.move_to_end(key)
+            return email
+        del _claims_cache[key]
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    expires = payload.get("exp")
+    if email is None or expires is None:
+        # Only tokens that expire are accepted (and cached)
+        return None
+
+    _claims_cache[key] = (email, expires)
+    while len(_claims_cache) > CLAIMS_CACHE_SIZE:
+        _claims_cache.popitem(last=False)
+    return email
+
+async def issue_refresh_token(user_id: str, family_id: Optional[str] = None) -> str:
+    token = secrets.token_urlsafe(32)
+    await models.RefreshToken(
+        token_hash=token_digest(token),
+        user_id=user_id,
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ).create()
+    return token
+
+async def rotate_refresh_token(token: str):
+    """Spend a refresh token and issue its successor; returns (user, new_token).
+
+    Presenting a token that was already rotated means it leaked, so the whole
+    family is revoked and the legitimate holder has to log in again.
+    """
+    refresh_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    now = datetime.utcnow()
+    current = await models.RefreshToken.find_one(models.RefreshToken.token_hash == token_digest(token))
+    if not current or current.expires_at <= now:
+        raise refresh_exception
+    if current.revoked_at:
+        await revoke_refresh_tokens(family_id=current.family_id)
+        raise refresh_exception
+
+    # Claim atomically so two concurrent refreshes cannot both rotate
+    claimed = await database.collection(models.RefreshToken).update_one(
+        {"_id": current.id, "revoked_at": None},
+        {"$set": {"revoked_at": now}},
+    )
+    if not claimed.modified_count:
+        raise refresh_exception
+
+    user = await models.User.get(current.user_id)
+    if not user or not user.is_active:
+        raise refresh_exception
+    return user, await issue_refresh_token(current.user_id, current.family_id)
+
+async def revoke_refresh_tokens(user_id: Optional[str] = None, family_id: Optional[str] = None):
+    query = {"revoked_at": None}
+    if user_id:
+        query["user_id"] = user_id
+    if family_id:
+        query["family_id"] = family_id
+    await database.collection(models.RefreshToken).update_many(query, {"$set": {"revoked_at": datetime.utcnow()}})
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
-    except JWTError:
+    email = decode_access_token(token)
+    if email is None:
         raise credentials_exception
+    token_data = schemas.TokenData(email=email)
     
     user = await models.User.find_one(models.User.email == token_data.email)
     if user is None:
@@ -0,0 +1,255 @@
+# Load Test Harness for Vitta Bank
+# Boots the API in-process against a Mongo stand-in (or a local mongod),
+# seeds a synthetic dataset and drives a weighted mix of user and admin
+# flows from concurrent async clients. Prints a JSON report with
+# throughput and p50/p95/p99 latency per route.
+#
+#   cd backend
+#   python -m benchmarks.load_test --users 200 --transactions-per-account 1000 --duration 30
+#   python -m benchmarks.load_test --mongo-url mongodb://localhost:27017 --output report.json
+#   python -m benchmarks.load_test --mongo-url mongodb://localhost:27017 --base-url http://localhost:8000
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+from benchmarks import standin
+
+# Weighted scenario mix; each scenario is one or more API calls
+DEFAULT_MIX = {
+    "dashboard": 50,
+    "transfer": 20,
+    "history": 15,
+    "login": 5,
+    "statement": 5,
+    "admin": 5,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.latencies[route].append(time.perf_counter() - started)
+        if not ok:
+            self.errors[route] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, samples in sorted(self.latencies.items()):
+            ms = np.asarray(samples) * 1000
+            routes[route] = {
+                "count": len(samples),
+                "errors": self.errors[route],
+                "rps": round(len(samples) / elapsed, 2),
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "max_ms": round(float(ms.max()), 2),
+            }
+        total = sum(r["count"] for r in routes.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(r["errors"] for r in routes.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+async def login(client, recorder: Recorder, email: str) -> dict:
+    from benchmarks.seed import SEED_PASSWORD
+    response = await recorder.call(client, "POST /auth/login", "POST", "/auth/login", json={"email": email, "password": SEED_PASSWORD})
+    if response is None or response.status_code != 200:
+        return {}
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def scenario_dashboard(client, recorder, user, headers, users, rng):
+    # The calls the React dashboard makes on load
+    for route, url in (
+        ("GET /accounts/", "/accounts/"),
+        ("GET /cards/", "/cards/"),
+        ("GET /loans/", "/loans/"),
+        ("GET /investments/", "/investments/"),
+        ("GET /insurance/", "/insurance/"),
+        ("GET /credit-score/", "/credit-score/"),
+    ):
+        await recorder.call(client, route, "GET", url, headers=headers)
+
+
+async def scenario_transfer(client, recorder, user, headers, users, rng):
+    from benchmarks.seed import SEED_PIN
+    target = rng.choice([u for u in users if u["account_id"] != user["account_id"]] or users)
+    await recorder.call(client, "POST /accounts/transfer", "POST", "/accounts/transfer", headers=headers, json={
+        "from_account_id": user["account_id"],
+        "to_account_number": target["account_number"],
+        "amount": round(rng.uniform(1, 100), 2),
+        "pin": SEED_PIN,
+    })
+
+
+async def scenario_history(client, recorder, user, headers, users, rng):
+    account_id = user["account_id"]
+    await recorder.call(client, "GET /accounts/{id}/transactions", "GET", f"/accounts/{account_id}/transactions", headers=headers, params={"limit": 20})
+    await recorder.call(client, "GET /accounts/{id}/analytics", "GET", f"/accounts/{account_id}/analytics", headers=headers)
+
+
+async def scenario_login(client, recorder, user, headers, users, rng):
+    await login(client, recorder, user["email"])
+
+
+async def scenario_statement(client, recorder, user, headers, users, rng):
+    await recorder.call(client, "GET /accounts/{id}/statement", "GET", f"/accounts/{user['account_id']}/statement", headers=headers)
+
+
+async def scenario_admin(client, recorder, user, headers, users, rng):
+    admin_headers = headers if user["is_admin"] else None
+    if admin_headers is None:
+        return
+    await recorder.call(client, "GET /auth/stats", "GET", "/auth/stats", headers=admin_headers)
+    await recorder.call(client, "GET /loans/admin/summary", "GET", "/loans/admin/summary", headers=admin_headers)
+
+
+SCENARIOS = {
+    "dashboard": scenario_dashboard,
+    "transfer": scenario_transfer,
+    "history": scenario_history,
+    "login": scenario_login,
+    "statement": scenario_statement,
+    "admin": scenario_admin,
+}
+
+
+async def virtual_user(index: int, client, recorder: Recorder, users: list, mix: dict, deadline: float, max_iterations: int):
+    rng = random.Random(index)
+    # The first virtual user is always an admin so the admin scenario runs
+    admins = [u for u in users if u["is_admin"]]
+    user = admins[0] if index == 0 and admins else rng.choice(users)
+    headers = await login(client, recorder, user["email"])
+    if not headers:
+        return
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    iterations = 0
+    while time.perf_counter() < deadline and (not max_iterations or iterations < max_iterations):
+        name = rng.choices(names, weights)[0]
+        if name == "admin" and not user["is_admin"]:
+            name = "dashboard"
+        await SCENARIOS[name](client, recorder, user, headers, users, rng)
+        iterations += 1
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def run(args) -> dict:
+    standin.disable_email()
+    if not args.rate_limits:
+        # Every virtual user comes from one IP; per-IP login limits would throttle the run
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+        # Virtual users transfer far faster than the per-account velocity limits allow
+        os.environ["TRANSFER_LIMITS_ENABLED"] = "false"
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ.setdefault("DB_NAME", "vitta_bank_bench")
+    else:
+        standin.use_mock_mongo()
+
+    import database
+    import main
+    from benchmarks.seed import seed
+
+    await database.init_db()
+    dataset = await seed(args.users, args.transactions_per_account, admins=max(1, args.users // 100))
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=args.timeout)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    async with client:
+        await asyncio.gather(*(
+            virtual_user(i, client, recorder, dataset["users"], args.mix, deadline, args.iterations)
+            for i in range(args.concurrency)
+        ))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "config": {
+            "backend": "mongod" if args.mongo_url else "mongomock",
+            "target": args.base_url or "in-process",
+            "users": args.users,
+            "transactions": dataset["transactions"],
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "python": platform.python_version(),
+        },
+        "seed_seconds": dataset["seed_seconds"],
+        **recorder.report(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Vitta Bank API")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions-per-account", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to drive load for")
+    parser.add_argument("--iterations", type=int, default=0, help="Stop each virtual user after N scenarios (0 = until duration)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. dashboard=50,transfer=20,login=5")
+    parser.add_argument("--mongo-url", default=None, help="Use a real (local, disposable) mongod instead of the stand-in")
+    parser.add_argument("--base-url", default=None, help="Drive an already running server; needs --mongo-url for seeding")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--rate-limits", action="store_true", help="Keep admission control and transfer velocity limits on (expect 429s)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here as well as stdout")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's per-request prints")
+    args = parser.parse_args()
+    if args.base_url and not args.mongo_url:
+        parser.error("--base-url needs --mongo-url so the dataset is seeded where the server reads")
+
+    # The app prints every request; keep the report readable
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
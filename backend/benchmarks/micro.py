@@ -0,0 +1,256 @@
+# Microbenchmarks for Vitta Bank CPU hot spots
+# Times the CPU-bound work that runs inline on request paths - bcrypt, JWT,
+# statement PDFs, email rendering and MIME assembly, and schema
+# serialization - and compares each against a stored baseline.
+#
+#   cd backend
+#   python -m benchmarks.micro                  # run and compare with the baseline
+#   python -m benchmarks.micro -k pdf --slow    # include the 100k-row statement
+#   python -m benchmarks.micro --save           # record a new baseline
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+DEFAULT_THRESHOLD = 0.20  # Flag anything whose best round is >20% slower than its baseline
+MIN_ROUND_SECONDS = 0.05
+ROUNDS = 5
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, slow: bool = False):
+    """Register a setup function that returns the zero-argument callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = {"setup": setup, "slow": slow}
+        return setup
+    return register
+
+
+def sample_transactions(n: int) -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "timestamp": now - timedelta(minutes=i),
+            "description": f"Transfer to {1000000000 + i}",
+            "transaction_type": "transfer",
+            "amount": -125.5 if i % 2 else 980.0,
+        }
+        for i in range(n)
+    ]
+
+
+# --- auth ---
+
+@benchmark("auth.get_password_hash")
+def bench_hash():
+    import auth
+    return lambda: auth.get_password_hash("correct horse battery staple")
+
+
+@benchmark("auth.verify_password")
+def bench_verify():
+    import auth
+    hashed = auth.get_password_hash("correct horse battery staple")
+    return lambda: auth.verify_password("correct horse battery staple", hashed)
+
+
+@benchmark("auth.create_access_token")
+def bench_jwt_encode():
+    import auth
+    return lambda: auth.create_access_token({"sub": "user@example.com"}, timedelta(minutes=30))
+
+
+@benchmark("auth.decode_access_token")
+def bench_jwt_decode():
+    # The decode step of auth.get_current_user, without the user lookup
+    from jose import jwt
+    import auth
+    token = auth.create_access_token({"sub": "user@example.com"}, timedelta(minutes=30))
+    return lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+
+
+# --- statements ---
+
+def _statement(rows: int):
+    from utils.pdf_generator import generate_statement_pdf
+    transactions = sample_transactions(rows)
+    return lambda: generate_statement_pdf(
+        account_holder="Load Test",
+        account_number="1234567890",
+        opening_balance=10000.0,
+        closing_balance=25000.0,
+        transactions=transactions,
+        start_date="01 Jan 2026",
+        end_date="31 Dec 2026",
+    )
+
+
+@benchmark("pdf.statement[100]")
+def bench_pdf_100():
+    return _statement(100)
+
+
+@benchmark("pdf.statement[10k]")
+def bench_pdf_10k():
+    return _statement(10_000)
+
+
+@benchmark("pdf.statement[100k]", slow=True)
+def bench_pdf_100k():
+    return _statement(100_000)
+
+
+# --- email ---
+
+@benchmark("email.email_template")
+def bench_email_template():
+    from utils.email_service import email_template
+    content = "<p>Dear <strong>Load Test</strong>,</p>" * 5
+    return lambda: email_template(content)
+
+
+@benchmark("email.build_message")
+def bench_build_message():
+    from utils.email_service import build_message, welcome_email
+    subject, html = welcome_email("Load Test", "1234567890", 10000.0)
+    return lambda: build_message("user@example.com", subject, html).as_string()
+
+
+@benchmark("email.build_message[pdf]")
+def bench_build_message_pdf():
+    from utils.email_service import build_message
+    pdf = _statement(100)().getvalue()
+    return lambda: build_message("user@example.com", "Statement", "<p>Attached</p>", pdf, "statement.pdf").as_string()
+
+
+# --- schemas ---
+
+@benchmark("schemas.Transaction[1k].dump_json")
+def bench_schema_transactions():
+    from pydantic import TypeAdapter
+    import schemas
+    adapter = TypeAdapter(list[schemas.Transaction])
+    rows = [{"id": str(i), **txn} for i, txn in enumerate(sample_transactions(1000))]
+    return lambda: adapter.dump_json(adapter.validate_python(rows))
+
+
+@benchmark("schemas.Account[1k].from_attributes")
+def bench_schema_accounts():
+    from types import SimpleNamespace
+    from pydantic import TypeAdapter
+    import schemas
+    adapter = TypeAdapter(list[schemas.Account])
+    rows = [
+        SimpleNamespace(id=str(i), account_number=str(1000000000 + i), balance=1000.0, account_type="savings")
+        for i in range(1000)
+    ]
+    return lambda: adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def measure(fn, rounds: int = ROUNDS) -> dict:
+    """Per-call timings: loops are calibrated so each round lasts MIN_ROUND_SECONDS"""
+    fn()  # Warm up caches, imports and font metrics
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_ROUND_SECONDS:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(MIN_ROUND_SECONDS / elapsed) + 1)
+
+    samples = [elapsed / loops]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - started) / loops)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+def load_baseline() -> dict:
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict):
+    os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+    baseline = load_baseline()
+    baseline.setdefault("benchmarks", {}).update({name: {"min": r["min"], "median": r["median"]} for name, r in results.items()})
+    baseline["machine"] = {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.machine()}
+    baseline["saved_at"] = datetime.utcnow().isoformat()
+    with open(BASELINE_PATH, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for CPU hot spots")
+    parser.add_argument("-k", dest="keyword", default=None, help="Only run benchmarks whose name contains this")
+    parser.add_argument("--slow", action="store_true", help="Include slow cases (100k-row statement)")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    baseline = load_baseline().get("benchmarks", {})
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<36} {'median':>10} {'min':>10} {'baseline':>10} {'change':>8}")
+    for name, entry in BENCHMARKS.items():
+        if args.keyword and args.keyword not in name:
+            continue
+        if entry["slow"] and not args.slow:
+            continue
+        result = measure(entry["setup"](), args.rounds)
+        results[name] = result
+
+        # Compare best rounds: the minimum is far less noisy than the median
+        base = baseline.get(name, {}).get("min")
+        change = ""
+        if base:
+            ratio = result["min"] / base - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<36} {format_seconds(result['median']):>10} {format_seconds(result['min']):>10} "
+              f"{format_seconds(base) if base else '-':>10} {change:>8}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save:
+        save_baseline(results)
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
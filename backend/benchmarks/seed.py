@@ -0,0 +1,132 @@
+# Synthetic dataset for Vitta Bank benchmarks
+# Writes users, accounts, cards, loans and transactions with raw unordered
+# insert_many batches. Every seeded user shares one password and PIN, hashed
+# once, so seeding is bound by Mongo rather than bcrypt.
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import auth
+import database
+import models
+from utils import number_issuer
+
+SEED_PASSWORD = "loadtest"
+SEED_PIN = "1234"
+SEED_BATCH = 10000
+TRANSACTION_TYPES = ("deposit", "withdrawal", "transfer")
+DESCRIPTIONS = ("Transfer to {n}", "Transfer from {n}", "Investment in AAPL", "Insurance Premium: Health Plus", "Loan Disbursement: personal")
+
+
+def seed_email(i: int) -> str:
+    return f"loadtest{i}@example.com"
+
+
+async def _insert_batches(document_model, docs):
+    collection = database.collection(document_model)
+    batch = []
+    written = 0
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= SEED_BATCH:
+            await collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+def _transactions(accounts: list, per_account: int, history_days: int, rng: random.Random):
+    now = datetime.utcnow()
+    for account in accounts:
+        account_id = str(account["_id"])
+        for _ in range(per_account):
+            counterparty = rng.choice(accounts)
+            amount = round(rng.uniform(10, 5000), 2)
+            yield {
+                "account_id": account_id,
+                "amount": amount if rng.random() < 0.5 else -amount,
+                "transaction_type": rng.choice(TRANSACTION_TYPES),
+                "timestamp": now - timedelta(seconds=rng.randint(0, history_days * 86400)),
+                "description": rng.choice(DESCRIPTIONS).format(n=counterparty["account_number"]),
+                "related_account_id": str(counterparty["_id"]),
+            }
+
+
+async def seed(users: int = 100, transactions_per_account: int = 100, admins: int = 1, history_days: int = 730, rng_seed: int = 7) -> dict:
+    """Seed the dataset and return what the load generator needs to drive it"""
+    rng = random.Random(rng_seed)
+    started = time.perf_counter()
+    password_hash = auth.get_password_hash(SEED_PASSWORD)
+    pin_hash = auth.get_password_hash(SEED_PIN)
+
+    user_docs = [
+        {
+            "_id": ObjectId(),
+            "email": seed_email(i),
+            "full_name": f"Load Test {i}",
+            "hashed_password": password_hash,
+            "pin_hash": pin_hash,
+            "is_active": True,
+            "is_admin": i < admins,
+        }
+        for i in range(users)
+    ]
+    await _insert_batches(models.User, user_docs)
+
+    account_numbers = await number_issuer.account_numbers.take(users)
+    account_docs = [
+        {
+            "_id": ObjectId(),
+            "user_id": str(user["_id"]),
+            "account_number": account_number,
+            "balance": 1_000_000.0,
+            "account_type": "savings",
+        }
+        for user, account_number in zip(user_docs, account_numbers)
+    ]
+    await _insert_batches(models.Account, account_docs)
+
+    card_numbers = await number_issuer.card_numbers.take(users)
+    await _insert_batches(models.Card, (
+        {
+            "user_id": str(user["_id"]),
+            "card_number": card_number,
+            "expiry_date": "12/30",
+            "cvv": "123",
+            "card_type": "debit",
+            "card_name": "",
+            "pin_hash": pin_hash,
+            "status": "active",
+            "created_at": datetime.utcnow(),
+        }
+        for user, card_number in zip(user_docs, card_numbers)
+    ))
+
+    await _insert_batches(models.Loan, (
+        {
+            "user_id": str(user["_id"]),
+            "amount": float(rng.choice((50000, 100000, 250000))),
+            "loan_type": "personal",
+            "interest_rate": 10.5,
+            "tenure_months": rng.choice((12, 24, 60)),
+            "status": rng.choice(("active", "pending")),
+            "created_at": datetime.utcnow() - timedelta(days=rng.randint(0, 700)),
+        }
+        for user in user_docs
+    ))
+
+    transactions = await _insert_batches(models.Transaction, _transactions(account_docs, transactions_per_account, history_days, rng))
+
+    return {
+        "users": [
+            {"email": user["email"], "account_id": str(account["_id"]), "account_number": account["account_number"], "is_admin": user["is_admin"]}
+            for user, account in zip(user_docs, account_docs)
+        ],
+        "transactions": transactions,
+        "seed_seconds": round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,106 @@
+# Serialization Benchmark for Vitta Bank
+# Time to turn 1k raw Mongo documents into a JSON response body, comparing
+# the old list-endpoint path (Beanie hydration -> response_model validation
+# -> jsonable_encoder -> json) with the lean read-model path (projected
+# dicts -> orjson).
+#
+#   cd backend && python -m benchmarks.serialization
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import database
+import models
+import schemas
+from utils.read_models import FastJSONResponse, ReadModel
+
+DOCS = 1000
+ROUNDS = 20
+
+
+def sample_docs(n: int) -> dict:
+    """Raw documents as Mongo returns them, per endpoint"""
+    now = datetime.utcnow()
+    user_id = str(ObjectId())
+    return {
+        "accounts": (models.Account, schemas.Account, [
+            {"_id": ObjectId(), "user_id": user_id, "account_number": str(1000000000 + i), "balance": 1000.0 + i, "account_type": "savings"}
+            for i in range(n)
+        ]),
+        "cards": (models.Card, schemas.Card, [
+            {"_id": ObjectId(), "user_id": user_id, "card_number": str(4000000000000000 + i), "expiry_date": "12/30", "cvv": "123",
+             "card_type": "debit", "card_name": "", "pin_hash": "$2b$12$" + "x" * 53, "status": "active", "created_at": now}
+            for i in range(n)
+        ]),
+        "loans": (models.Loan, schemas.Loan, [
+            {"_id": ObjectId(), "user_id": user_id, "amount": 50000.0, "loan_type": "personal", "interest_rate": 10.5,
+             "tenure_months": 24, "status": "active", "created_at": now}
+            for i in range(n)
+        ]),
+        "investments": (models.Investment, schemas.Investment, [
+            {"_id": ObjectId(), "user_id": user_id, "investment_type": "stock", "symbol": "AAPL", "quantity": 1.5 + i,
+             "purchase_price": 180.0, "current_value": 185.0}
+            for i in range(n)
+        ]),
+        "policies": (models.Insurance, schemas.Insurance, [
+            {"_id": ObjectId(), "user_id": user_id, "policy_name": "Health Plus", "policy_type": "health", "premium": 500.0, "coverage": 500000.0}
+            for i in range(n)
+        ]),
+    }
+
+
+def old_path(document_model, schema, adapter, docs: list) -> bytes:
+    hydrated = [document_model.model_validate(doc) for doc in docs]
+    validated = adapter.validate_python(hydrated, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def new_path(read_model: ReadModel, docs: list) -> bytes:
+    rows = [read_model.row(dict(doc)) for doc in docs]
+    return FastJSONResponse(rows).body
+
+
+def best_of(fn, rounds: int = ROUNDS) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(n: int = DOCS) -> list:
+    results = []
+    for name, (document_model, schema, docs) in sample_docs(n).items():
+        adapter = TypeAdapter(list[schema])
+        read_model = ReadModel(schema)
+        before = best_of(lambda: old_path(document_model, schema, adapter, docs))
+        after = best_of(lambda: new_path(read_model, docs))
+        results.append({
+            "endpoint": name,
+            "before_ms_per_1k": round(before * 1000 * 1000 / n, 2),
+            "after_ms_per_1k": round(after * 1000 * 1000 / n, 2),
+            "speedup": round(before / after, 1),
+        })
+    return results
+
+
+def print_table(results: list):
+    print(f"{'endpoint':<12} {'before ms/1k':>13} {'after ms/1k':>12} {'speedup':>8}")
+    for r in results:
+        print(f"{r['endpoint']:<12} {r['before_ms_per_1k']:>13} {r['after_ms_per_1k']:>12} {r['speedup']:>7}x")
+
+
+async def main():
+    # Beanie documents can only be hydrated once init_beanie has run
+    await database.init_db()
+    print_table(run())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+# In-process Mongo stand-in for Vitta Bank benchmarks
+# Swaps database.init_db for a mongomock-motor backed version so the app can
+# be load-tested without a cluster. mongomock lags the real server in a few
+# places; the shims below cover what the app relies on. Numbers measured on
+# the stand-in are for spotting regressions in our own code, not for sizing
+# production - use a real local mongod (--mongo-url) for that.
+import os
+
+from beanie import init_beanie
+
+import database
+
+
+def _patch_mongomock():
+    import mongomock.collection
+    import mongomock.database
+
+    # Beanie passes authorizedCollections/nameOnly; mongomock rejects extra kwargs
+    list_names = mongomock.database.Database.list_collection_names
+    mongomock.database.Database.list_collection_names = (
+        lambda self, filter=None, session=None, **kwargs: list_names(self, filter, session)
+    )
+
+    # pymongo 4.x bulk operations forward sort/namespace, which mongomock predates
+    def drop_new_kwargs(method):
+        def wrapper(self, *args, sort=None, namespace=None, **kwargs):
+            return method(self, *args, **kwargs)
+        return wrapper
+
+    for name in ("add_update", "add_replace", "add_delete"):
+        builder = mongomock.collection.BulkOperationBuilder
+        setattr(builder, name, drop_new_kwargs(getattr(builder, name)))
+
+
+async def init_mock_db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    database.client = AsyncMongoMockClient()
+    database.db = database.client[os.getenv("DB_NAME", "vitta_bank_bench")]
+    await init_beanie(database=database.db, document_models=database.DOCUMENT_MODELS)
+
+    # mongomock ignores partialFilterExpression, so partial unique indexes
+    # (e.g. Transaction.reference) would reject every null; drop them
+    for document_model in database.DOCUMENT_MODELS:
+        for index in getattr(getattr(document_model, "Settings", None), "indexes", []):
+            spec = getattr(index, "document", {})
+            if spec.get("partialFilterExpression"):
+                await database.collection(document_model).drop_index(spec["name"])
+
+
+def use_mock_mongo():
+    _patch_mongomock()
+    database.init_db = init_mock_db
+
+
+def disable_email():
+    # email_service skips sending when credentials are empty; set before import
+    os.environ["SMTP_USER"] = ""
+    os.environ["SMTP_PASSWORD"] = ""
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 import os
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -17,4 +18,26 @@ celery_app.conf.update(
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
+    beat_schedule={
+        "process-fd-maturities": {
+            "task": "tasks.process_fd_maturities",
+            "schedule": crontab(hour=0, minute=30),
+        },
+        "archive-transactions": {
+            "task": "tasks.archive_transactions",
+            "schedule": crontab(hour=2, minute=0),
+        },
+        "month-end-statements": {
+            "task": "tasks.run_month_end_statements",
+            "schedule": crontab(day_of_month=1, hour=1, minute=0),
+        },
+        "retry-loan-disbursements": {
+            "task": "tasks.retry_loan_disbursements",
+            "schedule": crontab(minute="*/10"),
+        },
+        "resume-shard-sweeps": {
+            "task": "tasks.resume_shard_sweeps",
+            "schedule": crontab(minute="*/10"),
+        },
+    },
 )
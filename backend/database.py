@@ -4,7 +4,40 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 import models
 
+DOCUMENT_MODELS = [
+    models.User,
+    models.Account,
+    models.Transaction,
+    models.Card,
+    models.FixedDeposit,
+    models.Loan,
+    models.Insurance,
+    models.Investment,
+    models.DeletionRequest,
+    models.RefreshToken,
+    models.NotificationEvent,
+    models.Beneficiary,
+    models.StatementEmail
+]
+
+# Set by init_db so batch jobs can use raw collections, bulk writes and sessions
+client = None
+db = None
+
+def collection(document_model):
+    """Raw Motor collection backing a Beanie document class"""
+    return db[document_model.get_settings().name]
+
+async def supports_transactions() -> bool:
+    """Multi-document transactions need a replica set or mongos (e.g. Atlas)"""
+    try:
+        hello = await db.command("hello")
+    except Exception:
+        return False
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
 async def init_db():
+    global client, db
     # Use local MongoDB by default, set MONGO_URL env var for Atlas
     MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     DB_NAME = os.getenv("DB_NAME", "vitta_bank")
@@ -15,20 +48,7 @@ async def init_db():
         serverSelectionTimeoutMS=10000,
         tlsCAFile=certifi.where()
     )
-    database = client[DB_NAME]
+    db = client[DB_NAME]
     
     # Initialize Beanie with the Document classes
-    await init_beanie(
-        database=database,
-        document_models=[
-            models.User,
-            models.Account,
-            models.Transaction,
-            models.Card,
-            models.FixedDeposit,
-            models.Loan,
-            models.Insurance,
-            models.Investment,
-            models.DeletionRequest
-        ]
-    )
+    await init_beanie(database=db, document_models=DOCUMENT_MODELS)
@@ -1,9 +1,14 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, accounts, cards, investments, loans, insurance
+from routers import auth, accounts, cards, investments, loans, insurance, catalog, credit_score
 import models, database
+import auth as auth_utils
+from utils import change_feed, notification_digest, statement_renderer, transfer_limits
+from utils import catalog as product_catalog
+from utils.rate_limit import AdmissionControl
 from websocket_manager import manager
 from prometheus_fastapi_instrumentator import Instrumentator
+import asyncio
 import logging
 from logstash_async.handler import AsynchronousLogstashHandler
 from dotenv import load_dotenv
@@ -38,6 +43,21 @@ Instrumentator().instrument(app).expose(app)
 @app.on_event("startup")
 async def on_startup():
     await database.init_db()
+    await product_catalog.start()
+    await change_feed.start()
+    await notification_digest.start()
+    await statement_renderer.start()
+    transfer_limits.warn_if_per_worker()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await product_catalog.stop()
+    await change_feed.stop()
+    await notification_digest.stop()
+    statement_renderer.shutdown()
+
+# Added before CORS so 429s still carry CORS headers
+app.add_middleware(AdmissionControl)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +87,35 @@ app.include_router(cards.router)
 app.include_router(investments.router)
 app.include_router(loans.router)
 app.include_router(insurance.router)
+app.include_router(catalog.router)
+app.include_router(credit_score.router)
+
+# Seconds a new event socket has to send its auth message
+WS_AUTH_TIMEOUT = 10
+
+@app.websocket("/ws/events")
+async def user_events(websocket: WebSocket):
+    # Per-user change events. Browsers cannot set headers, and a query-string
+    # token ends up in access logs, so the JWT is the first message:
+    # {"type": "auth", "token": "..."}
+    await websocket.accept()
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+        if not isinstance(message, dict) or message.get("type") != "auth":
+            raise ValueError("Expected an auth message")
+        user = await auth_utils.get_current_user(message.get("token"))
+    except WebSocketDisconnect:
+        return
+    except Exception:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    user_id = str(user.id)
+    await manager.connect(websocket, user_id, accepted=True)
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        manager.disconnect(websocket, user_id)
 
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: int):
@@ -1,5 +1,6 @@
 from typing import Optional, List
-from beanie import Document, Indexed, Link
+from beanie import Document, Indexed, Link, Insert, after_event
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
 from pydantic import BaseModel, Field
 from datetime import datetime
 from enum import Enum
@@ -29,6 +30,9 @@ class Account(Document):
     account_number: Indexed(str, unique=True)
     balance: float = 0.0
     account_type: str = AccountType.SAVINGS
+    balance_shards: Optional[int] = None  # Credit sub-balances for hot accounts (utils/balance_shards.py)
+    pending_refs: List[str] = Field(default_factory=list)  # Ledger references applied but not yet recorded (utils/ledger.py)
+    pending_sweeps: List[dict] = Field(default_factory=list)  # Shard sweeps recorded but not yet applied (utils/balance_shards.py)
     
     class Settings:
         name = "accounts"
@@ -40,9 +44,30 @@ class Transaction(Document):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     description: str
     related_account_id: Optional[str] = None
+    reference: Optional[str] = None  # Idempotency key for batch-generated entries
     
     class Settings:
         name = "transactions"
+        indexes = [
+            # Newest-first history per account; (timestamp, _id) is the keyset cursor
+            IndexModel([("account_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+            IndexModel([("account_id", ASCENDING), ("related_account_id", ASCENDING), ("timestamp", DESCENDING)]),
+            # Text index prefixed by account_id, so every search is scoped to one account's keys
+            IndexModel([("account_id", ASCENDING), ("description", TEXT)], name="account_description_text"),
+            # Archival walks and deletes whole months across all accounts (utils/transaction_archive.py)
+            IndexModel([("timestamp", ASCENDING)]),
+            IndexModel(
+                [("reference", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"reference": {"$type": "string"}},
+            ),
+        ]
+
+    @after_event(Insert)
+    async def publish_ledger_event(self):
+        # Keep rollups and credit-score features current (see utils/ledger_events.py)
+        from utils.ledger_events import transactions_written
+        await transactions_written([self])
 
 class Card(Document):
     user_id: str
@@ -54,6 +79,7 @@ class Card(Document):
     pin_hash: str
     status: str = "pending"
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    status_batch: Optional[str] = None  # Set by bulk transitions to claim cards
     
     class Settings:
         name = "cards"
@@ -64,17 +90,30 @@ class FixedDeposit(Document):
     interest_rate: float
     start_date: datetime = Field(default_factory=datetime.utcnow)
     maturity_date: datetime
+    status: str = "active"  # active, matured
+    payout_amount: Optional[float] = None
+    matured_at: Optional[datetime] = None
+    settle_batch: Optional[str] = None  # Set when a maturity run claims the FD
+    claimed_at: Optional[datetime] = None
     
     class Settings:
         name = "fixed_deposits"
+        indexes = [
+            IndexModel([("status", ASCENDING), ("maturity_date", ASCENDING)]),
+        ]
 
 class Loan(Document):
     user_id: str
     amount: float
     loan_type: str
     interest_rate: float
-    status: str = "pending"
+    tenure_months: int = 12
+    status: Indexed(str) = "pending"
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    disbursed_at: Optional[datetime] = None
+    approval_batch: Optional[str] = None  # Set by bulk approve/reject to claim loans
+    disbursement_pending: bool = False  # Approved but not yet credited (utils/loan_disbursement.py)
+    disbursement_error: Optional[str] = None  # Why a loan was left uncredited for an admin to resolve
     
     class Settings:
         name = "loans"
@@ -100,6 +139,70 @@ class Investment(Document):
     class Settings:
         name = "investments"
 
+class RefreshToken(Document):
+    token_hash: Indexed(str, unique=True)  # sha256 of the token; the token itself is never stored
+    user_id: Indexed(str)
+    family_id: Indexed(str)  # Every token rotated from one login shares a family
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+    revoked_at: Optional[datetime] = None
+    
+    class Settings:
+        name = "refresh_tokens"
+        indexes = [
+            # Mongo's TTL monitor deletes tokens once they expire
+            IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+        ]
+
+class NotificationEvent(Document):
+    to_email: str
+    user_name: str
+    kind: str  # debit, credit
+    amount: float
+    counterparty: str  # Other side's account number
+    balance: float  # Balance right after this event
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    digest_batch: Optional[str] = None  # Set when a flush claims the event
+    claimed_at: Optional[datetime] = None
+    
+    class Settings:
+        name = "notification_events"
+        indexes = [
+            # Flushes claim unbatched events, then read their batch grouped by recipient
+            IndexModel([("digest_batch", ASCENDING), ("to_email", ASCENDING), ("created_at", ASCENDING)]),
+        ]
+
+class StatementEmail(Document):
+    id: str  # utils/statement_cache key of the statement
+    user_id: Indexed(str)
+    seen_at: datetime  # Last download of the statement
+    emailed_at: Optional[datetime] = None  # Set while an email is claimed or sent
+    
+    class Settings:
+        name = "statement_emails"
+        indexes = [
+            # Claims of statements nobody has downloaded for 30 days expire (STATEMENT_CACHE_MAX_AGE)
+            IndexModel([("seen_at", ASCENDING)], expireAfterSeconds=30 * 86400),
+        ]
+
+class Beneficiary(Document):
+    user_id: str  # Who saved the payee
+    account_id: str
+    account_number: str
+    payee_user_id: str
+    payee_name: str
+    payee_email: str
+    nickname: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    
+    class Settings:
+        name = "beneficiaries"
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("account_number", ASCENDING)], unique=True),
+            # Account deletion drops every payee entry pointing at the account
+            IndexModel([("account_id", ASCENDING)]),
+        ]
+
 class DeletionRequest(Document):
     user_id: str
     user_email: str
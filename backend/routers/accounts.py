@@ -1,162 +1,293 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 
 import models, schemas, auth
 from datetime import datetime, timedelta
 from typing import List, Optional
 from websocket_manager import manager
 from beanie import PydanticObjectId
+from utils.read_models import ReadModel, FastJSONResponse, fetch_rows, list_response
+from utils import ledger, balance_shards, beneficiaries
 
 router = APIRouter(
     prefix="/accounts",
     tags=["accounts"],
 )
 
+account_rows = ReadModel(schemas.Account)
+transaction_rows = ReadModel(schemas.Transaction)
+beneficiary_rows = ReadModel(schemas.Beneficiary)
+
 @router.get("/", response_model=List[schemas.Account])
 async def get_accounts(current_user: models.User = Depends(auth.get_current_user)):
     # Find accounts where user_id matches current_user.id
-    accounts = await models.Account.find(models.Account.user_id == str(current_user.id)).to_list()
-    return accounts
+    rows = await fetch_rows(models.Account, account_rows, {"user_id": str(current_user.id)})
+    return FastJSONResponse(await balance_shards.with_shards(rows))
 
 @router.get("/{account_id}/transactions", response_model=List[schemas.Transaction])
 async def get_transactions(account_id: str, limit: int = 10, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: models.User = Depends(auth.get_current_user)):
+    from utils import transaction_archive
+    
     # Verify account ownership
     account = await models.Account.find_one(models.Account.id == PydanticObjectId(account_id), models.Account.user_id == str(current_user.id))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
-    query = models.Transaction.find(models.Transaction.account_id == account_id)
+    # Recent pages touch only the hot tier; older ranges are routed to the archives
+    rows = transaction_archive.find(account_id, start_date, end_date, projection=transaction_rows.projection, limit=limit)
+    return FastJSONResponse([transaction_rows.row(doc) async for doc in rows])
+
+@router.get("/{account_id}/transactions/search", response_model=schemas.TransactionPage)
+async def search_transactions(account_id: str, q: str, limit: int = 20, cursor: Optional[str] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: models.User = Depends(auth.get_current_user)):
+    from utils import transaction_search
+    
+    if len(q.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Search query must be at least 2 characters")
+    if limit < 1 or limit > transaction_search.SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {transaction_search.SEARCH_MAX_LIMIT}")
     
-    if start_date:
-        query = query.find(models.Transaction.timestamp >= start_date)
-    if end_date:
-        query = query.find(models.Transaction.timestamp <= end_date)
-        
-    return await query.sort("-timestamp").limit(limit).to_list()
+    # Verify account ownership (admins may search any account for support)
+    if not PydanticObjectId.is_valid(account_id):
+        raise HTTPException(status_code=404, detail="Account not found")
+    if current_user.is_admin:
+        account = await models.Account.get(account_id)
+    else:
+        account = await models.Account.find_one(models.Account.id == PydanticObjectId(account_id), models.Account.user_id == str(current_user.id))
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    try:
+        return await transaction_search.search_transactions(account_id, q, start_date, end_date, cursor, limit)
+    except transaction_search.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{account_id}/transactions/export")
+async def export_transactions(account_id: str, file_format: str = "csv", compress: bool = False, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: models.User = Depends(auth.get_current_user)):
+    from utils.transaction_export import EXPORT_FORMATS, export_stream
+    
+    if file_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="file_format must be csv or ndjson")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+    
+    # Verify account ownership
+    account = await models.Account.find_one(models.Account.id == PydanticObjectId(account_id), models.Account.user_id == str(current_user.id))
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    filename = f"Vitta_Bank_{account.account_number}_transactions.{file_format}"
+    media_type = EXPORT_FORMATS[file_format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        export_stream(account_id, file_format, start_date, end_date, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# Largest window each analytics granularity will answer
+ANALYTICS_MAX_PERIODS = {"month": 120, "day": 366}
+
+@router.get("/{account_id}/analytics")
+async def get_spending_analytics(account_id: str, granularity: str = "month", periods: int = 24, current_user: models.User = Depends(auth.get_current_user)):
+    from utils.analytics import spending_by_period
+    
+    if granularity not in ANALYTICS_MAX_PERIODS:
+        raise HTTPException(status_code=400, detail="granularity must be month or day")
+    if periods < 1 or periods > ANALYTICS_MAX_PERIODS[granularity]:
+        raise HTTPException(status_code=400, detail=f"periods must be between 1 and {ANALYTICS_MAX_PERIODS[granularity]}")
+    
+    # Verify account ownership
+    account = await models.Account.find_one(models.Account.id == PydanticObjectId(account_id), models.Account.user_id == str(current_user.id))
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    return {
+        "account_id": account_id,
+        "granularity": granularity,
+        "periods": await spending_by_period(account_id, granularity, periods)
+    }
+
+@router.post("/admin/analytics/backfill")
+async def backfill_spending_analytics(background_tasks: BackgroundTasks, account_id: Optional[str] = None, current_user: models.User = Depends(auth.get_current_user)):
+    from utils.analytics import backfill_rollups
+    
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    background_tasks.add_task(backfill_rollups, account_id)
+    return {"message": "Spending rollup backfill started"}
+
+@router.put("/admin/{account_id}/balance-shards")
+async def configure_balance_shards(account_id: str, config: schemas.BalanceShardConfig, current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if config.shards < 0 or config.shards > balance_shards.MAX_SHARDS:
+        raise HTTPException(status_code=400, detail=f"shards must be between 0 and {balance_shards.MAX_SHARDS}")
+    
+    account = await models.Account.get(account_id)
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    await balance_shards.configure(account_id, config.shards)
+    return {"account_id": account_id, "shards": config.shards}
+
+@router.get("/beneficiaries", response_model=List[schemas.Beneficiary])
+async def get_beneficiaries(current_user: models.User = Depends(auth.get_current_user)):
+    return await list_response(models.Beneficiary, beneficiary_rows, {"user_id": str(current_user.id)}, sort=[("created_at", 1)])
+
+@router.post("/beneficiaries", response_model=schemas.Beneficiary)
+async def add_beneficiary(beneficiary: schemas.BeneficiaryCreate, current_user: models.User = Depends(auth.get_current_user)):
+    try:
+        return await beneficiaries.save(str(current_user.id), beneficiary.account_number, beneficiary.nickname)
+    except beneficiaries.PayeeNotFound:
+        raise HTTPException(status_code=404, detail="Account not found")
+    except beneficiaries.BeneficiaryExists:
+        raise HTTPException(status_code=400, detail="Beneficiary already saved")
+    except beneficiaries.BeneficiaryLimit:
+        raise HTTPException(status_code=400, detail=f"You can save at most {beneficiaries.MAX_BENEFICIARIES} beneficiaries")
+
+@router.delete("/beneficiaries/{beneficiary_id}")
+async def delete_beneficiary(beneficiary_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    if not PydanticObjectId.is_valid(beneficiary_id) or not await beneficiaries.remove(str(current_user.id), beneficiary_id):
+        raise HTTPException(status_code=404, detail="Beneficiary not found")
+    return {"message": "Beneficiary removed"}
 
 @router.post("/transfer")
 async def transfer_money(transfer: schemas.TransferRequest, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
-    from utils.email_service import send_transfer_email, send_credit_email
+    from utils import notification_digest, transfer_limits
     
     # Verify transaction PIN
     if not current_user.pin_hash:
         raise HTTPException(status_code=400, detail="Transaction PIN not set. Please set your PIN first.")
     if not auth.verify_password(transfer.pin, current_user.pin_hash):
         raise HTTPException(status_code=401, detail="Incorrect transaction PIN")
+    if not 0 < transfer.amount < float("inf"):
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
     # Find sender account
+    if not PydanticObjectId.is_valid(transfer.from_account_id):
+        raise HTTPException(status_code=404, detail="Sender account not found")
     sender_account = await models.Account.find_one(models.Account.id == PydanticObjectId(transfer.from_account_id), models.Account.user_id == str(current_user.id))
     if not sender_account:
         raise HTTPException(status_code=404, detail="Sender account not found")
         
-    if sender_account.balance < transfer.amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-        
-    # Find receiver by account number
-    receiver_account = await models.Account.find_one(models.Account.account_number == transfer.to_account_number)
-    if not receiver_account:
-        raise HTTPException(status_code=404, detail="Receiver account not found")
+    # Saved payees come from the beneficiary cache; anyone else is looked up
+    user_id = str(current_user.id)
+    payee = await beneficiaries.resolve(user_id, transfer.to_account_number)
+    if payee is None:
+        receiver_account = await models.Account.find_one(models.Account.account_number == transfer.to_account_number)
+        if not receiver_account:
+            raise HTTPException(status_code=404, detail="Receiver account not found")
+        receiver_user = await models.User.get(receiver_account.user_id)
+        payee = beneficiaries.payee(
+            str(receiver_account.id),
+            receiver_account.account_number,
+            receiver_account.user_id,
+            receiver_user.full_name if receiver_user else None,
+            receiver_user.email if receiver_user else None
+        )
     
-    if str(sender_account.id) == str(receiver_account.id):
+    if str(sender_account.id) == payee["account_id"]:
         raise HTTPException(status_code=400, detail="Cannot transfer to same account")
 
-    # Perform transfer (Sequential updates for simplicity)
-    sender_account.balance -= transfer.amount
-    receiver_account.balance += transfer.amount
-    
-    await sender_account.save()
-    await receiver_account.save()
-    
-    # Create transactions
-    sender_txn = models.Transaction(
-        account_id=str(sender_account.id),
-        amount=-transfer.amount,
-        transaction_type="transfer",
-        description=f"Transfer to {receiver_account.account_number}",
-        related_account_id=str(receiver_account.id)
-    )
-    receiver_txn = models.Transaction(
-        account_id=str(receiver_account.id),
-        amount=transfer.amount,
-        transaction_type="transfer",
-        description=f"Transfer from {sender_account.account_number}",
-        related_account_id=str(sender_account.id)
-    )
-    
-    await sender_txn.create()
-    await receiver_txn.create()
-    
-    # Broadcast update
-    background_tasks.add_task(manager.broadcast, "update")
+    # Velocity limits are counted in Redis (or per worker), never in Mongo
+    try:
+        receipt = await transfer_limits.check_transfer(str(sender_account.id), sender_account.account_type, transfer.amount)
+    except transfer_limits.TransferLimitExceeded as e:
+        if e.retry_after is None:
+            raise HTTPException(status_code=400, detail=e.detail)
+        raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(max(1, e.retry_after))})
+
+    # Debit, credit and both ledger rows in one atomic move
+    try:
+        sender, receiver = await ledger.move(
+            ledger.by_id(sender_account.id, user_id),
+            ledger.by_id(payee["account_id"]),
+            transfer.amount,
+            f"Transfer to {payee['account_number']}",
+            f"Transfer from {sender_account.account_number}"
+        )
+    except ledger.InsufficientFunds:
+        await transfer_limits.give_back(receipt)
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    except ValueError:
+        await transfer_limits.give_back(receipt)
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    except ledger.AccountNotFound:
+        await transfer_limits.give_back(receipt)
+        # A payee cached by another worker may outlive its account; refresh it for next time
+        await beneficiaries.invalidate([user_id])
+        raise HTTPException(status_code=404, detail="Receiver account not found")
+    except Exception:
+        # Any other failure (e.g. Mongo trouble) must not count against the limits either
+        await transfer_limits.give_back(receipt)
+        raise
     
-    # Send email notifications
-    # Get receiver user for their email
-    receiver_user = await models.User.get(receiver_account.user_id)
+    # Broadcast update (the change feed pushes per-user events when it is running)
+    from utils import change_feed
+    if not change_feed.running():
+        background_tasks.add_task(manager.broadcast, "update")
     
-    # Email to sender (debit notification)
-    background_tasks.add_task(
-        send_transfer_email,
+    # Email notifications are buffered and sent as per-recipient digests
+    events = [notification_digest.debit_event(
         current_user.email,
         current_user.full_name,
         transfer.amount,
-        receiver_account.account_number,
-        sender_account.balance
-    )
-    
-    # Email to receiver (credit notification)
-    if receiver_user:
-        background_tasks.add_task(
-            send_credit_email,
-            receiver_user.email,
-            receiver_user.full_name,
+        payee["account_number"],
+        sender["balance"]
+    )]
+    if payee["email"]:
+        events.append(notification_digest.credit_event(
+            payee["email"],
+            payee["name"],
             transfer.amount,
             sender_account.account_number,
-            receiver_account.balance
-        )
+            receiver["balance"]
+        ))
+    await notification_digest.queue(events)
 
     return {"message": "Transfer successful"}
 
 @router.post("/fixed-deposit")
 async def create_fixed_deposit(fd: schemas.FixedDepositCreate, current_user: models.User = Depends(auth.get_current_user)):
+    from utils import credit_score
+
     # Verify transaction PIN
     if not current_user.pin_hash:
         raise HTTPException(status_code=400, detail="Transaction PIN not set. Please set your PIN first.")
     if not auth.verify_password(fd.pin, current_user.pin_hash):
         raise HTTPException(status_code=401, detail="Incorrect transaction PIN")
     
-    account = await models.Account.find_one(models.Account.id == PydanticObjectId(fd.account_id), models.Account.user_id == str(current_user.id))
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-        
     if fd.amount < 500:
         raise HTTPException(status_code=400, detail="Minimum FD amount is 500")
-        
-    if account.balance < fd.amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
+    if not PydanticObjectId.is_valid(fd.account_id):
+        raise HTTPException(status_code=404, detail="Account not found")
         
     # Deduct from account
-    account.balance -= fd.amount
-    await account.save()
+    try:
+        account = await ledger.debit(ledger.by_id(fd.account_id, str(current_user.id)), fd.amount, "Fixed Deposit Creation")
+    except ledger.AccountNotFound:
+        raise HTTPException(status_code=404, detail="Account not found")
+    except ledger.InsufficientFunds:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
     # Create FD
     maturity_date = datetime.utcnow() + timedelta(days=365)
     
     new_fd = models.FixedDeposit(
-        account_id=str(account.id),
+        account_id=str(account["_id"]),
         amount=fd.amount,
         interest_rate=5.5,
         maturity_date=maturity_date
     )
     await new_fd.create()
-    
-    # Transaction record
-    txn = models.Transaction(
-        account_id=str(account.id),
-        amount=-fd.amount,
-        transaction_type="withdrawal",
-        description="Fixed Deposit Creation"
-    )
-    await txn.create()
+    await credit_score.apply(str(current_user.id), fd_total=fd.amount)
     
     return {"message": "Fixed Deposit created successfully"}
 
@@ -168,7 +299,7 @@ async def download_statement(
     end_date: Optional[datetime] = None, 
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    from utils.pdf_generator import generate_statement_pdf
+    from utils import statement_cache, statement_renderer, transaction_archive
     
     # Verify account ownership
     account = await models.Account.find_one(
@@ -183,64 +314,67 @@ async def download_statement(
         end_date = datetime.utcnow()
     if not start_date:
         start_date = end_date - timedelta(days=30)
+    start_label = start_date.strftime('%d %b %Y')
+    end_label = end_date.strftime('%d %b %Y')
+    filename = f"Vitta_Bank_Statement_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
     
-    # Get transactions for the period
-    transactions = await models.Transaction.find(
-        models.Transaction.account_id == account_id,
-        models.Transaction.timestamp >= start_date,
-        models.Transaction.timestamp <= end_date
-    ).sort("-timestamp").to_list()
-    
-    # Calculate opening and closing balance
     # For simplicity, we'll use current balance as closing
-    closing_balance = account.balance
-    
-    # Calculate net change from transactions in period
-    net_change = sum(txn.amount for txn in transactions)
-    opening_balance = closing_balance - net_change
-    
-    # Convert transactions to dict format
-    txn_list = [
-        {
-            'timestamp': txn.timestamp,
-            'description': txn.description,
-            'transaction_type': txn.transaction_type,
-            'amount': txn.amount
-        } 
-        for txn in transactions
-    ]
-    
-    # Generate PDF
-    pdf_buffer = generate_statement_pdf(
-        account_holder=current_user.full_name,
-        account_number=account.account_number,
-        opening_balance=opening_balance,
-        closing_balance=closing_balance,
-        transactions=txn_list,
-        start_date=start_date.strftime('%d %b %Y'),
-        end_date=end_date.strftime('%d %b %Y')
-    )
+    closing_balance = await balance_shards.visible_balance(account_id, account.balance)
     
-    filename = f"Vitta_Bank_Statement_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.pdf"
+    # Identical statements are served from the cache without querying or rendering
+    fingerprint = await statement_cache.period_fingerprint(account_id, start_date, end_date)
+    cache_key = statement_cache.statement_key(account_id, start_label, end_label, fingerprint, current_user.full_name, closing_balance)
+    pdf_bytes = await statement_cache.lookup(cache_key)
     
-    # Get PDF bytes for email
-    pdf_bytes = pdf_buffer.getvalue()
-    pdf_buffer.seek(0)  # Reset buffer for response
+    if pdf_bytes is None:
+        # Get transactions for the period, from whichever tiers hold it
+        txn_list = [
+            txn async for txn in transaction_archive.find(
+                account_id,
+                start_date,
+                end_date,
+                projection={'_id': 0, 'timestamp': 1, 'description': 1, 'transaction_type': 1, 'amount': 1}
+            )
+        ]
+        
+        # Calculate net change from transactions in period
+        net_change = sum(txn['amount'] for txn in txn_list)
+        opening_balance = closing_balance - net_change
+        
+        # Render the PDF in the worker pool
+        pdf_bytes = await statement_renderer.render(
+            account_holder=current_user.full_name,
+            account_number=account.account_number,
+            opening_balance=opening_balance,
+            closing_balance=closing_balance,
+            transactions=txn_list,
+            start_date=start_label,
+            end_date=end_label
+        )
+        await statement_cache.store(cache_key, pdf_bytes)
     
-    # Send email with PDF in background
-    from utils.email_service import send_statement_email
-    background_tasks.add_task(
-        send_statement_email,
-        current_user.email,
-        current_user.full_name,
-        start_date.strftime('%d %b %Y'),
-        end_date.strftime('%d %b %Y'),
-        pdf_bytes,
-        filename
-    )
+    # Email each distinct statement once, however often it is downloaded
+    if await statement_cache.claim_email(cache_key, str(current_user.id)):
+        background_tasks.add_task(
+            email_statement,
+            cache_key,
+            current_user.email,
+            current_user.full_name,
+            start_label,
+            end_label,
+            pdf_bytes,
+            filename
+        )
     
-    return StreamingResponse(
-        pdf_buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    return Response(pdf_bytes, media_type="application/pdf", headers=headers)
+
+
+async def email_statement(cache_key: str, to_email: str, user_name: str, start_label: str, end_label: str, pdf_bytes: bytes, filename: str):
+    from utils import statement_cache
+    from utils.email_service import send_statement_email
+
+    sent = await asyncio.to_thread(send_statement_email, to_email, user_name, start_label, end_label, pdf_bytes, filename)
+    if not sent:
+        # Leave the statement unclaimed so the next download tries again
+        await statement_cache.release_email(cache_key)
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File
 import models, schemas, auth
-from typing import List
+from typing import List, Optional
 from datetime import timedelta
 import random
+from pymongo.errors import DuplicateKeyError
+from utils import number_issuer, credit_score, statement_cache, transaction_archive, balance_shards, beneficiaries
+
+ISSUE_ATTEMPTS = 3
 
 router = APIRouter(
     prefix="/auth",
@@ -25,12 +29,38 @@ async def get_stats(current_user: models.User = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     total_users = await models.User.find_all().count()
-    total_transactions = await models.Transaction.find_all().count()
+    from utils import transaction_archive
+    total_transactions = await transaction_archive.count_all()
     return {
         "total_users": total_users,
         "total_transactions": total_transactions
     }
 
+async def create_account(user_id: str, balance: float, account_type: str) -> models.Account:
+    # Issued numbers never collide with each other; the retry only covers
+    # numbers generated randomly before the issuer existed
+    for attempt in range(ISSUE_ATTEMPTS):
+        new_account = models.Account(
+            user_id=user_id,
+            account_number=await number_issuer.account_numbers.next(),
+            balance=balance,
+            account_type=account_type
+        )
+        try:
+            await new_account.create()
+            return new_account
+        except DuplicateKeyError:
+            if attempt == ISSUE_ATTEMPTS - 1:
+                raise
+
+async def token_response(user: models.User, refresh_token: str = None) -> dict:
+    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = auth.create_access_token(
+        data={"sub": user.email}, expires_delta=access_token_expires
+    )
+    refresh_token = refresh_token or await auth.issue_refresh_token(str(user.id))
+    return {"access_token": access_token, "token_type": "bearer", "user_name": user.full_name, "is_admin": user.is_admin, "refresh_token": refresh_token}
+
 @router.post("/register", response_model=schemas.Token)
 async def register(user: schemas.UserCreate, background_tasks: BackgroundTasks):
     from utils.email_service import send_welcome_email
@@ -48,14 +78,8 @@ async def register(user: schemas.UserCreate, background_tasks: BackgroundTasks):
     await new_user.create()
 
     # Create initial account
-    account_number = str(random.randint(1000000000, 9999999999))
-    new_account = models.Account(
-        user_id=str(new_user.id), 
-        account_number=account_number, 
-        balance=user.opening_balance,
-        account_type=user.account_type
-    )
-    await new_account.create()
+    new_account = await create_account(str(new_user.id), user.opening_balance, user.account_type)
+    account_number = new_account.account_number
     
     # Add initial transaction
     transaction = models.Transaction(
@@ -69,11 +93,38 @@ async def register(user: schemas.UserCreate, background_tasks: BackgroundTasks):
     # Send welcome email
     background_tasks.add_task(send_welcome_email, new_user.email, new_user.full_name, account_number, user.opening_balance)
     
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": new_user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer", "user_name": new_user.full_name, "is_admin": new_user.is_admin}
+    return await token_response(new_user)
+
+@router.post("/admin/import")
+async def import_customers(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    file_format: Optional[str] = None,
+    welcome_emails: str = "none",
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    from utils.customer_import import import_customers as run_import
+    from utils.email_service import send_bulk_emails
+    
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized - Admin only")
+    
+    # Infer format from the file name unless given explicitly
+    if not file_format:
+        name = (file.filename or "").lower()
+        file_format = "csv" if name.endswith(".csv") else "ndjson"
+    if file_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="file_format must be csv or ndjson")
+    if welcome_emails not in ("none", "batch"):
+        raise HTTPException(status_code=400, detail="welcome_emails must be none or batch")
+    
+    report = await run_import(file.file, file_format, collect_welcome=welcome_emails == "batch")
+    
+    # All welcome emails go out over one SMTP session after the import
+    if report.welcome_emails:
+        background_tasks.add_task(send_bulk_emails, report.welcome_emails)
+    
+    return report.as_dict()
 
 @router.post("/login", response_model=schemas.Token)
 async def login(user: schemas.UserLogin):
@@ -84,11 +135,20 @@ async def login(user: schemas.UserLogin):
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": db_user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer", "user_name": db_user.full_name, "is_admin": db_user.is_admin}
+    return await token_response(db_user)
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(request: schemas.RefreshRequest):
+    # Rotating refresh tokens keep sessions alive without another bcrypt verify
+    user, refresh_token = await auth.rotate_refresh_token(request.refresh_token)
+    return await token_response(user, refresh_token)
+
+@router.post("/logout")
+async def logout(request: schemas.RefreshRequest):
+    token = await models.RefreshToken.find_one(models.RefreshToken.token_hash == auth.token_digest(request.refresh_token))
+    if token:
+        await auth.revoke_refresh_tokens(family_id=token.family_id)
+    return {"message": "Logged out"}
 
 @router.post("/set-pin")
 async def set_pin(pin_data: schemas.PinSetup, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
@@ -122,6 +182,7 @@ async def change_password(password_data: schemas.PasswordChange, background_task
     
     current_user.hashed_password = auth.get_password_hash(password_data.new_password)
     await current_user.save()
+    await auth.revoke_refresh_tokens(user_id=str(current_user.id))
     
     # Send email notification
     background_tasks.add_task(send_password_change_email, current_user.email, current_user.full_name)
@@ -170,6 +231,7 @@ async def change_password_with_otp(password_data: schemas.PasswordChangeWithOTP,
     # Update password
     current_user.hashed_password = auth.get_password_hash(password_data.new_password)
     await current_user.save()
+    await auth.revoke_refresh_tokens(user_id=str(current_user.id))
     
     # Clear OTP
     del password_change_otps[current_user.email]
@@ -311,6 +373,7 @@ async def reset_password(request: schemas.ResetPassword, background_tasks: Backg
     # Update password
     user.hashed_password = auth.get_password_hash(request.new_password)
     await user.save()
+    await auth.revoke_refresh_tokens(user_id=str(user.id))
     
     # Clear OTP
     del password_reset_otps[request.email]
@@ -407,6 +470,10 @@ async def approve_deletion_request(request_id: str, current_user: models.User =
         # Delete all transactions for user's accounts
         for acc_id in account_ids:
             await models.Transaction.find(models.Transaction.account_id == acc_id).delete()
+        if account_ids:
+            await transaction_archive.delete_accounts(account_ids)
+            await balance_shards.forget_accounts(account_ids)
+            await beneficiaries.forget_accounts(account_ids)
         
         # Delete all user-related data
         await models.Account.find(models.Account.user_id == user_id).delete()
@@ -418,6 +485,10 @@ async def approve_deletion_request(request_id: str, current_user: models.User =
         
         # Delete the user
         await user_to_delete.delete()
+        await models.RefreshToken.find(models.RefreshToken.user_id == user_id).delete()
+        await credit_score.forget_user(user_id, account_ids)
+        await statement_cache.forget_user(user_id)
+        await beneficiaries.forget_user(user_id)
     
     # Delete the deletion request itself
     await deletion_request.delete()
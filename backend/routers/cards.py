@@ -1,29 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
 import models, schemas, auth
-import random
+from utils import catalog
+import secrets
+from pymongo.errors import DuplicateKeyError
+from utils import number_issuer
 from datetime import datetime, timedelta
-from beanie.operators import In
+from uuid import uuid4
+from beanie import PydanticObjectId
+from beanie.operators import In, Set
+from utils.read_models import ReadModel, list_response
 
 router = APIRouter(
     prefix="/cards",
     tags=["cards"],
 )
 
+ISSUE_ATTEMPTS = 3
+
+card_rows = ReadModel(schemas.Card)
+
 @router.get("/", response_model=list[schemas.Card])
 async def get_cards(current_user: models.User = Depends(auth.get_current_user)):
-    return await models.Card.find(models.Card.user_id == str(current_user.id)).sort(-models.Card.created_at).to_list()
+    return await list_response(models.Card, card_rows, {"user_id": str(current_user.id)}, sort=[("created_at", -1)])
 
 @router.get("/credit-card-options")
-async def get_credit_card_options():
+async def get_credit_card_options(request: Request):
     """Returns available credit card varieties"""
-    return [
-        {"id": "platinum_rewards", "name": "Platinum Rewards", "description": "Earn 3x points on travel & dining", "annual_fee": 2499, "cashback": "3%", "color": "from-slate-600 to-slate-800"},
-        {"id": "gold_cashback", "name": "Gold Cashback", "description": "5% cashback on all purchases", "annual_fee": 1499, "cashback": "5%", "color": "from-amber-600 to-amber-800"},
-        {"id": "travel_elite", "name": "Travel Elite", "description": "Airport lounge access & travel insurance", "annual_fee": 4999, "cashback": "2%", "color": "from-sky-600 to-sky-800"},
-        {"id": "student_starter", "name": "Student Starter", "description": "Zero annual fee, perfect for students", "annual_fee": 0, "cashback": "1%", "color": "from-emerald-600 to-emerald-800"},
-        {"id": "business_pro", "name": "Business Pro", "description": "High credit limit with expense tracking", "annual_fee": 3999, "cashback": "2%", "color": "from-purple-600 to-purple-800"},
-        {"id": "signature_black", "name": "Signature Black", "description": "Premium perks with concierge service", "annual_fee": 9999, "cashback": "4%", "color": "from-gray-900 to-black"}
-    ]
+    return catalog.catalog_response(request, "card_options")
 
 @router.post("/generate")
 async def generate_card(card_type: str, card_name: str = "", current_user: models.User = Depends(auth.get_current_user)):
@@ -55,22 +58,27 @@ async def generate_card(card_type: str, card_name: str = "", current_user: model
     
     try:
         # Generate card details
-        card_number = "4" + "".join([str(random.randint(0, 9)) for _ in range(15)])
-        cvv = "".join([str(random.randint(0, 9)) for _ in range(3)])
         expiry_date = (datetime.now() + timedelta(days=365*3)).strftime("%m/%y")
         
-        new_card = models.Card(
-            user_id=str(current_user.id),
-            card_number=card_number,
-            expiry_date=expiry_date,
-            cvv=cvv,
-            card_type=card_type,
-            card_name=card_name if card_type.lower() == "credit" else "Debit Card",
-            pin_hash=current_user.pin_hash,
-            status="pending" # Default to pending
-        )
-        
-        await new_card.create()
+        # Issued numbers are unique and Luhn-valid; the retry only covers
+        # numbers generated randomly before the issuer existed
+        for attempt in range(ISSUE_ATTEMPTS):
+            new_card = models.Card(
+                user_id=str(current_user.id),
+                card_number=await number_issuer.card_numbers.next(),
+                expiry_date=expiry_date,
+                cvv=f"{secrets.randbelow(1000):03d}",
+                card_type=card_type,
+                card_name=card_name if card_type.lower() == "credit" else "Debit Card",
+                pin_hash=current_user.pin_hash,
+                status="pending" # Default to pending
+            )
+            try:
+                await new_card.create()
+                break
+            except DuplicateKeyError:
+                if attempt == ISSUE_ATTEMPTS - 1:
+                    raise
         return {"message": "Card application submitted successfully", "card": new_card}
     except Exception as e:
         print(f"Error generating card: {e}")
@@ -182,3 +190,63 @@ async def revoke_card(card_id: str, background_tasks: BackgroundTasks, current_u
         )
     
     return {"message": "Card revoked"}
+
+# Bulk status transitions: target status -> statuses it may be applied to
+BULK_CARD_TRANSITIONS = {
+    "active": ["pending"],
+    "rejected": ["pending"],
+    "revoked": ["active", "pending"],
+}
+
+async def bulk_update_cards(ids: list, status: str, background_tasks: BackgroundTasks):
+    from utils.email_service import send_bulk_emails, card_status_email
+
+    # Tag the transition with a fresh batch id and read back what it claimed,
+    # so concurrent bulk calls never report or email the same card
+    batch_id = uuid4().hex
+    object_ids = [PydanticObjectId(card_id) for card_id in ids]
+    await models.Card.find(
+        In(models.Card.id, object_ids),
+        In(models.Card.status, BULK_CARD_TRANSITIONS[status])
+    ).update_many(Set({models.Card.status: status, models.Card.status_batch: batch_id}))
+    cards = await models.Card.find(In(models.Card.id, object_ids), models.Card.status_batch == batch_id).to_list()
+
+    user_ids = [PydanticObjectId(user_id) for user_id in {card.user_id for card in cards}]
+    users = {str(u.id): u for u in await models.User.find(In(models.User.id, user_ids)).to_list()}
+
+    messages = []
+    for card in cards:
+        card_user = users.get(card.user_id)
+        if card_user:
+            messages.append((
+                card_user.email,
+                *card_status_email(card_user.full_name, card.card_type, card.card_name, status, card.card_number[-4:])
+            ))
+    background_tasks.add_task(send_bulk_emails, messages)
+
+    processed = {str(card.id) for card in cards}
+    return {
+        "processed": [i for i in ids if i in processed],
+        "skipped": [i for i in ids if i not in processed],
+    }
+
+@router.post("/admin/bulk-approve")
+async def bulk_approve_cards(bulk: schemas.BulkIds, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    result = await bulk_update_cards(bulk.ids, "active", background_tasks)
+    return {"message": f"{len(result['processed'])} cards approved", **result}
+
+@router.post("/admin/bulk-reject")
+async def bulk_reject_cards(bulk: schemas.BulkIds, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    result = await bulk_update_cards(bulk.ids, "rejected", background_tasks)
+    return {"message": f"{len(result['processed'])} cards rejected", **result}
+
+@router.post("/admin/bulk-revoke")
+async def bulk_revoke_cards(bulk: schemas.BulkIds, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    result = await bulk_update_cards(bulk.ids, "revoked", background_tasks)
+    return {"message": f"{len(result['processed'])} cards revoked", **result}
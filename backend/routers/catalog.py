@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+import models, schemas, auth
+from utils import catalog
+
+router = APIRouter(
+    prefix="/catalog",
+    tags=["catalog"],
+)
+
+def catalog_info(current: catalog.Catalog):
+    return {
+        "version": current.version,
+        "loaded_at": current.loaded_at,
+        "etags": current.etags,
+        "counts": {name: len(items) for name, items in current.sections.items()},
+    }
+
+@router.get("/version")
+def get_catalog_version():
+    return catalog_info(catalog.current())
+
+@router.post("/admin/reload")
+async def reload_catalog(reload_data: schemas.CatalogReload, current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    try:
+        new_catalog = await catalog.publish(reload_data.catalog, reload_data.version)
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid catalog: {e}")
+
+    return {"message": "Catalog reloaded", **catalog_info(new_catalog)}
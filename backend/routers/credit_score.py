@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+import models, auth
+from utils import credit_score
+
+router = APIRouter(
+    prefix="/credit-score",
+    tags=["credit-score"],
+)
+
+@router.get("/")
+async def get_credit_score(current_user: models.User = Depends(auth.get_current_user)):
+    return await credit_score.get_score(str(current_user.id))
@@ -1,31 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 import models, schemas, auth
+from utils import catalog, ledger
+from utils.read_models import ReadModel, list_response
 
 router = APIRouter(
     prefix="/insurance",
     tags=["insurance"],
 )
 
-MOCK_POLICIES = [
-    {"id": 1, "name": "Life Secure Plus", "type": "life", "premium": 1000, "coverage": 1000000},
-    {"id": 2, "name": "Vehicle Protect", "type": "vehicle", "premium": 500, "coverage": 50000},
-    {"id": 3, "name": "Home Shield", "type": "home", "premium": 2000, "coverage": 5000000},
-    {"id": 4, "name": "Health Guard", "type": "health", "premium": 1500, "coverage": 500000},
-    {"id": 5, "name": "Travel Safe", "type": "travel", "premium": 200, "coverage": 100000},
-    {"id": 6, "name": "Critical Illness Cover", "type": "health", "premium": 3000, "coverage": 2000000},
-    {"id": 7, "name": "Term Life Max", "type": "life", "premium": 5000, "coverage": 10000000},
-    {"id": 8, "name": "Bike Rider Pro", "type": "vehicle", "premium": 150, "coverage": 10000},
-    {"id": 9, "name": "Gadget Protect", "type": "gadget", "premium": 100, "coverage": 5000},
-    {"id": 10, "name": "Retirement Plan A", "type": "life", "premium": 10000, "coverage": 5000000},
-]
+policy_rows = ReadModel(schemas.Insurance)
 
 @router.get("/policies")
-def get_available_policies():
-    return MOCK_POLICIES
+def get_available_policies(request: Request):
+    return catalog.catalog_response(request, "policies")
 
 @router.get("/", response_model=list[schemas.Insurance])
 async def get_my_policies(current_user: models.User = Depends(auth.get_current_user)):
-    return await models.Insurance.find(models.Insurance.user_id == str(current_user.id)).to_list()
+    return await list_response(models.Insurance, policy_rows, {"user_id": str(current_user.id)})
 
 @router.post("/buy")
 async def buy_policy(purchase: schemas.PolicyPurchase, current_user: models.User = Depends(auth.get_current_user)):
@@ -36,20 +27,19 @@ async def buy_policy(purchase: schemas.PolicyPurchase, current_user: models.User
         raise HTTPException(status_code=401, detail="Incorrect transaction PIN")
     
     policy_id = purchase.policy_id
-    policy = next((p for p in MOCK_POLICIES if p["id"] == policy_id), None)
+    policy = catalog.current().policies.get(policy_id)
     if not policy:
         raise HTTPException(status_code=404, detail="Policy not found")
         
-    account = await models.Account.find_one(models.Account.user_id == str(current_user.id))
-    if not account:
+    # Deduct premium and record it
+    try:
+        await ledger.debit(ledger.by_owner(str(current_user.id)), policy["premium"], f"Insurance Premium: {policy['name']}")
+    except ledger.AccountNotFound:
         raise HTTPException(status_code=404, detail="No account found")
-        
-    if account.balance < policy["premium"]:
+    except ledger.InsufficientFunds:
         raise HTTPException(status_code=400, detail="Insufficient balance")
-        
-    # Deduct premium
-    account.balance -= policy["premium"]
-    await account.save()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
     new_insurance = models.Insurance(
         user_id=str(current_user.id),
@@ -59,14 +49,6 @@ async def buy_policy(purchase: schemas.PolicyPurchase, current_user: models.User
         coverage=policy["coverage"]
     )
     
-    txn = models.Transaction(
-        account_id=str(account.id),
-        amount=-policy["premium"],
-        transaction_type="withdrawal",
-        description=f"Insurance Premium: {policy['name']}"
-    )
-    
     await new_insurance.create()
-    await txn.create()
     
     return {"message": "Policy purchased successfully", "insurance": new_insurance}
@@ -1,33 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-import models, schemas, auth
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pymongo import ReturnDocument
+import models, schemas, auth, database
+from utils import catalog, credit_score, ledger
+from utils.read_models import ReadModel, list_response
 
 router = APIRouter(
     prefix="/investments",
     tags=["investments"],
 )
 
-MOCK_MARKET_DATA = [
-    {"symbol": "AAPL", "name": "Apple Inc.", "price": 150.0, "type": "stock", "change": 1.2},
-    {"symbol": "GOOGL", "name": "Alphabet Inc.", "price": 2800.0, "type": "stock", "change": -0.5},
-    {"symbol": "MSFT", "name": "Microsoft Corp.", "price": 305.0, "type": "stock", "change": 0.8},
-    {"symbol": "AMZN", "name": "Amazon.com Inc.", "price": 3400.0, "type": "stock", "change": 1.5},
-    {"symbol": "TSLA", "name": "Tesla Inc.", "price": 750.0, "type": "stock", "change": -2.1},
-    {"symbol": "VTSAX", "name": "Vanguard Total Stock Market", "price": 110.0, "type": "mutual_fund", "change": 0.3},
-    {"symbol": "VFIAX", "name": "Vanguard 500 Index Fund", "price": 400.0, "type": "mutual_fund", "change": 0.4},
-    {"symbol": "VGSLX", "name": "Vanguard REIT Index Fund", "price": 145.0, "type": "mutual_fund", "change": -0.2},
-    {"symbol": "VTIAX", "name": "Vanguard Total Intl Stock", "price": 30.0, "type": "mutual_fund", "change": 0.1},
-    {"symbol": "VBTLX", "name": "Vanguard Total Bond Market", "price": 11.0, "type": "mutual_fund", "change": 0.05},
-    {"symbol": "SPY", "name": "SPDR S&P 500 ETF Trust", "price": 440.0, "type": "etf", "change": 0.4},
-    {"symbol": "QQQ", "name": "Invesco QQQ Trust", "price": 370.0, "type": "etf", "change": 0.6},
-]
+investment_rows = ReadModel(schemas.Investment)
 
 @router.get("/market")
-def get_market_data():
-    return MOCK_MARKET_DATA
+def get_market_data(request: Request):
+    return catalog.catalog_response(request, "market")
 
 @router.get("/", response_model=list[schemas.Investment])
 async def get_investments(current_user: models.User = Depends(auth.get_current_user)):
-    return await models.Investment.find(models.Investment.user_id == str(current_user.id)).to_list()
+    return await list_response(models.Investment, investment_rows, {"user_id": str(current_user.id)})
 
 @router.post("/invest")
 async def invest(investment: schemas.InvestmentCreate, current_user: models.User = Depends(auth.get_current_user)):
@@ -40,20 +30,20 @@ async def invest(investment: schemas.InvestmentCreate, current_user: models.User
     if investment.amount < 500:
         raise HTTPException(status_code=400, detail="Minimum investment amount is 500")
     
-    account = await models.Account.find_one(models.Account.user_id == str(current_user.id))
-    if not account:
+    # Deduct balance and record the withdrawal
+    try:
+        await ledger.debit(ledger.by_owner(str(current_user.id)), investment.amount, f"Investment in {investment.symbol}")
+    except ledger.AccountNotFound:
         raise HTTPException(status_code=404, detail="No account found")
-        
-    if account.balance < investment.amount:
+    except ledger.InsufficientFunds:
         raise HTTPException(status_code=400, detail="Insufficient balance")
-        
-    # Deduct balance
-    account.balance -= investment.amount
-    await account.save()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
     
     # Create investment record
-    # Find price from mock data
-    price = next((item["price"] for item in MOCK_MARKET_DATA if item["symbol"] == investment.symbol), 100.0)
+    # Find price from the market catalog
+    item = catalog.current().market.get(investment.symbol)
+    price = item["price"] if item else 100.0
     quantity = investment.amount / price
     
     new_investment = models.Investment(
@@ -65,16 +55,8 @@ async def invest(investment: schemas.InvestmentCreate, current_user: models.User
         current_value=price # Initial value
     )
     
-    # Transaction
-    txn = models.Transaction(
-        account_id=str(account.id),
-        amount=-investment.amount,
-        transaction_type="withdrawal",
-        description=f"Investment in {investment.symbol}"
-    )
-    
     await new_investment.create()
-    await txn.create()
+    await credit_score.apply(str(current_user.id), investment_value=quantity * price)
     
     return {"message": "Investment successful"}
 
@@ -102,34 +84,39 @@ async def sell(sell_request: schemas.InvestmentSell, current_user: models.User =
         raise HTTPException(status_code=400, detail="Insufficient quantity")
 
     # Get current market price
-    price = next((item["price"] for item in MOCK_MARKET_DATA if item["symbol"] == sell_request.symbol), 100.0)
+    item = catalog.current().market.get(sell_request.symbol)
+    price = item["price"] if item else 100.0
     
     # Calculate total value
     total_value = sell_request.quantity * price
 
-    # Update investment quantity
-    investment.quantity -= sell_request.quantity
-    
-    if investment.quantity <= 0.000001: # Floating point tolerance
-        await investment.delete()
-    else:
-        await investment.save()
+    # Take the units with a guarded $inc, so concurrent sells can't oversell
+    holdings = database.collection(models.Investment)
+    remaining = await holdings.find_one_and_update(
+        {"_id": investment.id, "quantity": {"$gte": sell_request.quantity}},
+        {"$inc": {"quantity": -sell_request.quantity}},
+        projection={"quantity": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not remaining:
+        raise HTTPException(status_code=400, detail="Insufficient quantity")
 
     # Credit user account
-    account = await models.Account.find_one(models.Account.user_id == str(current_user.id))
-    if not account:
+    try:
+        await ledger.credit(
+            ledger.by_owner(str(current_user.id)),
+            total_value,
+            f"Sold {sell_request.quantity:.4f} {sell_request.symbol}"
+        )
+    except ledger.AccountNotFound:
+        await holdings.update_one({"_id": investment.id}, {"$inc": {"quantity": sell_request.quantity}})
         raise HTTPException(status_code=404, detail="Account not found")
+    except ValueError:
+        await holdings.update_one({"_id": investment.id}, {"$inc": {"quantity": sell_request.quantity}})
+        raise HTTPException(status_code=400, detail="Amount must be positive")
 
-    account.balance += total_value
-    await account.save()
-
-    # Create transaction record
-    txn = models.Transaction(
-        account_id=str(account.id),
-        amount=total_value,
-        transaction_type="deposit",
-        description=f"Sold {sell_request.quantity:.4f} {sell_request.symbol}"
-    )
-    await txn.create()
+    if remaining["quantity"] <= 0.000001: # Floating point tolerance
+        await holdings.delete_one({"_id": investment.id, "quantity": {"$lte": 0.000001}})
+    await credit_score.apply(str(current_user.id), investment_value=-sell_request.quantity * investment.purchase_price)
 
     return {"message": "Sale successful", "amount_credited": total_value}
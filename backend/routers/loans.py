@@ -1,31 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
 import models, schemas, auth
+from utils import catalog, loan_math
+from utils import loan_disbursement
+from datetime import datetime
+from uuid import uuid4
+from beanie import PydanticObjectId
+from beanie.operators import In, Set
+from utils.read_models import ReadModel, list_response
 
 router = APIRouter(
     prefix="/loans",
     tags=["loans"],
 )
 
-MOCK_LOAN_OFFERS = [
-    {"type": "personal", "name": "Personal Loan", "rate": 10.5, "max_amount": 500000},
-    {"type": "home", "name": "Home Loan", "rate": 8.5, "max_amount": 10000000},
-    {"type": "car", "name": "Car Loan", "rate": 9.0, "max_amount": 2000000},
-    {"type": "education", "name": "Education Loan", "rate": 7.5, "max_amount": 4000000},
-    {"type": "gold", "name": "Gold Loan", "rate": 6.5, "max_amount": 1000000},
-    {"type": "business", "name": "Business Loan", "rate": 12.0, "max_amount": 5000000},
-    {"type": "travel", "name": "Travel Loan", "rate": 11.0, "max_amount": 300000},
-    {"type": "wedding", "name": "Wedding Loan", "rate": 11.5, "max_amount": 1000000},
-    {"type": "medical", "name": "Medical Loan", "rate": 9.5, "max_amount": 1500000},
-    {"type": "debt_consolidation", "name": "Debt Consolidation", "rate": 10.0, "max_amount": 2000000},
-]
+loan_rows = ReadModel(schemas.Loan)
 
 @router.get("/offers")
-def get_loan_offers():
-    return MOCK_LOAN_OFFERS
+def get_loan_offers(request: Request):
+    return catalog.catalog_response(request, "loan_offers")
 
 @router.get("/", response_model=list[schemas.Loan])
 async def get_loans(current_user: models.User = Depends(auth.get_current_user)):
-    return await models.Loan.find(models.Loan.user_id == str(current_user.id)).to_list()
+    return await list_response(models.Loan, loan_rows, {"user_id": str(current_user.id)})
 
 @router.post("/apply")
 async def apply_loan(loan: schemas.LoanCreate, current_user: models.User = Depends(auth.get_current_user)):
@@ -36,19 +32,78 @@ async def apply_loan(loan: schemas.LoanCreate, current_user: models.User = Depen
         raise HTTPException(status_code=401, detail="Incorrect transaction PIN")
     
     # Find active loan offer to get interest rate
-    offer = next((o for o in MOCK_LOAN_OFFERS if o["type"] == loan.loan_type), None)
+    offer = catalog.current().loan_offers.get(loan.loan_type)
     rate = offer["rate"] if offer else 10.5
 
+    if not 0 < loan.amount < float("inf"):
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    if loan.tenure_months < 1 or loan.tenure_months > 360:
+        raise HTTPException(status_code=400, detail="Tenure must be between 1 and 360 months")
+
     new_loan = models.Loan(
         user_id=str(current_user.id),
         amount=loan.amount,
         loan_type=loan.loan_type,
         interest_rate=rate,
+        tenure_months=loan.tenure_months,
         status="pending"
     )
     
     await new_loan.create()
-    return {"message": "Loan application submitted for review", "loan": new_loan}
+    emi = float(loan_math.emi(loan.amount, rate, loan.tenure_months))
+    return {"message": "Loan application submitted for review", "loan": new_loan, "emi": round(emi, 2)}
+
+@router.get("/{loan_id}/schedule")
+async def get_loan_schedule(loan_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    loan = await models.Loan.get(loan_id)
+    if not loan or (loan.user_id != str(current_user.id) and not current_user.is_admin):
+        raise HTTPException(status_code=404, detail="Loan not found")
+
+    schedule = loan_math.amortization_schedule(loan.amount, loan.interest_rate, loan.tenure_months)
+    months_paid = 0
+    if loan.status == "active":
+        months_paid = int(loan_math.months_elapsed(loan.disbursed_at or loan.created_at))
+    outstanding = loan_math.outstanding_principal(loan.amount, loan.interest_rate, loan.tenure_months, months_paid)
+
+    return {
+        "loan_id": str(loan.id),
+        "amount": loan.amount,
+        "interest_rate": loan.interest_rate,
+        "tenure_months": loan.tenure_months,
+        "emi": round(float(loan_math.emi(loan.amount, loan.interest_rate, loan.tenure_months)), 2),
+        "total_interest": round(sum(row["interest"] for row in schedule), 2),
+        "months_paid": min(months_paid, loan.tenure_months),
+        "outstanding_principal": round(float(outstanding), 2),
+        "schedule": schedule,
+    }
+
+# Loans are streamed in chunks of this size and summarized one chunk at a time
+LOAN_BOOK_CHUNK = 50000
+
+@router.get("/admin/summary")
+async def get_loan_book_summary(current_user: models.User = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    summary = loan_math.LoanBookSummary()
+    amounts, rates, tenures, starts = [], [], [], []
+
+    cursor = models.Loan.find(
+        models.Loan.status == "active",
+        projection_model=schemas.LoanTerms,
+        batch_size=5000
+    )
+    async for terms in cursor:
+        amounts.append(terms.amount)
+        rates.append(terms.interest_rate)
+        tenures.append(terms.tenure_months)
+        starts.append(terms.disbursed_at or terms.created_at)
+        if len(amounts) >= LOAN_BOOK_CHUNK:
+            summary.add_chunk(amounts, rates, tenures, starts)
+            amounts, rates, tenures, starts = [], [], [], []
+    summary.add_chunk(amounts, rates, tenures, starts)
+
+    return summary.as_dict()
 
 @router.get("/admin/all")
 async def get_all_loans(current_user: models.User = Depends(auth.get_current_user)):
@@ -91,22 +146,13 @@ async def approve_loan(loan_id: str, background_tasks: BackgroundTasks, current_
     if loan.status != "pending":
         raise HTTPException(status_code=400, detail="Loan is not pending")
         
-    loan.status = "active"
-    await loan.save()
+    # Claim it, so two admins approving at once disburse it once
+    claimed = await claim_pending_loans([loan_id], {models.Loan.status: "active", models.Loan.disbursed_at: datetime.utcnow(), models.Loan.disbursement_pending: True})
+    if not claimed:
+        raise HTTPException(status_code=400, detail="Loan is not pending")
     
-    # Credit the loan amount to account
-    account = await models.Account.find_one(models.Account.user_id == loan.user_id)
-    if account:
-        account.balance += loan.amount
-        await account.save()
-        
-        txn = models.Transaction(
-            account_id=str(account.id),
-            amount=loan.amount,
-            transaction_type="deposit",
-            description=f"Loan Disbursement: {loan.loan_type}"
-        )
-        await txn.create()
+    # Credit the loan amount to the borrower's primary account, if they still have one
+    await loan_disbursement.disburse([{"_id": loan.id, "user_id": loan.user_id, "amount": loan.amount, "loan_type": loan.loan_type}])
     
     # Send email notification
     loan_user = await models.User.get(loan.user_id)
@@ -150,3 +196,74 @@ async def reject_loan(loan_id: str, background_tasks: BackgroundTasks, current_u
     
     return {"message": "Loan rejected"}
 
+
+async def claim_pending_loans(ids: list, updates: dict):
+    """Move pending loans to a new status in one update_many.
+
+    Each call tags its loans with a fresh batch id, so concurrent bulk calls
+    never act on (or disburse) the same loan twice.
+    """
+    batch_id = uuid4().hex
+    object_ids = [PydanticObjectId(loan_id) for loan_id in ids]
+    await models.Loan.find(In(models.Loan.id, object_ids), models.Loan.status == "pending").update_many(
+        Set({**updates, models.Loan.approval_batch: batch_id})
+    )
+    return await models.Loan.find(In(models.Loan.id, object_ids), models.Loan.approval_batch == batch_id).to_list()
+
+async def get_users_by_id(user_ids) -> dict:
+    object_ids = [PydanticObjectId(user_id) for user_id in set(user_ids)]
+    users = await models.User.find(In(models.User.id, object_ids)).to_list()
+    return {str(u.id): u for u in users}
+
+def bulk_result(action: str, ids: list, loans: list) -> dict:
+    processed = {str(l.id) for l in loans}
+    return {
+        "message": f"{len(processed)} loans {action}",
+        "processed": [i for i in ids if i in processed],
+        "skipped": [i for i in ids if i not in processed],
+    }
+
+@router.post("/admin/bulk-approve")
+async def bulk_approve_loans(bulk: schemas.BulkIds, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+    from utils.email_service import send_bulk_emails, loan_status_email
+
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    now = datetime.utcnow()
+    loans = await claim_pending_loans(bulk.ids, {models.Loan.status: "active", models.Loan.disbursed_at: now, models.Loan.disbursement_pending: True})
+    if not loans:
+        return bulk_result("approved and disbursed", bulk.ids, loans)
+
+    # Disburse to each borrower's primary account (same rule as approve_loan)
+    user_ids = {l.user_id for l in loans}
+    await loan_disbursement.disburse([{"_id": l.id, "user_id": l.user_id, "amount": l.amount, "loan_type": l.loan_type} for l in loans])
+
+    users = await get_users_by_id(user_ids)
+    messages = []
+    for l in loans:
+        loan_user = users.get(l.user_id)
+        if loan_user:
+            messages.append((loan_user.email, *loan_status_email(loan_user.full_name, l.loan_type, l.amount, "active")))
+    background_tasks.add_task(send_bulk_emails, messages)
+
+    return bulk_result("approved and disbursed", bulk.ids, loans)
+
+@router.post("/admin/bulk-reject")
+async def bulk_reject_loans(bulk: schemas.BulkIds, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+    from utils.email_service import send_bulk_emails, loan_status_email
+
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    loans = await claim_pending_loans(bulk.ids, {models.Loan.status: "rejected"})
+
+    users = await get_users_by_id(l.user_id for l in loans)
+    messages = []
+    for l in loans:
+        loan_user = users.get(l.user_id)
+        if loan_user:
+            messages.append((loan_user.email, *loan_status_email(loan_user.full_name, l.loan_type, l.amount, "rejected")))
+    background_tasks.add_task(send_bulk_emails, messages)
+
+    return bulk_result("rejected", bulk.ids, loans)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, Field, field_serializer
+from pydantic import BaseModel, EmailStr, Field, field_serializer, field_validator
 from typing import Optional, List, Annotated, Any
 from datetime import datetime
 from beanie import PydanticObjectId
@@ -21,6 +21,10 @@ class Token(BaseModel):
     token_type: str
     user_name: str
     is_admin: bool
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -81,6 +85,24 @@ class TransferRequest(BaseModel):
     amount: float
     pin: str  # 4-digit transaction PIN
 
+class BeneficiaryCreate(BaseModel):
+    account_number: str
+    nickname: Optional[str] = None
+
+class Beneficiary(BaseModel):
+    id: Optional[Any] = None
+    account_number: str
+    payee_name: str
+    nickname: Optional[str] = None
+    created_at: datetime
+    
+    @field_serializer('id')
+    def serialize_id(self, id: Any, _info):
+        return str(id) if id else None
+
+    class Config:
+        from_attributes = True
+
 class FixedDepositCreate(BaseModel):
     account_id: str
     amount: float
@@ -132,6 +154,7 @@ class Loan(BaseModel):
     amount: float
     loan_type: str
     interest_rate: float
+    tenure_months: int = 12
     status: str
     
     @field_serializer('id')
@@ -144,8 +167,21 @@ class Loan(BaseModel):
 class LoanCreate(BaseModel):
     amount: float
     loan_type: str
+    tenure_months: int = 12
     pin: str  # 4-digit transaction PIN
 
+class TransactionPage(BaseModel):
+    items: List[Transaction]
+    next_cursor: Optional[str] = None
+
+class LoanTerms(BaseModel):
+    # Projection used when streaming the loan book
+    amount: float
+    interest_rate: float
+    tenure_months: int = 12
+    created_at: datetime
+    disbursed_at: Optional[datetime] = None
+
 class Insurance(BaseModel):
     id: Optional[Any] = None
     policy_name: str
@@ -202,3 +238,25 @@ class DeletionRequest(BaseModel):
 
     class Config:
         from_attributes = True
+
+class CatalogReload(BaseModel):
+    version: Optional[str] = None
+    catalog: Optional[dict] = None  # Omit to re-read CATALOG_PATH
+
+class BalanceShardConfig(BaseModel):
+    shards: int  # 0 turns sharding off
+
+class BulkIds(BaseModel):
+    ids: List[str]
+
+    @field_validator('ids')
+    @classmethod
+    def validate_ids(cls, ids: List[str]):
+        if not ids:
+            raise ValueError("ids must not be empty")
+        if len(ids) > 5000:
+            raise ValueError("At most 5000 ids per request")
+        for id in ids:
+            if not PydanticObjectId.is_valid(id):
+                raise ValueError(f"Invalid id: {id}")
+        return list(dict.fromkeys(ids))  # Drop duplicates, keep order
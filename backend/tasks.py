@@ -16,3 +16,83 @@ def generate_report(user_id: str):
     time.sleep(5)
     print(f"Report generated for user {user_id}!")
     return f"Report generated for user {user_id}"
+
+@celery_app.task(name="tasks.process_fd_maturities")
+def process_fd_maturities():
+    # Credit matured fixed deposits; safe to re-run, resumes where it stopped
+    import asyncio
+    import database
+    from utils.fd_maturity import process_matured_deposits
+
+    async def run():
+        await database.init_db()
+        return await process_matured_deposits()
+
+    return asyncio.run(run())
+
+@celery_app.task(name="tasks.backfill_spending_rollups")
+def backfill_spending_rollups(account_id: str = None):
+    # Rebuild spending rollups from raw transactions; safe to re-run
+    import asyncio
+    import database
+    from utils.analytics import backfill_rollups
+
+    async def run():
+        await database.init_db()
+        return await backfill_rollups(account_id)
+
+    return asyncio.run(run())
+
+@celery_app.task(name="tasks.run_month_end_statements")
+def run_month_end_statements(month: str = None):
+    # Statements for every account for last month (or YYYY-MM); resumes from its checkpoint
+    import asyncio
+    import database
+    from utils.statement_batch import run_statements, parse_month
+
+    async def run():
+        await database.init_db()
+        if month:
+            return await run_statements(*parse_month(month))
+        return await run_statements()
+
+    return asyncio.run(run())
+
+@celery_app.task(name="tasks.archive_transactions")
+def archive_transactions():
+    # Move months past the hot window into archive collections; safe to re-run
+    import asyncio
+    import database
+    from utils.transaction_archive import archive_transactions as run_archive
+
+    async def run():
+        await database.init_db()
+        return await run_archive()
+
+    return asyncio.run(run())
+
+@celery_app.task(name="tasks.retry_loan_disbursements")
+def retry_loan_disbursements():
+    # Credit approved loans a crashed request left undisbursed; safe to re-run
+    import asyncio
+    import database
+    from utils.loan_disbursement import retry_pending
+
+    async def run():
+        await database.init_db()
+        return await retry_pending()
+
+    return asyncio.run(run())
+
+@celery_app.task(name="tasks.resume_shard_sweeps")
+def resume_shard_sweeps():
+    # Finish shard sweeps a crash interrupted; safe to re-run
+    import asyncio
+    import database
+    from utils.balance_shards import resume_sweeps
+
+    async def run():
+        await database.init_db()
+        return await resume_sweeps()
+
+    return asyncio.run(run())
@@ -0,0 +1,193 @@
+# Spending Analytics for Vitta Bank
+# Per-account daily and monthly rollups of transactions, kept up to date with
+# $inc upserts as transactions are written. Rollup ids are deterministic
+# ("month:2026-10:<account_id>"), so a range query is an _id $in lookup.
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne, UpdateOne
+
+import database
+import models
+from utils import transaction_archive
+
+logger = logging.getLogger('python-logstash-logger')
+
+ROLLUPS = "spending_rollups"
+GRANULARITIES = {
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+BACKFILL_BATCH = 1000
+
+
+def rollup_id(granularity: str, account_id: str, when: datetime) -> str:
+    return f"{granularity}:{when.strftime(GRANULARITIES[granularity])}:{account_id}"
+
+
+def period_start(granularity: str, when: datetime) -> datetime:
+    if granularity == "month":
+        return datetime(when.year, when.month, 1)
+    return datetime(when.year, when.month, when.day)
+
+
+def _field(txn, name):
+    return txn[name] if isinstance(txn, dict) else getattr(txn, name)
+
+
+def rollup_updates(transactions) -> list:
+    """$inc upserts for a batch of transactions, merged per rollup document"""
+    increments = {}
+    for txn in transactions:
+        account_id = _field(txn, "account_id")
+        amount = _field(txn, "amount")
+        txn_type = _field(txn, "transaction_type")
+        timestamp = _field(txn, "timestamp")
+        debit = -amount if amount < 0 else 0.0
+        credit = amount if amount > 0 else 0.0
+
+        for granularity in GRANULARITIES:
+            key = rollup_id(granularity, account_id, timestamp)
+            entry = increments.setdefault(key, {
+                "insert": {
+                    "account_id": account_id,
+                    "granularity": granularity,
+                    "period_start": period_start(granularity, timestamp),
+                },
+                "inc": {},
+            })
+            inc = entry["inc"]
+            for field, value in (
+                ("count", 1),
+                ("debit_total", debit),
+                ("credit_total", credit),
+                (f"by_type.{txn_type}.count", 1),
+                (f"by_type.{txn_type}.debit", debit),
+                (f"by_type.{txn_type}.credit", credit),
+            ):
+                inc[field] = inc.get(field, 0) + value
+
+    return [
+        UpdateOne({"_id": key}, {"$setOnInsert": entry["insert"], "$inc": entry["inc"]}, upsert=True)
+        for key, entry in increments.items()
+    ]
+
+
+async def record_transactions(transactions):
+    """Fold newly written transactions into their rollups (one bulk_write)"""
+    updates = rollup_updates(transactions)
+    if not updates:
+        return
+    try:
+        await database.db[ROLLUPS].bulk_write(updates, ordered=False)
+    except Exception as e:
+        # Rollups are derived data; a failure here must not fail the write path.
+        # The backfill job rebuilds any account that drifts.
+        logger.error(f"Failed to update spending rollups: {e}")
+
+
+def _backfill_pipeline(granularity: str, match: dict) -> list:
+    fmt = GRANULARITIES[granularity]
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "account_id": "$account_id",
+                "period": {"$dateToString": {"format": fmt, "date": "$timestamp"}},
+                "type": "$transaction_type",
+            },
+            "count": {"$sum": 1},
+            "debit": {"$sum": {"$cond": [{"$lt": ["$amount", 0]}, {"$multiply": ["$amount", -1]}, 0.0]}},
+            "credit": {"$sum": {"$cond": [{"$gt": ["$amount", 0]}, "$amount", 0.0]}},
+        }},
+        {"$group": {
+            "_id": {"account_id": "$_id.account_id", "period": "$_id.period"},
+            "count": {"$sum": "$count"},
+            "debit_total": {"$sum": "$debit"},
+            "credit_total": {"$sum": "$credit"},
+            "by_type": {"$push": {"k": "$_id.type", "v": {"count": "$count", "debit": "$debit", "credit": "$credit"}}},
+        }},
+    ]
+
+
+async def _tier_groups(granularity: str, account_id: str = None):
+    for collection, bounds in await transaction_archive.tiers():
+        match = {"account_id": account_id} if account_id else {}
+        if bounds:
+            match["timestamp"] = bounds
+        async for group in collection.aggregate(_backfill_pipeline(granularity, match), allowDiskUse=True):
+            yield group
+
+
+async def backfill_rollups(account_id: str = None) -> dict:
+    """Rebuild rollups from raw transactions with $group aggregations.
+
+    Rollups are replaced wholesale, so the job is safe to re-run. Run it
+    during a quiet window: live increments that land on an account while
+    it is being rebuilt can be overwritten.
+    """
+    written = {}
+    for granularity, fmt in GRANULARITIES.items():
+        ops = []
+        written[granularity] = 0
+        # Tiers split on month boundaries, so no day or month is spread across two of them
+        async for group in _tier_groups(granularity, account_id):
+            start = datetime.strptime(group["_id"]["period"], fmt)
+            acc = group["_id"]["account_id"]
+            ops.append(ReplaceOne(
+                {"_id": rollup_id(granularity, acc, start)},
+                {
+                    "account_id": acc,
+                    "granularity": granularity,
+                    "period_start": start,
+                    "count": group["count"],
+                    "debit_total": group["debit_total"],
+                    "credit_total": group["credit_total"],
+                    "by_type": {item["k"]: item["v"] for item in group["by_type"]},
+                },
+                upsert=True,
+            ))
+            if len(ops) >= BACKFILL_BATCH:
+                await database.db[ROLLUPS].bulk_write(ops, ordered=False)
+                written[granularity] += len(ops)
+                ops = []
+        if ops:
+            await database.db[ROLLUPS].bulk_write(ops, ordered=False)
+            written[granularity] += len(ops)
+    logger.info(f"Spending rollup backfill complete: {written}")
+    return written
+
+
+def recent_periods(granularity: str, count: int, now: datetime = None) -> list:
+    """Start dates of the last `count` periods, oldest first, ending with the current one"""
+    now = now or datetime.utcnow()
+    if granularity == "month":
+        periods = []
+        year, month = now.year, now.month
+        for _ in range(count):
+            periods.append(datetime(year, month, 1))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    else:
+        today = period_start("day", now)
+        periods = [today - timedelta(days=i) for i in range(count)]
+    return list(reversed(periods))
+
+
+async def spending_by_period(account_id: str, granularity: str, count: int) -> list:
+    """Read at most `count` pre-aggregated rollups; missing periods are zero"""
+    periods = recent_periods(granularity, count)
+    ids = [rollup_id(granularity, account_id, p) for p in periods]
+    docs = {doc["_id"]: doc async for doc in database.db[ROLLUPS].find({"_id": {"$in": ids}})}
+
+    fmt = GRANULARITIES[granularity]
+    result = []
+    for period, key in zip(periods, ids):
+        doc = docs.get(key, {})
+        result.append({
+            "period": period.strftime(fmt),
+            "count": doc.get("count", 0),
+            "debit_total": round(doc.get("debit_total", 0.0), 2),
+            "credit_total": round(doc.get("credit_total", 0.0), 2),
+            "by_type": doc.get("by_type", {}),
+        })
+    return result
@@ -0,0 +1,224 @@
+# Sharded Balances for Vitta Bank
+# High-volume receivers (merchants, payroll) can be flagged to take credits
+# on N sub-balance documents picked at random instead of the one Account
+# document, so concurrent credits stop serializing on a single document.
+# Debits still draw from Account.balance; when it runs short the shards are
+# swept into it first. The visible balance is the account's own balance plus
+# its shards, cached briefly.
+#
+# A sweep moves money between two documents. On a replica set it runs in one
+# transaction; otherwise each shard's amount is first recorded on the account
+# (pending_sweeps), so resume_sweeps can finish a move a crash interrupted.
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import database
+import models
+
+logger = logging.getLogger('python-logstash-logger')
+
+SHARDS = "balance_shards"
+MAX_SHARDS = 64
+SHARD_CONFIG_CACHE_SECONDS = 30
+VISIBLE_BALANCE_CACHE_SECONDS = 1.0
+SWEPT_REF_TTL = timedelta(hours=1)  # How long a shard remembers a sweep it has paid out
+
+# Accounts keep balance_shards (0 once unflagged), so shards a stale worker
+# credits after unflagging still count towards the balance until swept
+_config = ({}, -SHARD_CONFIG_CACHE_SECONDS)  # ({account_id: account doc}, monotonic load time)
+_visible = {}  # account_id -> (balance, monotonic time)
+
+
+def shard_id(account_id: str, shard: int) -> str:
+    return f"{account_id}:{shard}"
+
+
+async def sharded_accounts(refresh: bool = False) -> dict:
+    """account_id -> {_id, user_id, account_number, balance_shards} for every account ever flagged"""
+    global _config
+    accounts, loaded_at = _config
+    if refresh or time.monotonic() - loaded_at >= SHARD_CONFIG_CACHE_SECONDS:
+        cursor = database.collection(models.Account).find(
+            {"balance_shards": {"$exists": True}},
+            projection={"user_id": 1, "account_number": 1, "balance_shards": 1},
+        )
+        accounts = {str(doc["_id"]): doc async for doc in cursor}
+        _config = (accounts, time.monotonic())
+    return accounts
+
+
+async def credit_target(query: dict):
+    """The flagged account a credit query points at, or None to credit Account.balance"""
+    if set(query) != {"_id"}:
+        return None
+    account = (await sharded_accounts()).get(str(query["_id"]))
+    return account if account and account.get("balance_shards") else None
+
+
+async def credit(account: dict, amount: float, session=None) -> dict:
+    """$inc a random shard of a flagged account; returns the account with its visible balance"""
+    account_id = str(account["_id"])
+    shard = random.randrange(account["balance_shards"])
+    await database.db[SHARDS].update_one(
+        {"_id": shard_id(account_id, shard)},
+        {"$inc": {"balance": amount}, "$setOnInsert": {"account_id": account_id, "shard": shard}},
+        upsert=True,
+        session=session,
+    )
+    cached = _visible.get(account_id)
+    if cached and time.monotonic() - cached[1] < VISIBLE_BALANCE_CACHE_SECONDS:
+        balance = cached[0] + amount
+        _visible[account_id] = (balance, cached[1])
+    else:
+        balance = await visible_balance(account_id, session=session)
+    return {**account, "balance": balance}
+
+
+async def sweep(account_id: str, min_shard: int = 0, session=None) -> float:
+    """Move shards (from `min_shard` up) into Account.balance; returns the amount moved"""
+    if session is None and await database.supports_transactions():
+        async with await database.client.start_session() as new_session:
+            moved = await new_session.with_transaction(lambda s: _sweep_in_session(account_id, min_shard, s))
+    elif session is None:
+        moved = await _sweep_marked(account_id, min_shard)
+    else:
+        moved = await _sweep_in_session(account_id, min_shard, session)
+    if moved:
+        _visible.pop(account_id, None)
+    return moved
+
+
+async def _sweep_in_session(account_id: str, min_shard: int, session) -> float:
+    shards = database.db[SHARDS]
+    moved = 0.0
+    cursor = shards.find(
+        {"account_id": account_id, "shard": {"$gte": min_shard}, "balance": {"$ne": 0}},
+        projection={"_id": 1},
+        session=session,
+    )
+    async for doc in cursor:
+        # Read-and-zero in one step, so a credit landing mid-sweep stays on the shard
+        before = await shards.find_one_and_update({"_id": doc["_id"]}, {"$set": {"balance": 0.0}}, session=session)
+        moved += before.get("balance", 0.0) if before else 0.0
+    if moved:
+        await database.collection(models.Account).update_one(
+            {"_id": ObjectId(account_id)}, {"$inc": {"balance": moved}}, session=session
+        )
+    return moved
+
+
+async def _sweep_marked(account_id: str, min_shard: int) -> float:
+    moved = await _finish_sweeps(account_id)
+    # Refs are ObjectIds, so hex order is time order; a replay can't still be holding an hour-old one
+    await database.db[SHARDS].update_many(
+        {"account_id": account_id, "swept.0": {"$exists": True}},
+        {"$pull": {"swept": {"$lt": str(ObjectId.from_datetime(datetime.utcnow() - SWEPT_REF_TTL))}}},
+    )
+    cursor = database.db[SHARDS].find(
+        {"account_id": account_id, "shard": {"$gte": min_shard}, "balance": {"$ne": 0}},
+        projection={"balance": 1},
+    )
+    async for doc in cursor:
+        marker = {"ref": str(ObjectId()), "shard": doc["_id"], "amount": doc["balance"]}
+        await database.collection(models.Account).update_one(
+            {"_id": ObjectId(account_id)}, {"$push": {"pending_sweeps": marker}}
+        )
+        moved += await _finish_sweep(account_id, marker)
+    return moved
+
+
+async def _finish_sweep(account_id: str, marker: dict) -> float:
+    """Apply one recorded sweep; each step is guarded on the marker, so a replay can't repeat it"""
+    # Subtract rather than zero, so a credit landing mid-sweep stays on the shard
+    await database.db[SHARDS].update_one(
+        {"_id": marker["shard"], "swept": {"$ne": marker["ref"]}},
+        {"$inc": {"balance": -marker["amount"]}, "$push": {"swept": marker["ref"]}},
+    )
+    result = await database.collection(models.Account).update_one(
+        {"_id": ObjectId(account_id), "pending_sweeps.ref": marker["ref"]},
+        {"$inc": {"balance": marker["amount"]}, "$pull": {"pending_sweeps": {"ref": marker["ref"]}}},
+    )
+    return marker["amount"] if result.modified_count else 0.0
+
+
+async def _finish_sweeps(account_id: str) -> float:
+    account = await database.collection(models.Account).find_one(
+        {"_id": ObjectId(account_id)}, projection={"pending_sweeps": 1}
+    )
+    moved = 0.0
+    for marker in (account or {}).get("pending_sweeps", []):
+        moved += await _finish_sweep(account_id, marker)
+    return moved
+
+
+async def resume_sweeps() -> int:
+    """Finish sweeps a crash left recorded on accounts but not applied"""
+    cursor = database.collection(models.Account).find(
+        {"pending_sweeps.0": {"$exists": True}}, projection={"_id": 1}
+    )
+    resumed = 0
+    async for doc in cursor:
+        account_id = str(doc["_id"])
+        if await _finish_sweeps(account_id):
+            _visible.pop(account_id, None)
+        resumed += 1
+    if resumed:
+        logger.info(f"Resumed interrupted shard sweeps on {resumed} accounts")
+    return resumed
+
+
+async def shard_totals(account_ids: list, session=None) -> dict:
+    """account_id -> sum of its shards, for the ids that have any"""
+    pipeline = [
+        {"$match": {"account_id": {"$in": account_ids}}},
+        {"$group": {"_id": "$account_id", "balance": {"$sum": "$balance"}}},
+    ]
+    return {doc["_id"]: doc["balance"] async for doc in database.db[SHARDS].aggregate(pipeline, session=session)}
+
+
+async def visible_balance(account_id: str, main_balance: float = None, fresh: bool = False, session=None) -> float:
+    """Account.balance plus its shards, cached for VISIBLE_BALANCE_CACHE_SECONDS"""
+    if account_id not in await sharded_accounts():
+        if main_balance is not None:
+            return main_balance
+    elif not fresh:
+        cached = _visible.get(account_id)
+        if cached and time.monotonic() - cached[1] < VISIBLE_BALANCE_CACHE_SECONDS:
+            return cached[0]
+    if main_balance is None or fresh:
+        account = await database.collection(models.Account).find_one(
+            {"_id": ObjectId(account_id)}, projection={"balance": 1}, session=session
+        )
+        main_balance = account["balance"] if account else 0.0
+    balance = main_balance + (await shard_totals([account_id], session=session)).get(account_id, 0.0)
+    _visible[account_id] = (balance, time.monotonic())
+    return balance
+
+
+async def with_shards(rows: list) -> list:
+    """Add shard balances to the account rows ({"id", "balance", ...}) of flagged accounts"""
+    flagged = await sharded_accounts()
+    ids = [row["id"] for row in rows if row["id"] in flagged]
+    if ids:
+        totals = await shard_totals(ids)
+        for row in rows:
+            row["balance"] += totals.get(row["id"], 0.0)
+    return rows
+
+
+async def configure(account_id: str, shards: int):
+    """Spread credits over `shards` sub-balances, or stop (0) and fold them back in"""
+    await database.collection(models.Account).update_one(
+        {"_id": ObjectId(account_id)}, {"$set": {"balance_shards": shards}}
+    )
+    # Shards beyond the new count would only be drained by debits; fold them in now
+    await sweep(account_id, min_shard=shards)
+    await sharded_accounts(refresh=True)
+
+
+async def forget_accounts(account_ids: list):
+    await database.db[SHARDS].delete_many({"account_id": {"$in": account_ids}})
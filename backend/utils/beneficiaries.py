@@ -0,0 +1,194 @@
+# Saved Beneficiaries for Vitta Bank
+# A saved payee keeps the receiver's account id, owner, name and email as
+# resolved when it was saved. Each user's payees are cached as one map, in an
+# in-process LRU or in Redis shared by every worker, so a transfer to a saved
+# payee needs no receiver lookups. Deleting an account drops the payee entries
+# pointing at it and the cached maps that held them.
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import database
+import models
+
+logger = logging.getLogger('python-logstash-logger')
+
+BENEFICIARY_CACHE_BACKEND = os.getenv("BENEFICIARY_CACHE_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+BENEFICIARY_CACHE_SIZE = 50000  # Users held by the in-process cache
+# Entries expire so per-worker caches converge after another worker saves or removes a payee
+BENEFICIARY_CACHE_SECONDS = 300
+MAX_BENEFICIARIES = 100
+
+
+class PayeeNotFound(Exception):
+    pass
+
+
+class BeneficiaryExists(Exception):
+    pass
+
+
+class BeneficiaryLimit(Exception):
+    pass
+
+
+def payee(account_id: str, account_number: str, user_id: str, name: str = None, email: str = None) -> dict:
+    """What a transfer needs about its receiver; name and email are None for an orphaned account"""
+    return {"account_id": account_id, "account_number": account_number, "user_id": user_id, "name": name, "email": email}
+
+
+class MemoryCache:
+    """Per-worker LRU of user_id -> payee map"""
+
+    def __init__(self, size: int = BENEFICIARY_CACHE_SIZE, ttl: float = BENEFICIARY_CACHE_SECONDS):
+        self.entries = OrderedDict()
+        self.size = size
+        self.ttl = ttl
+
+    async def get(self, user_id: str):
+        cached = self.entries.get(user_id)
+        if cached is None:
+            return None
+        payees, loaded_at = cached
+        if time.monotonic() - loaded_at >= self.ttl:
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return payees
+
+    async def set(self, user_id: str, payees: dict):
+        self.entries[user_id] = (payees, time.monotonic())
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    async def delete(self, user_ids: list):
+        for user_id in user_ids:
+            self.entries.pop(user_id, None)
+
+
+class RedisCache:
+    """Payee maps shared by every worker, so an invalidation is seen everywhere at once"""
+
+    def __init__(self, url: str = REDIS_URL, ttl: int = BENEFICIARY_CACHE_SECONDS):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.fallback = MemoryCache()
+
+    @staticmethod
+    def key(user_id: str) -> str:
+        return f"beneficiaries:{user_id}"
+
+    async def get(self, user_id: str):
+        try:
+            raw = await self.client.get(self.key(user_id))
+        except Exception as e:
+            logger.error(f"Beneficiary cache unavailable, using in-memory cache: {e}")
+            return await self.fallback.get(user_id)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, user_id: str, payees: dict):
+        try:
+            await self.client.set(self.key(user_id), json.dumps(payees), ex=self.ttl)
+        except Exception as e:
+            logger.error(f"Beneficiary cache unavailable, using in-memory cache: {e}")
+            await self.fallback.set(user_id, payees)
+
+    async def delete(self, user_ids: list):
+        await self.fallback.delete(user_ids)
+        if user_ids:
+            try:
+                await self.client.delete(*[self.key(user_id) for user_id in user_ids])
+            except Exception as e:
+                logger.error(f"Beneficiary cache invalidation failed: {e}")
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = RedisCache() if BENEFICIARY_CACHE_BACKEND == "redis" else MemoryCache()
+    return _cache
+
+
+async def saved_payees(user_id: str) -> dict:
+    """account_number -> payee for every beneficiary the user has saved"""
+    cache = get_cache()
+    payees = await cache.get(user_id)
+    if payees is None:
+        cursor = database.collection(models.Beneficiary).find(
+            {"user_id": user_id},
+            projection={"account_id": 1, "account_number": 1, "payee_user_id": 1, "payee_name": 1, "payee_email": 1},
+        )
+        payees = {
+            doc["account_number"]: payee(doc["account_id"], doc["account_number"], doc["payee_user_id"], doc["payee_name"], doc["payee_email"])
+            async for doc in cursor
+        }
+        await cache.set(user_id, payees)
+    return payees
+
+
+async def resolve(user_id: str, account_number: str):
+    """The saved payee for `account_number`, or None if the user hasn't saved it"""
+    return (await saved_payees(user_id)).get(account_number)
+
+
+async def invalidate(user_ids: list):
+    await get_cache().delete(list(user_ids))
+
+
+async def save(user_id: str, account_number: str, nickname: str = None) -> models.Beneficiary:
+    """Resolve an account number once and store it as one of the user's payees"""
+    if await models.Beneficiary.find(models.Beneficiary.user_id == user_id).count() >= MAX_BENEFICIARIES:
+        raise BeneficiaryLimit()
+    account = await models.Account.find_one(models.Account.account_number == account_number)
+    if not account:
+        raise PayeeNotFound()
+    owner = await models.User.get(account.user_id)
+    if not owner:
+        raise PayeeNotFound()
+
+    beneficiary = models.Beneficiary(
+        user_id=user_id,
+        account_id=str(account.id),
+        account_number=account.account_number,
+        payee_user_id=account.user_id,
+        payee_name=owner.full_name,
+        payee_email=owner.email,
+        nickname=nickname,
+    )
+    try:
+        await beneficiary.insert()
+    except DuplicateKeyError:
+        raise BeneficiaryExists()
+    await invalidate([user_id])
+    return beneficiary
+
+
+async def remove(user_id: str, beneficiary_id: str) -> bool:
+    result = await database.collection(models.Beneficiary).delete_one({"_id": ObjectId(beneficiary_id), "user_id": user_id})
+    await invalidate([user_id])
+    return result.deleted_count > 0
+
+
+async def forget_accounts(account_ids: list):
+    """Drop every payee entry pointing at deleted accounts, and the cached maps holding them"""
+    beneficiaries = database.collection(models.Beneficiary)
+    query = {"account_id": {"$in": account_ids}}
+    user_ids = await beneficiaries.distinct("user_id", query)
+    await beneficiaries.delete_many(query)
+    await invalidate(user_ids)
+
+
+async def forget_user(user_id: str):
+    await database.collection(models.Beneficiary).delete_many({"user_id": user_id})
+    await invalidate([user_id])
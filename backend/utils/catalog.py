@@ -0,0 +1,241 @@
+# Product Catalog for Vitta Bank
+# Loads product definitions once into keyed indexes and pre-serializes the
+# public listings so the catalog endpoints never re-encode them per request.
+# A reload is published to Mongo; every worker polls for a newer publication
+# and swaps it in, so all workers converge on the same version.
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+
+from fastapi import Request, Response
+
+import database
+
+logger = logging.getLogger('python-logstash-logger')
+
+CATALOG_PATH = os.getenv("CATALOG_PATH")
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "300"))
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "5"))
+
+PUBLISHED = "catalog_versions"
+
+DEFAULT_CATALOG = {
+    "loan_offers": [
+        {"type": "personal", "name": "Personal Loan", "rate": 10.5, "max_amount": 500000},
+        {"type": "home", "name": "Home Loan", "rate": 8.5, "max_amount": 10000000},
+        {"type": "car", "name": "Car Loan", "rate": 9.0, "max_amount": 2000000},
+        {"type": "education", "name": "Education Loan", "rate": 7.5, "max_amount": 4000000},
+        {"type": "gold", "name": "Gold Loan", "rate": 6.5, "max_amount": 1000000},
+        {"type": "business", "name": "Business Loan", "rate": 12.0, "max_amount": 5000000},
+        {"type": "travel", "name": "Travel Loan", "rate": 11.0, "max_amount": 300000},
+        {"type": "wedding", "name": "Wedding Loan", "rate": 11.5, "max_amount": 1000000},
+        {"type": "medical", "name": "Medical Loan", "rate": 9.5, "max_amount": 1500000},
+        {"type": "debt_consolidation", "name": "Debt Consolidation", "rate": 10.0, "max_amount": 2000000},
+    ],
+    "market": [
+        {"symbol": "AAPL", "name": "Apple Inc.", "price": 150.0, "type": "stock", "change": 1.2},
+        {"symbol": "GOOGL", "name": "Alphabet Inc.", "price": 2800.0, "type": "stock", "change": -0.5},
+        {"symbol": "MSFT", "name": "Microsoft Corp.", "price": 305.0, "type": "stock", "change": 0.8},
+        {"symbol": "AMZN", "name": "Amazon.com Inc.", "price": 3400.0, "type": "stock", "change": 1.5},
+        {"symbol": "TSLA", "name": "Tesla Inc.", "price": 750.0, "type": "stock", "change": -2.1},
+        {"symbol": "VTSAX", "name": "Vanguard Total Stock Market", "price": 110.0, "type": "mutual_fund", "change": 0.3},
+        {"symbol": "VFIAX", "name": "Vanguard 500 Index Fund", "price": 400.0, "type": "mutual_fund", "change": 0.4},
+        {"symbol": "VGSLX", "name": "Vanguard REIT Index Fund", "price": 145.0, "type": "mutual_fund", "change": -0.2},
+        {"symbol": "VTIAX", "name": "Vanguard Total Intl Stock", "price": 30.0, "type": "mutual_fund", "change": 0.1},
+        {"symbol": "VBTLX", "name": "Vanguard Total Bond Market", "price": 11.0, "type": "mutual_fund", "change": 0.05},
+        {"symbol": "SPY", "name": "SPDR S&P 500 ETF Trust", "price": 440.0, "type": "etf", "change": 0.4},
+        {"symbol": "QQQ", "name": "Invesco QQQ Trust", "price": 370.0, "type": "etf", "change": 0.6},
+    ],
+    "policies": [
+        {"id": 1, "name": "Life Secure Plus", "type": "life", "premium": 1000, "coverage": 1000000},
+        {"id": 2, "name": "Vehicle Protect", "type": "vehicle", "premium": 500, "coverage": 50000},
+        {"id": 3, "name": "Home Shield", "type": "home", "premium": 2000, "coverage": 5000000},
+        {"id": 4, "name": "Health Guard", "type": "health", "premium": 1500, "coverage": 500000},
+        {"id": 5, "name": "Travel Safe", "type": "travel", "premium": 200, "coverage": 100000},
+        {"id": 6, "name": "Critical Illness Cover", "type": "health", "premium": 3000, "coverage": 2000000},
+        {"id": 7, "name": "Term Life Max", "type": "life", "premium": 5000, "coverage": 10000000},
+        {"id": 8, "name": "Bike Rider Pro", "type": "vehicle", "premium": 150, "coverage": 10000},
+        {"id": 9, "name": "Gadget Protect", "type": "gadget", "premium": 100, "coverage": 5000},
+        {"id": 10, "name": "Retirement Plan A", "type": "life", "premium": 10000, "coverage": 5000000},
+    ],
+    "card_options": [
+        {"id": "platinum_rewards", "name": "Platinum Rewards", "description": "Earn 3x points on travel & dining", "annual_fee": 2499, "cashback": "3%", "color": "from-slate-600 to-slate-800"},
+        {"id": "gold_cashback", "name": "Gold Cashback", "description": "5% cashback on all purchases", "annual_fee": 1499, "cashback": "5%", "color": "from-amber-600 to-amber-800"},
+        {"id": "travel_elite", "name": "Travel Elite", "description": "Airport lounge access & travel insurance", "annual_fee": 4999, "cashback": "2%", "color": "from-sky-600 to-sky-800"},
+        {"id": "student_starter", "name": "Student Starter", "description": "Zero annual fee, perfect for students", "annual_fee": 0, "cashback": "1%", "color": "from-emerald-600 to-emerald-800"},
+        {"id": "business_pro", "name": "Business Pro", "description": "High credit limit with expense tracking", "annual_fee": 3999, "cashback": "2%", "color": "from-purple-600 to-purple-800"},
+        {"id": "signature_black", "name": "Signature Black", "description": "Premium perks with concierge service", "annual_fee": 9999, "cashback": "4%", "color": "from-gray-900 to-black"},
+    ],
+}
+
+# Section name -> field used as the lookup key for that section
+SECTION_KEYS = {
+    "loan_offers": "type",
+    "market": "symbol",
+    "policies": "id",
+    "card_options": "id",
+}
+
+
+class Catalog:
+    """An immutable catalog version with keyed indexes and pre-encoded bodies"""
+
+    def __init__(self, data: dict, version: str = None):
+        missing = [name for name in SECTION_KEYS if name not in data]
+        if missing:
+            raise ValueError(f"Catalog is missing sections: {', '.join(missing)}")
+
+        self.sections = {name: list(data[name]) for name in SECTION_KEYS}
+        self.indexes = {
+            name: {item[key]: item for item in self.sections[name]}
+            for name, key in SECTION_KEYS.items()
+        }
+        self.bodies = {
+            name: json.dumps(items, separators=(",", ":")).encode("utf-8")
+            for name, items in self.sections.items()
+        }
+        self.etags = {
+            name: '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            for name, body in self.bodies.items()
+        }
+        digest = hashlib.sha256(b"".join(self.etags[name].encode() for name in SECTION_KEYS))
+        self.version = version or digest.hexdigest()[:12]
+        self.loaded_at = datetime.utcnow()
+
+    def get(self, section: str, key):
+        return self.indexes[section].get(key)
+
+    @property
+    def loan_offers(self) -> dict:
+        return self.indexes["loan_offers"]
+
+    @property
+    def market(self) -> dict:
+        return self.indexes["market"]
+
+    @property
+    def policies(self) -> dict:
+        return self.indexes["policies"]
+
+    @property
+    def card_options(self) -> dict:
+        return self.indexes["card_options"]
+
+
+def _load_source() -> dict:
+    if CATALOG_PATH and os.path.exists(CATALOG_PATH):
+        with open(CATALOG_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_CATALOG
+
+
+_current = Catalog(_load_source())
+_published_at = None  # Publication this worker last applied
+_task = None
+
+
+def current() -> Catalog:
+    """Return the active catalog version (a single reference read, no locking)"""
+    return _current
+
+
+def reload(data: dict = None, version: str = None) -> Catalog:
+    """Build a new catalog version and swap it in atomically.
+
+    With no data the catalog is re-read from CATALOG_PATH (or the defaults).
+    In-flight requests keep the version they already hold.
+    """
+    global _current
+    new_catalog = Catalog(data if data is not None else _load_source(), version)
+    # Rebinding one global is atomic; readers see the old or the new version
+    _current = new_catalog
+    return new_catalog
+
+
+async def publish(data: dict = None, version: str = None) -> Catalog:
+    """Reload this worker and publish the new version for every other worker.
+
+    The sections themselves are published, not a path, so workers reading a
+    different CATALOG_PATH (or none) still converge on what was loaded here.
+    """
+    global _published_at
+    new_catalog = reload(data, version)
+    published_at = datetime.utcnow()
+    await database.db[PUBLISHED].replace_one(
+        {"_id": "current"},
+        {"version": new_catalog.version, "sections": new_catalog.sections, "published_at": published_at},
+        upsert=True,
+    )
+    _published_at = published_at
+    return new_catalog
+
+
+async def sync() -> bool:
+    """Swap in the published catalog if it is newer than this worker's; True if it was"""
+    global _published_at
+    published = database.db[PUBLISHED]
+    # Poll with the timestamp only; the sections are fetched when they changed
+    head = await published.find_one({"_id": "current"}, projection={"published_at": 1})
+    if not head or head["published_at"] == _published_at:
+        return False
+    doc = await published.find_one({"_id": "current"})
+    reload(doc["sections"], doc["version"])
+    _published_at = doc["published_at"]
+    logger.info(f"Catalog version {doc['version']} loaded")
+    return True
+
+
+async def _sync_logged():
+    try:
+        await sync()
+    except Exception as e:
+        logger.error(f"Catalog sync failed: {e}")
+
+
+async def run():
+    while True:
+        await asyncio.sleep(CATALOG_POLL_SECONDS)
+        await _sync_logged()
+
+
+async def start():
+    """Load the published catalog before serving, then keep polling for new versions"""
+    global _task
+    if _task is None:
+        await _sync_logged()
+        _task = asyncio.create_task(run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def catalog_response(request: Request, section: str) -> Response:
+    """Serve a catalog section with a strong ETag, answering 304 on a match"""
+    catalog = _current
+    etag = catalog.etags[section]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}",
+        "X-Catalog-Version": catalog.version,
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=catalog.bodies[section], media_type="application/json", headers=headers)
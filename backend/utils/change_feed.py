@@ -0,0 +1,160 @@
+# Change Feed for Vitta Bank
+# Tails MongoDB change streams on the collections clients care about and
+# turns each change into a per-user websocket event, so every write path
+# pushes without handler code. Resume tokens are persisted, so a restarted
+# worker picks up where it stopped instead of missing changes.
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import database
+from utils import credit_score
+from websocket_manager import manager
+
+logger = logging.getLogger('python-logstash-logger')
+
+TOKENS = "change_stream_tokens"
+CHANGE_FEED_NAME = os.getenv("CHANGE_FEED_NAME", socket.gethostname())
+TOKEN_SAVE_SECONDS = 1.0
+PUSH_COALESCE_SECONDS = 0.1
+RETRY_BACKOFF_MAX = 30
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Collection -> how to find the owning user without an extra lookup where possible
+WATCHED = {
+    "transactions": {"full_document": None},            # Inserts carry account_id
+    "accounts": {"full_document": None},                # documentKey is the account id
+    "cards": {"full_document": "updateLookup"},         # Status updates need user_id
+    "loans": {"full_document": "updateLookup"},
+}
+
+PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}},
+    {"$project": {
+        "operationType": 1,
+        "documentKey": 1,
+        "fullDocument.user_id": 1,
+        "fullDocument.account_id": 1,
+    }},
+]
+
+_tasks = []
+_pending = {}
+
+
+def event_message(collections) -> str:
+    return json.dumps({"type": "update", "collections": sorted(collections)})
+
+
+async def owner_of(collection: str, change: dict):
+    doc = change.get("fullDocument") or {}
+    if collection in ("cards", "loans"):
+        return doc.get("user_id")
+    account_id = doc.get("account_id") if collection == "transactions" else str(change["documentKey"]["_id"])
+    if not account_id:
+        return None
+    owners = await credit_score.account_owners([account_id])
+    return owners.get(account_id)
+
+
+async def dispatch(collection: str, change: dict):
+    user_id = await owner_of(collection, change)
+    # Only users with an open socket on this worker need an event
+    if user_id and user_id in manager.user_connections:
+        _pending.setdefault(user_id, set()).add(collection)
+
+
+async def flush_pending():
+    """Send at most one event per user per coalescing window"""
+    while True:
+        await asyncio.sleep(PUSH_COALESCE_SECONDS)
+        if not _pending:
+            continue
+        batch = dict(_pending)
+        _pending.clear()
+        for user_id, collections in batch.items():
+            await manager.send_to_user(user_id, event_message(collections))
+
+
+def _token_id(collection: str) -> str:
+    return f"{CHANGE_FEED_NAME}:{collection}"
+
+
+async def load_token(collection: str):
+    doc = await database.db[TOKENS].find_one({"_id": _token_id(collection)})
+    return doc["token"] if doc else None
+
+
+async def save_token(collection: str, token):
+    await database.db[TOKENS].update_one(
+        {"_id": _token_id(collection)},
+        {"$set": {"token": token, "saved_at": time.time()}},
+        upsert=True,
+    )
+
+
+async def watch_collection(collection: str):
+    options = WATCHED[collection]
+    backoff = 1
+    while True:
+        token = await load_token(collection)
+        try:
+            async with database.db[collection].watch(
+                PIPELINE,
+                full_document=options["full_document"],
+                resume_after=token,
+            ) as stream:
+                backoff = 1
+                last_saved = time.monotonic()
+                async for change in stream:
+                    await dispatch(collection, change)
+                    token = stream.resume_token
+                    # Throttled: a crash replays at most a second of refresh events
+                    if time.monotonic() - last_saved >= TOKEN_SAVE_SECONDS:
+                        await save_token(collection, token)
+                        last_saved = time.monotonic()
+        except asyncio.CancelledError:
+            if token:
+                await save_token(collection, token)
+            raise
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAM_HISTORY_LOST:
+                # The oplog rolled past our token; start again from now
+                logger.warning(f"Change stream history lost for {collection}; resuming from now")
+                await database.db[TOKENS].delete_one({"_id": _token_id(collection)})
+                continue
+            logger.error(f"Change stream on {collection} failed: {e}")
+        except PyMongoError as e:
+            logger.error(f"Change stream on {collection} failed: {e}")
+        if token:
+            await save_token(collection, token)
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+
+
+def running() -> bool:
+    return bool(_tasks)
+
+
+async def start() -> bool:
+    # Change streams have the same replica-set requirement as transactions
+    if not await database.supports_transactions():
+        logger.info("Change streams unavailable (standalone MongoDB); real-time push falls back to manual broadcasts")
+        return False
+    _tasks.append(asyncio.create_task(flush_pending()))
+    for collection in WATCHED:
+        _tasks.append(asyncio.create_task(watch_collection(collection)))
+    logger.info(f"Change feed started on {', '.join(WATCHED)}")
+    return True
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
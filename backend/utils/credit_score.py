@@ -0,0 +1,220 @@
+# Credit Score Engine for Vitta Bank
+# Keeps each user's FD and investment totals as a small feature document
+# updated with one $inc per event. Balances move on every transfer and loan
+# figures with the calendar, so both are read live when the score is read
+# instead of being folded in on the ledger write path.
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import database
+import models
+from utils import balance_shards, loan_math
+
+FEATURES = "credit_features"
+# Kept in the feature document; the rest are read live
+STORED_FIELDS = ("fd_total", "investment_value")
+FEATURE_FIELDS = (
+    "total_balance",
+    "active_loan_principal",
+    "fd_total",
+    "investment_value",
+    "repayments_on_time",
+    "repayments_missed",
+)
+
+MIN_SCORE = 300
+MAX_SCORE = 850
+ACCOUNT_OWNER_CACHE_SIZE = 100000
+BUILD_ATTEMPTS = 3
+
+# Accounts never change owner, so account -> user lookups are cached for good
+_account_owners = OrderedDict()
+
+
+def net_assets(features: dict) -> float:
+    return (
+        features.get("total_balance", 0.0)
+        + features.get("fd_total", 0.0)
+        + features.get("investment_value", 0.0)
+        - features.get("active_loan_principal", 0.0)
+    )
+
+
+def compute_score(features: dict) -> int:
+    """Base 500, +1 per 100 of net assets, adjusted for repayment history"""
+    score = 500 + int(net_assets(features) // 100)
+    score += min(features.get("repayments_on_time", 0) * 5, 50)
+    score -= features.get("repayments_missed", 0) * 25
+    return max(MIN_SCORE, min(MAX_SCORE, score))
+
+
+async def apply_deltas(deltas: dict):
+    """Apply {user_id: {feature: delta}} in one bulk $inc.
+
+    Users without a feature document are skipped; their features are built
+    from scratch the first time their score is read. A document still being
+    built takes the delta too, and the build notices it (see _build).
+    """
+    deltas = {user_id: d for user_id, d in deltas.items() if any(d.values())}
+    if not deltas:
+        return
+    await database.db[FEATURES].bulk_write(
+        [UpdateOne({"_id": user_id}, {"$inc": {**d, "version": 1}}) for user_id, d in deltas.items()],
+        ordered=False,
+    )
+
+
+async def apply(user_id: str, **delta):
+    """Single-user form of apply_deltas: one round trip"""
+    if not any(delta.values()):
+        return
+    await database.db[FEATURES].update_one({"_id": user_id}, {"$inc": {**delta, "version": 1}})
+
+
+async def account_owners(account_ids) -> dict:
+    """Map account ids to user ids, hitting Mongo only for unseen accounts"""
+    account_ids = set(account_ids)
+    missing = [a for a in account_ids if a not in _account_owners]
+    if missing:
+        cursor = database.collection(models.Account).find(
+            {"_id": {"$in": [ObjectId(a) for a in missing if ObjectId.is_valid(a)]}},
+            projection={"user_id": 1},
+        )
+        async for doc in cursor:
+            _account_owners[str(doc["_id"])] = doc["user_id"]
+            while len(_account_owners) > ACCOUNT_OWNER_CACHE_SIZE:
+                _account_owners.popitem(last=False)
+    return {a: _account_owners[a] for a in account_ids if a in _account_owners}
+
+
+def forget_accounts(account_ids):
+    for account_id in account_ids:
+        _account_owners.pop(account_id, None)
+
+
+async def apply_account_deltas(field: str, by_account: dict):
+    """Apply {account_id: delta} for one feature, summed per owning user"""
+    if not by_account:
+        return
+    owners = await account_owners(by_account)
+    deltas = {}
+    for account_id, amount in by_account.items():
+        user_id = owners.get(account_id)
+        if user_id:
+            entry = deltas.setdefault(user_id, {field: 0.0})
+            entry[field] += amount
+    await apply_deltas(deltas)
+
+
+async def build_features(user_id: str) -> dict:
+    """Compute a user's stored features from source collections (first read only)"""
+    accounts = await models.Account.find(models.Account.user_id == user_id).to_list()
+    account_ids = [str(a.id) for a in accounts]
+    fds = await models.FixedDeposit.find(
+        {"account_id": {"$in": account_ids}, "status": {"$in": ["active", None]}}
+    ).to_list()
+    investments = await models.Investment.find(models.Investment.user_id == user_id).to_list()
+    return {
+        "fd_total": sum(fd.amount for fd in fds),
+        "investment_value": sum(i.quantity * i.purchase_price for i in investments),
+    }
+
+
+async def _build(user_id: str) -> dict:
+    """Build a user's feature document without losing concurrent deltas.
+
+    A placeholder is inserted first so deltas landing mid-build have a
+    document to $inc (bumping its version). The snapshot is only stored if
+    the version is unchanged since before the sources were read; otherwise
+    it may have missed one of those writes, so the build starts over.
+    """
+    features = database.db[FEATURES]
+    built = None
+    for _ in range(BUILD_ATTEMPTS):
+        try:
+            doc = await features.find_one_and_update(
+                {"_id": user_id},
+                {"$setOnInsert": {"version": 0, "building": True}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            continue  # Another reader inserted the placeholder first
+        if not doc.get("building"):
+            return doc
+        built = await build_features(user_id)
+        doc = await features.find_one_and_update(
+            {"_id": user_id, "version": doc["version"], "building": True},
+            {"$set": {**built, "building": False}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc:
+            return doc
+    # Deltas kept landing; answer from the last snapshot and let a later read store it
+    return built or await build_features(user_id)
+
+
+async def total_balance(user_id: str) -> float:
+    """Live sum of the user's account balances, shards included"""
+    cursor = database.collection(models.Account).find(
+        {"user_id": user_id}, projection={"balance": 1, "balance_shards": 1}
+    )
+    total, sharded = 0.0, []
+    async for account in cursor:
+        total += account.get("balance", 0.0)
+        if account.get("balance_shards") is not None:
+            sharded.append(str(account["_id"]))
+    if sharded:
+        total += sum((await balance_shards.shard_totals(sharded)).values())
+    return total
+
+
+async def loan_features(user_id: str) -> dict:
+    """Outstanding principal and instalments fallen due on active loans.
+
+    Read from the loans themselves on their amortization schedule, the same
+    view the loan schedule and loan-book endpoints take. The bank keeps no
+    record of missed instalments, so none are counted.
+    """
+    cursor = database.collection(models.Loan).find(
+        {"user_id": user_id, "status": "active"},
+        projection={"amount": 1, "interest_rate": 1, "tenure_months": 1, "disbursed_at": 1, "created_at": 1},
+    )
+    loans = [loan async for loan in cursor]
+    if not loans:
+        return {"active_loan_principal": 0.0, "repayments_on_time": 0, "repayments_missed": 0}
+    tenures = [loan.get("tenure_months", 12) for loan in loans]
+    months_paid = np.minimum(loan_math.months_elapsed([loan.get("disbursed_at") or loan["created_at"] for loan in loans]), tenures)
+    outstanding = loan_math.outstanding_principal(
+        [loan["amount"] for loan in loans], [loan["interest_rate"] for loan in loans], tenures, months_paid
+    )
+    return {
+        "active_loan_principal": float(np.sum(outstanding)),
+        "repayments_on_time": int(np.sum(months_paid)),
+        "repayments_missed": 0,
+    }
+
+
+async def get_score(user_id: str) -> dict:
+    doc = await database.db[FEATURES].find_one({"_id": user_id})
+    if doc is None or doc.get("building"):
+        doc = await _build(user_id)
+    features = {field: doc.get(field, 0) for field in STORED_FIELDS}
+    features["total_balance"] = await total_balance(user_id)
+    features.update(await loan_features(user_id))
+    return {
+        "score": compute_score(features),
+        "net_assets": round(net_assets(features), 2),
+        "features": {field: features[field] for field in FEATURE_FIELDS},
+        "scored_at": datetime.utcnow(),
+    }
+
+
+async def forget_user(user_id: str, account_ids=()):
+    await database.db[FEATURES].delete_one({"_id": user_id})
+    forget_accounts(account_ids)
@@ -0,0 +1,287 @@
+# Bulk Customer Import for Vitta Bank
+# Streams a CSV or NDJSON customer file in chunks, hashes passwords across a
+# process pool and writes users, accounts and opening transactions with
+# unordered insert_many batches.
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from email_validator import validate_email, EmailNotValidError
+from pymongo.errors import BulkWriteError
+
+import auth
+import database
+import models
+from utils import number_issuer
+from utils.ledger_events import transactions_written
+
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "1000"))
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_CHUNK = 50  # Passwords per process-pool task
+
+_hash_pool = None
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        # Spawned, not forked: the web worker has Motor and event-loop threads running
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=IMPORT_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+
+def read_records(stream, file_format: str):
+    """Yield (row_number, dict) from a binary CSV or NDJSON stream"""
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if file_format == "csv":
+        for row_number, record in enumerate(csv.DictReader(text), start=1):
+            yield row_number, record
+        return
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, {"_error": f"Invalid JSON: {e.msg}"}
+
+
+def validate_record(record: dict) -> dict:
+    """Normalize one input record; raises ValueError with a readable reason"""
+    if "_error" in record:
+        raise ValueError(record["_error"])
+    try:
+        email = validate_email((record.get("email") or "").strip(), check_deliverability=False).normalized
+    except EmailNotValidError as e:
+        raise ValueError(f"Invalid email: {e}")
+
+    full_name = (record.get("full_name") or "").strip()
+    if not full_name:
+        raise ValueError("full_name is required")
+
+    try:
+        opening_balance = float(record.get("opening_balance") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("opening_balance must be a number")
+    if opening_balance < 500:
+        raise ValueError("Opening balance must be at least 500")
+
+    account_type = (record.get("account_type") or "savings").strip().lower()
+    if account_type not in (models.AccountType.SAVINGS.value, models.AccountType.CURRENT.value):
+        raise ValueError(f"Unknown account_type: {account_type}")
+
+    # Migrated books may already carry bcrypt hashes; those skip re-hashing
+    hashed_password = (record.get("hashed_password") or "").strip()
+    password = record.get("password") or ""
+    if hashed_password:
+        if not hashed_password.startswith("$2"):
+            raise ValueError("hashed_password must be a bcrypt hash")
+    elif not password:
+        raise ValueError("password or hashed_password is required")
+
+    return {
+        "email": email,
+        "full_name": full_name,
+        "password": password,
+        "hashed_password": hashed_password or None,
+        "opening_balance": opening_balance,
+        "account_type": account_type,
+    }
+
+
+async def hash_in_pool(passwords: list) -> list:
+    loop = asyncio.get_running_loop()
+    pool = get_hash_pool()
+    chunks = [passwords[i:i + HASH_CHUNK] for i in range(0, len(passwords), HASH_CHUNK)]
+    results = await asyncio.gather(*(loop.run_in_executor(pool, auth.hash_passwords, chunk) for chunk in chunks))
+    return [h for chunk in results for h in chunk]
+
+
+def _failed_indexes(error: BulkWriteError) -> dict:
+    """Map of index -> error code for rows an unordered insert_many rejected"""
+    return {e["index"]: e.get("code") for e in error.details.get("writeErrors", [])}
+
+
+async def _insert_unordered(document_model, docs: list) -> dict:
+    if not docs:
+        return {}
+    try:
+        await database.collection(document_model).insert_many(docs, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return _failed_indexes(e)
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = []
+        self.errors = []
+        self.welcome_emails = []
+        self.started = time.perf_counter()
+
+    def duplicate(self, row: int, email: str, reason: str):
+        self.duplicates.append({"row": row, "email": email, "reason": reason})
+
+    def error(self, row: int, message: str):
+        self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "duplicate_count": len(self.duplicates),
+            "error_count": len(self.errors),
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "per_second": round(self.imported / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+def validate_chunk(chunk: list, report: ImportReport, seen_emails: set) -> list:
+    """Validate and de-duplicate within the file; returns (row, customer) pairs"""
+    candidates = []
+    for row, record in chunk:
+        try:
+            customer = validate_record(record)
+        except ValueError as e:
+            report.error(row, str(e))
+            continue
+        if customer["email"] in seen_emails:
+            report.duplicate(row, customer["email"], "Duplicate email in file")
+            continue
+        seen_emails.add(customer["email"])
+        candidates.append((row, customer))
+    return candidates
+
+
+def read_chunk(records, batch_size: int) -> list:
+    return [item for _, item in zip(range(batch_size), records)]
+
+
+async def import_chunk(chunk: list, report: ImportReport, seen_emails: set, collect_welcome: bool):
+    # Email validation is CPU work; keep it off the event loop
+    candidates = await asyncio.to_thread(validate_chunk, chunk, report, seen_emails)
+
+    # One $in query against existing users
+    emails = [c["email"] for _, c in candidates]
+    existing = {
+        doc["email"]
+        async for doc in database.collection(models.User).find({"email": {"$in": emails}}, projection={"email": 1})
+    }
+    fresh = []
+    for row, customer in candidates:
+        if customer["email"] in existing:
+            report.duplicate(row, customer["email"], "Email already registered")
+        else:
+            fresh.append((row, customer))
+    if not fresh:
+        return
+
+    to_hash = [c["password"] for _, c in fresh if not c["hashed_password"]]
+    hashes = iter(await hash_in_pool(to_hash))
+    now = datetime.utcnow()
+
+    users = []
+    for _, c in fresh:
+        users.append({
+            "_id": ObjectId(),
+            "email": c["email"],
+            "full_name": c["full_name"],
+            "hashed_password": c["hashed_password"] or next(hashes),
+            "pin_hash": None,
+            "is_active": True,
+            "is_admin": False,
+        })
+    failed = await _insert_unordered(models.User, users)
+    inserted = []
+    for i, ((row, customer), user) in enumerate(zip(fresh, users)):
+        if i in failed:
+            if failed[i] == 11000:
+                report.duplicate(row, customer["email"], "Email already registered")
+            else:
+                report.error(row, f"User insert failed (code {failed[i]})")
+        else:
+            inserted.append((row, customer, user))
+
+    accounts = []
+    for (row, customer, user), account_number in zip(inserted, await number_issuer.account_numbers.take(len(inserted))):
+        accounts.append({
+            "_id": ObjectId(),
+            "user_id": str(user["_id"]),
+            "account_number": account_number,
+            "balance": customer["opening_balance"],
+            "account_type": customer["account_type"],
+        })
+    failed = await _insert_unordered(models.Account, accounts)
+    if failed:
+        # Only pre-issuer account numbers can collide; retry those with fresh numbers
+        retry = [accounts[i] for i in failed if failed[i] == 11000]
+        for account, account_number in zip(retry, await number_issuer.account_numbers.take(len(retry))):
+            account["account_number"] = account_number
+        retry_failed = await _insert_unordered(models.Account, retry)
+        still_failed = {retry[i]["_id"] for i in retry_failed}
+        still_failed |= {accounts[i]["_id"] for i in failed if failed[i] != 11000}
+
+        created = []
+        orphans = []
+        for (row, customer, user), account in zip(inserted, accounts):
+            if account["_id"] in still_failed:
+                report.error(row, "Account creation failed")
+                orphans.append(user["_id"])
+            else:
+                created.append(((row, customer, user), account))
+        if orphans:
+            await database.collection(models.User).delete_many({"_id": {"$in": orphans}})
+        pairs = created
+    else:
+        pairs = list(zip(inserted, accounts))
+
+    transactions = [
+        {
+            "account_id": str(account["_id"]),
+            "amount": customer["opening_balance"],
+            "transaction_type": "deposit",
+            "timestamp": now,
+            "description": "Opening Balance",
+            "related_account_id": None,
+        }
+        for (_, customer, _), account in pairs
+    ]
+    failed = await _insert_unordered(models.Transaction, transactions)
+    await transactions_written(t for i, t in enumerate(transactions) if i not in failed)
+
+    report.imported += len(pairs)
+    if collect_welcome:
+        from utils.email_service import welcome_email
+        for (_, customer, _), account in pairs:
+            report.welcome_emails.append((
+                customer["email"],
+                *welcome_email(customer["full_name"], account["account_number"], customer["opening_balance"])
+            ))
+
+
+async def import_customers(stream, file_format: str, collect_welcome: bool = False, batch_size: int = IMPORT_BATCH) -> ImportReport:
+    report = ImportReport()
+    seen_emails = set()
+    records = read_records(stream, file_format)
+    # Decoding and parsing the upload blocks, so each chunk is read in a thread
+    while chunk := await asyncio.to_thread(read_chunk, records, batch_size):
+        report.rows += len(chunk)
+        await import_chunk(chunk, report, seen_emails, collect_welcome)
+    return report
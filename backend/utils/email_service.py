@@ -14,6 +14,22 @@ SMTP_USER = os.getenv("SMTP_USER", "vittabankpvt@gmail.com")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "nmytjvfuuhxaczzd")
 BANK_NAME = "Vitta Bank"
 
+def build_message(to_email: str, subject: str, html_content: str, attachment_data: bytes = None, attachment_filename: str = None):
+    """Assemble the MIME message; a PDF attachment switches it to multipart/mixed"""
+    msg = MIMEMultipart("mixed" if attachment_data else "alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{BANK_NAME} <{SMTP_USER}>"
+    msg["To"] = to_email
+    msg.attach(MIMEText(html_content, "html"))
+    
+    if attachment_data:
+        pdf_attachment = MIMEBase("application", "pdf")
+        pdf_attachment.set_payload(attachment_data)
+        encoders.encode_base64(pdf_attachment)
+        pdf_attachment.add_header("Content-Disposition", f"attachment; filename={attachment_filename}")
+        msg.attach(pdf_attachment)
+    return msg
+
 def send_email(to_email: str, subject: str, html_content: str):
     """Send email synchronously (use in background tasks)"""
     if not SMTP_USER or not SMTP_PASSWORD:
@@ -21,13 +37,7 @@ def send_email(to_email: str, subject: str, html_content: str):
         return False
     
     try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = f"{BANK_NAME} <{SMTP_USER}>"
-        msg["To"] = to_email
-        
-        html_part = MIMEText(html_content, "html")
-        msg.attach(html_part)
+        msg = build_message(to_email, subject, html_content)
         
         with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
             server.starttls()
@@ -47,21 +57,7 @@ def send_email_with_attachment(to_email: str, subject: str, html_content: str, a
         return False
     
     try:
-        msg = MIMEMultipart("mixed")
-        msg["Subject"] = subject
-        msg["From"] = f"{BANK_NAME} <{SMTP_USER}>"
-        msg["To"] = to_email
-        
-        # HTML body
-        html_part = MIMEText(html_content, "html")
-        msg.attach(html_part)
-        
-        # PDF attachment
-        pdf_attachment = MIMEBase("application", "pdf")
-        pdf_attachment.set_payload(attachment_data)
-        encoders.encode_base64(pdf_attachment)
-        pdf_attachment.add_header("Content-Disposition", f"attachment; filename={attachment_filename}")
-        msg.attach(pdf_attachment)
+        msg = build_message(to_email, subject, html_content, attachment_data, attachment_filename)
         
         with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
             server.starttls()
@@ -74,6 +70,37 @@ def send_email_with_attachment(to_email: str, subject: str, html_content: str, a
         print(f"Failed to send email with attachment: {e}")
         return False
 
+def send_bulk_emails(messages: list):
+    """Send many (to_email, subject, html_content) messages over one SMTP session"""
+    return sum(send_bulk_emails_each(messages))
+
+def send_bulk_emails_each(messages: list) -> list:
+    """Like send_bulk_emails, but returns whether each message was accepted, in order"""
+    results = [False] * len(messages)
+    if not messages:
+        return results
+    if not SMTP_USER or not SMTP_PASSWORD:
+        print("Email credentials not configured. Skipping email.")
+        return results
+    
+    sent = 0
+    try:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            for i, (to_email, subject, html_content) in enumerate(messages):
+                msg = build_message(to_email, subject, html_content)
+                try:
+                    server.sendmail(SMTP_USER, to_email, msg.as_string())
+                    results[i] = True
+                    sent += 1
+                except smtplib.SMTPRecipientsRefused as e:
+                    print(f"Failed to send email to {to_email}: {e}")
+        print(f"Bulk email: sent {sent}/{len(messages)}")
+    except Exception as e:
+        print(f"Failed to send bulk email after {sent}/{len(messages)}: {e}")
+    return results
+
 def send_statement_email(to_email: str, user_name: str, start_date: str, end_date: str, pdf_data: bytes, filename: str):
     """Send account statement PDF via email"""
     content = f"""
@@ -139,8 +166,9 @@ def email_template(content: str):
     """
 
 # Transaction Emails
-def send_transfer_email(to_email: str, user_name: str, amount: float, to_account: str, balance: float):
-    """Send email for outgoing transfer"""
+def transfer_email(user_name: str, amount: float, to_account: str, balance: float, when: datetime = None):
+    """Build (subject, html) for an outgoing transfer"""
+    when = when or datetime.now()
     content = f"""
     <h2 style="color: #f87171; margin-top: 0;">💸 Money Transferred</h2>
     <p>Dear <strong>{user_name}</strong>,</p>
@@ -150,15 +178,21 @@ def send_transfer_email(to_email: str, user_name: str, amount: float, to_account
             <tr><td style="padding: 8px 0; color: #94a3b8;">Amount</td><td style="text-align: right; font-size: 18px; color: #f87171;">-₹{amount:,.2f}</td></tr>
             <tr><td style="padding: 8px 0; color: #94a3b8;">To Account</td><td style="text-align: right;">{to_account}</td></tr>
             <tr><td style="padding: 8px 0; color: #94a3b8;">Available Balance</td><td style="text-align: right; color: #00D4FF;">₹{balance:,.2f}</td></tr>
-            <tr><td style="padding: 8px 0; color: #94a3b8;">Date & Time</td><td style="text-align: right;">{datetime.now().strftime('%d %b %Y, %I:%M %p')}</td></tr>
+            <tr><td style="padding: 8px 0; color: #94a3b8;">Date & Time</td><td style="text-align: right;">{when.strftime('%d %b %Y, %I:%M %p')}</td></tr>
         </table>
     </div>
     <p style="color: #94a3b8; font-size: 13px;">If you did not authorize this transaction, please contact us immediately.</p>
     """
-    return send_email(to_email, "💸 Money Transfer Alert - Vitta Bank", email_template(content))
+    return "💸 Money Transfer Alert - Vitta Bank", email_template(content)
 
-def send_credit_email(to_email: str, user_name: str, amount: float, from_account: str, balance: float):
-    """Send email for incoming transfer"""
+def send_transfer_email(to_email: str, user_name: str, amount: float, to_account: str, balance: float):
+    """Send email for outgoing transfer"""
+    subject, html = transfer_email(user_name, amount, to_account, balance)
+    return send_email(to_email, subject, html)
+
+def credit_email(user_name: str, amount: float, from_account: str, balance: float, when: datetime = None):
+    """Build (subject, html) for an incoming transfer"""
+    when = when or datetime.now()
     content = f"""
     <h2 style="color: #4ade80; margin-top: 0;">💰 Money Received</h2>
     <p>Dear <strong>{user_name}</strong>,</p>
@@ -168,15 +202,53 @@ def send_credit_email(to_email: str, user_name: str, amount: float, from_account
             <tr><td style="padding: 8px 0; color: #94a3b8;">Amount</td><td style="text-align: right; font-size: 18px; color: #4ade80;">+₹{amount:,.2f}</td></tr>
             <tr><td style="padding: 8px 0; color: #94a3b8;">From Account</td><td style="text-align: right;">{from_account}</td></tr>
             <tr><td style="padding: 8px 0; color: #94a3b8;">New Balance</td><td style="text-align: right; color: #00D4FF;">₹{balance:,.2f}</td></tr>
-            <tr><td style="padding: 8px 0; color: #94a3b8;">Date & Time</td><td style="text-align: right;">{datetime.now().strftime('%d %b %Y, %I:%M %p')}</td></tr>
+            <tr><td style="padding: 8px 0; color: #94a3b8;">Date & Time</td><td style="text-align: right;">{when.strftime('%d %b %Y, %I:%M %p')}</td></tr>
+        </table>
+    </div>
+    """
+    return "💰 Money Credited - Vitta Bank", email_template(content)
+
+def send_credit_email(to_email: str, user_name: str, amount: float, from_account: str, balance: float):
+    """Send email for incoming transfer"""
+    subject, html = credit_email(user_name, amount, from_account, balance)
+    return send_email(to_email, subject, html)
+
+def activity_digest_email(user_name: str, events: list, total_count: int, total_debits: float, total_credits: float):
+    """Build (subject, html) summarizing buffered transfer events.
+
+    `events` holds (when, kind, amount, counterparty, balance) rows, newest
+    last; it may be truncated, `total_count` and the totals cover everything.
+    """
+    rows = "".join(
+        f"""<tr>
+            <td style="padding: 6px 0; color: #94a3b8;">{when.strftime('%d %b, %I:%M %p')}</td>
+            <td style="padding: 6px 0;">{"To" if kind == "debit" else "From"} {counterparty}</td>
+            <td style="padding: 6px 0; text-align: right; color: {"#f87171" if kind == "debit" else "#4ade80"};">{"-" if kind == "debit" else "+"}₹{amount:,.2f}</td>
+        </tr>"""
+        for when, kind, amount, counterparty, _ in events
+    )
+    more = total_count - len(events)
+    closing_balance = events[-1][4] if events else 0.0
+    content = f"""
+    <h2 style="color: #00D4FF; margin-top: 0;">📋 Account Activity Summary</h2>
+    <p>Dear <strong>{user_name}</strong>,</p>
+    <p>There were <strong>{total_count}</strong> transfers on your account since our last update:</p>
+    <div style="background: #0B1221; padding: 20px; border-radius: 8px; margin: 20px 0;">
+        <table style="width: 100%; color: #e2e8f0;">
+            <tr><td style="padding: 8px 0; color: #94a3b8;">Money In</td><td style="text-align: right; color: #4ade80;">+₹{total_credits:,.2f}</td></tr>
+            <tr><td style="padding: 8px 0; color: #94a3b8;">Money Out</td><td style="text-align: right; color: #f87171;">-₹{total_debits:,.2f}</td></tr>
+            <tr><td style="padding: 8px 0; color: #94a3b8;">Latest Balance</td><td style="text-align: right; color: #00D4FF;">₹{closing_balance:,.2f}</td></tr>
         </table>
     </div>
+    <table style="width: 100%; color: #e2e8f0; font-size: 13px;">{rows}</table>
+    {f'<p style="color: #94a3b8; font-size: 13px;">…and {more} earlier transfers. Your full history is in the app.</p>' if more > 0 else ""}
+    <p style="color: #94a3b8; font-size: 13px;">If you did not authorize any of these transactions, please contact us immediately.</p>
     """
-    return send_email(to_email, "💰 Money Credited - Vitta Bank", email_template(content))
+    return f"📋 {total_count} transfers on your account - Vitta Bank", email_template(content)
 
 # Loan Emails
-def send_loan_status_email(to_email: str, user_name: str, loan_type: str, amount: float, status: str):
-    """Send email for loan status change"""
+def loan_status_email(user_name: str, loan_type: str, amount: float, status: str):
+    """Build (subject, html) for a loan status change"""
     is_approved = status.lower() == "active"
     emoji = "✅" if is_approved else "❌"
     color = "#4ade80" if is_approved else "#f87171"
@@ -195,11 +267,16 @@ def send_loan_status_email(to_email: str, user_name: str, loan_type: str, amount
     </div>
     {"<p>The loan amount will be credited to your account shortly.</p>" if is_approved else "<p>Please contact us for more information about this decision.</p>"}
     """
-    return send_email(to_email, f"{emoji} Loan {status_text} - Vitta Bank", email_template(content))
+    return f"{emoji} Loan {status_text} - Vitta Bank", email_template(content)
+
+def send_loan_status_email(to_email: str, user_name: str, loan_type: str, amount: float, status: str):
+    """Send email for loan status change"""
+    subject, html = loan_status_email(user_name, loan_type, amount, status)
+    return send_email(to_email, subject, html)
 
 # Card Emails
-def send_card_status_email(to_email: str, user_name: str, card_type: str, card_name: str, status: str, last_four: str):
-    """Send email for card status change"""
+def card_status_email(user_name: str, card_type: str, card_name: str, status: str, last_four: str):
+    """Build (subject, html) for a card status change"""
     status_config = {
         "active": ("✅", "#4ade80", "Approved"),
         "rejected": ("❌", "#f87171", "Rejected"),
@@ -220,7 +297,12 @@ def send_card_status_email(to_email: str, user_name: str, card_type: str, card_n
         </table>
     </div>
     """
-    return send_email(to_email, f"{emoji} Card {status_text} - Vitta Bank", email_template(content))
+    return f"{emoji} Card {status_text} - Vitta Bank", email_template(content)
+
+def send_card_status_email(to_email: str, user_name: str, card_type: str, card_name: str, status: str, last_four: str):
+    """Send email for card status change"""
+    subject, html = card_status_email(user_name, card_type, card_name, status, last_four)
+    return send_email(to_email, subject, html)
 
 # Security Emails
 def send_password_change_email(to_email: str, user_name: str):
@@ -277,8 +359,8 @@ def send_otp_email(to_email: str, user_name: str, otp: str, purpose: str = "Pass
     """
     return send_email(to_email, f"🔐 Your {purpose} OTP - Vitta Bank", email_template(content))
 
-def send_welcome_email(to_email: str, user_name: str, account_number: str, opening_balance: float):
-    """Send welcome email to new users"""
+def welcome_email(user_name: str, account_number: str, opening_balance: float):
+    """Build (subject, html) for the welcome email"""
     content = f"""
     <h2 style="color: #4ade80; margin-top: 0;">🎉 Welcome to Vitta Bank!</h2>
     <p>Dear <strong>{user_name}</strong>,</p>
@@ -300,4 +382,9 @@ def send_welcome_email(to_email: str, user_name: str, account_number: str, openi
     </ul>
     <p style="color: #94a3b8; font-size: 13px; margin-top: 20px;">If you have any questions, our support team is available 24/7 to assist you.</p>
     """
-    return send_email(to_email, "🎉 Welcome to Vitta Bank!", email_template(content))
+    return "🎉 Welcome to Vitta Bank!", email_template(content)
+
+def send_welcome_email(to_email: str, user_name: str, account_number: str, opening_balance: float):
+    """Send welcome email to new users"""
+    subject, html = welcome_email(user_name, account_number, opening_balance)
+    return send_email(to_email, subject, html)
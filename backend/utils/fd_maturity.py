@@ -0,0 +1,177 @@
+# Fixed Deposit Maturity Processor for Vitta Bank
+# Streams matured FDs by (status, maturity_date), computes payouts with NumPy
+# and credits accounts in bounded bulk batches. Each batch is claimed first,
+# so concurrent runs never settle the same FD.
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import UpdateOne
+
+import database
+import models
+from utils import credit_score, ledger
+
+logger = logging.getLogger('python-logstash-logger')
+
+FD_MATURITY_BATCH = int(os.getenv("FD_MATURITY_BATCH", "1000"))
+COMPOUNDING_PER_YEAR = 4  # Quarterly, as for most retail term deposits
+CLAIM_TIMEOUT = timedelta(minutes=10)  # A claim older than this belongs to a run that died
+
+# Legacy FDs were written before the status field existed
+PENDING_STATUSES = ["active", None]
+
+
+def maturity_reference(fd_id) -> str:
+    return f"fd-maturity:{fd_id}"
+
+
+def compute_payouts(amounts, rates, start_dates, maturity_dates):
+    """Maturity values for a batch of FDs with quarterly compounding"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64)
+    days = (
+        np.asarray(maturity_dates, dtype="datetime64[D]") - np.asarray(start_dates, dtype="datetime64[D]")
+    ).astype(np.float64)
+    years = np.maximum(days, 0.0) / 365.0
+    payout = amounts * np.power(1.0 + rates / (100.0 * COMPOUNDING_PER_YEAR), COMPOUNDING_PER_YEAR * years)
+    return np.round(payout, 2)
+
+
+async def _claim(batch: list):
+    """Claim FDs for this run; returns the ones no other run holds"""
+    token = uuid.uuid4().hex
+    fds = database.collection(models.FixedDeposit)
+    stale = datetime.utcnow() - CLAIM_TIMEOUT
+    await fds.update_many(
+        {
+            "_id": {"$in": [fd["_id"] for fd in batch]},
+            "status": {"$in": PENDING_STATUSES},
+            "$or": [{"settle_batch": None}, {"claimed_at": {"$lt": stale}}],
+        },
+        {"$set": {"settle_batch": token, "claimed_at": datetime.utcnow()}},
+    )
+    claimed = {doc["_id"] async for doc in fds.find({"settle_batch": token}, projection={"_id": 1})}
+    return token, [fd for fd in batch if fd["_id"] in claimed]
+
+
+async def _settle_batch(batch: list, now: datetime) -> dict:
+    """Credit accounts and close FDs for one claimed batch.
+
+    Credits go through ledger.credit_batch under each FD's maturity
+    reference, so a batch replayed after a crash credits only the FDs
+    without a ledger row, whatever step it stopped at.
+    """
+    token, batch = await _claim(batch)
+    payouts = compute_payouts(
+        [fd["amount"] for fd in batch],
+        [fd["interest_rate"] for fd in batch],
+        [fd["start_date"] for fd in batch],
+        [fd["maturity_date"] for fd in batch],
+    ) if batch else []
+    settled = []
+    for fd, payout in zip(batch, payouts):
+        if ledger.valid_amount(float(payout)):
+            settled.append((fd, float(payout)))
+        else:
+            # Left claimed; it is retried once the claim times out
+            logger.error(f"FD {fd['_id']} has invalid payout {payout}; not settled")
+    if not settled:
+        return {"processed": 0, "credited": 0, "skipped": len(batch), "payout_total": 0.0}
+
+    written = await ledger.credit_batch([
+        {
+            "account_id": fd["account_id"],
+            "amount": payout,
+            "description": "Fixed Deposit Maturity",
+            "reference": maturity_reference(fd["_id"]),
+        }
+        for fd, payout in settled
+    ])
+    await database.collection(models.FixedDeposit).bulk_write(
+        [
+            UpdateOne(
+                {"_id": fd["_id"], "settle_batch": token},
+                {"$set": {"status": "matured", "payout_amount": payout, "matured_at": now}},
+            )
+            for fd, payout in settled
+        ],
+        ordered=False,
+    )
+
+    principal = {}
+    for fd, _ in settled:
+        principal[fd["account_id"]] = principal.get(fd["account_id"], 0.0) - fd["amount"]
+    await credit_score.apply_account_deltas("fd_total", principal)
+    return {
+        "processed": len(settled),
+        "credited": len(written),
+        "skipped": len(batch) - len(written),
+        "payout_total": sum(payout for _, payout in settled),
+    }
+
+
+async def process_matured_deposits(as_of: datetime = None, batch_size: int = FD_MATURITY_BATCH) -> dict:
+    """Pay out every FD that has matured by `as_of`.
+
+    Safe to re-run at any time: settled FDs leave the (status, maturity_date)
+    range, so an interrupted run simply resumes with whatever is still open.
+    On a replica set each batch is credited in one transaction.
+    """
+    as_of = as_of or datetime.utcnow()
+    stats = {"processed": 0, "credited": 0, "skipped": 0, "payout_total": 0.0, "batches": 0}
+    started = time.perf_counter()
+
+    cursor = database.collection(models.FixedDeposit).find(
+        {"status": {"$in": PENDING_STATUSES}, "maturity_date": {"$lte": as_of}},
+        projection={"account_id": 1, "amount": 1, "interest_rate": 1, "start_date": 1, "maturity_date": 1},
+        sort=[("status", 1), ("maturity_date", 1)],
+        batch_size=batch_size,
+    )
+
+    batch = []
+    async for fd in cursor:
+        batch.append(fd)
+        if len(batch) >= batch_size:
+            await _record_batch(stats, batch, as_of, started)
+            batch = []
+    if batch:
+        await _record_batch(stats, batch, as_of, started)
+
+    elapsed = time.perf_counter() - started
+    stats["payout_total"] = round(stats["payout_total"], 2)
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["per_second"] = round(stats["processed"] / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(f"FD maturity run complete: {stats}")
+    return stats
+
+
+async def _record_batch(stats: dict, batch: list, now: datetime, started: float):
+    batch_started = time.perf_counter()
+    result = await _settle_batch(batch, now)
+    batch_elapsed = time.perf_counter() - batch_started
+
+    stats["batches"] += 1
+    for key in ("processed", "credited", "skipped", "payout_total"):
+        stats[key] += result[key]
+
+    total_elapsed = time.perf_counter() - started
+    logger.info(
+        f"FD maturity batch {stats['batches']}: {result['processed']} FDs in {batch_elapsed:.2f}s "
+        f"({result['processed'] / max(batch_elapsed, 1e-9):.0f}/s, "
+        f"{stats['processed'] / max(total_elapsed, 1e-9):.0f}/s overall)"
+    )
+
+
+async def main():
+    await database.init_db()
+    stats = await process_matured_deposits()
+    print(stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
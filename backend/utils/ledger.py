@@ -0,0 +1,313 @@
+# Ledger Service for Vitta Bank
+# Every balance change goes through debit, credit or move. Balances change
+# with a guarded $inc in find_one_and_update, so a debit can never overdraw
+# however many requests race, and the ledger rows are written in the same
+# session. On a replica set both run in one transaction (retried on write
+# conflicts); a standalone server gets the same two round trips without it.
+#
+# An operation with a reference happens at most once. Its $inc also pushes the
+# reference onto the account's pending_refs, guarded on it being absent, and
+# the marker is pulled once the ledger row exists, so a replay after a crash
+# at any step neither repeats nor loses the balance change.
+import math
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
+import models
+from utils import balance_shards
+from utils.ledger_events import transactions_written
+
+# Fields callers need after a balance change, returned instead of the whole account
+ACCOUNT_PROJECTION = {"user_id": 1, "account_number": 1, "balance": 1, "balance_shards": 1}
+
+_use_transactions = None
+
+
+class AccountNotFound(Exception):
+    pass
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def by_id(account_id, user_id: str = None) -> dict:
+    """Account filter by id, optionally scoped to its owner"""
+    query = {"_id": ObjectId(str(account_id))}
+    if user_id is not None:
+        query["user_id"] = user_id
+    return query
+
+
+def by_owner(user_id: str) -> dict:
+    """Account filter for a user's primary (oldest) account"""
+    return {"user_id": user_id}
+
+
+def ledger_row(account_id: str, amount: float, transaction_type: str, description: str, related_account_id: str = None, reference: str = None, timestamp: datetime = None) -> dict:
+    return {
+        "account_id": account_id,
+        "amount": amount,
+        "transaction_type": transaction_type,
+        "timestamp": timestamp or datetime.utcnow(),
+        "description": description,
+        "related_account_id": related_account_id,
+        "reference": reference,
+    }
+
+
+async def _transactions_enabled() -> bool:
+    global _use_transactions
+    if _use_transactions is None:
+        _use_transactions = await database.supports_transactions()
+    return _use_transactions
+
+
+async def _run(operation, session=None):
+    """Run `operation(session)` in the caller's session, a new transaction, or neither"""
+    if session is not None or not await _transactions_enabled():
+        return await operation(session)
+    async with await database.client.start_session() as new_session:
+        return await new_session.with_transaction(operation)
+
+
+def valid_amount(amount) -> bool:
+    # A negative amount would turn a debit into a credit and the other way round
+    return isinstance(amount, (int, float)) and math.isfinite(amount) and amount > 0
+
+
+def _check_amount(amount):
+    if not valid_amount(amount):
+        raise ValueError("Amount must be a positive number")
+
+
+async def _apply(query: dict, delta: float, session, reference: str = None) -> dict:
+    """One guarded $inc; None when the account is missing or would go negative"""
+    update = {"$inc": {"balance": delta}}
+    if reference:
+        query = {**query, "pending_refs": {"$ne": reference}}
+        update["$push"] = {"pending_refs": reference}
+    elif delta > 0:
+        # Hot accounts take credits on a random sub-balance instead
+        target = await balance_shards.credit_target(query)
+        if target:
+            return await balance_shards.credit(target, delta, session=session)
+    if delta < 0:
+        query = {**query, "balance": {"$gte": -delta}}
+    return await database.collection(models.Account).find_one_and_update(
+        query,
+        update,
+        projection=ACCOUNT_PROJECTION,
+        sort=[("_id", 1)],
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+
+
+async def _replayed(query: dict, reference: str, session):
+    """The account, if an earlier attempt already applied `reference` to it"""
+    if not reference:
+        return None
+    return await database.collection(models.Account).find_one(
+        {**query, "pending_refs": reference}, projection=ACCOUNT_PROJECTION, sort=[("_id", 1)], session=session
+    )
+
+
+async def _recorded(query: dict, reference: str, session):
+    """The account, if `reference` already has its ledger row (the operation is complete)"""
+    if not reference:
+        return None
+    if not await database.collection(models.Transaction).find_one({"reference": reference}, projection={"_id": 1}, session=session):
+        return None
+    account = await database.collection(models.Account).find_one(query, projection=ACCOUNT_PROJECTION, sort=[("_id", 1)], session=session)
+    if account is None:
+        raise AccountNotFound()
+    await _settle_refs([(account["_id"], reference)], session)
+    return account
+
+
+async def _insert_rows(rows: list, session) -> list:
+    """Insert ledger rows; returns the ones that were new"""
+    try:
+        await database.collection(models.Transaction).insert_many(rows, ordered=False, session=session)
+    except BulkWriteError as e:
+        # Inside a transaction the error has aborted it; only a standalone replay can meet its own rows
+        if session is not None:
+            raise
+        duplicates = set()
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            duplicates.add(error["index"])
+        return [row for i, row in enumerate(rows) if i not in duplicates]
+    return rows
+
+
+async def _settle_refs(marks: list, session):
+    """Pull (account _id, reference) markers once their ledger rows exist"""
+    if marks:
+        await database.collection(models.Account).bulk_write(
+            [UpdateOne({"_id": account_id}, {"$pull": {"pending_refs": reference}}) for account_id, reference in marks],
+            ordered=False,
+            session=session,
+        )
+
+
+async def _take(query: dict, amount: float, session, reference: str = None) -> dict:
+    """Guarded debit; a sharded account that runs short is swept once and retried"""
+    account = await _apply(query, -amount, session, reference)
+    if account is None:
+        account = await _replayed(query, reference, session)
+    if account is None:
+        # Only reached when the guarded update matched nothing
+        found = await database.collection(models.Account).find_one(
+            query, projection={"balance_shards": 1}, sort=[("_id", 1)], session=session
+        )
+        if not found:
+            raise AccountNotFound()
+        if found.get("balance_shards") is None or not await balance_shards.sweep(str(found["_id"]), session=session):
+            raise InsufficientFunds()
+        account = await _apply(query, -amount, session, reference)
+        if account is None:
+            raise InsufficientFunds()
+    if account.get("balance_shards") is not None:
+        account["balance"] = await balance_shards.visible_balance(str(account["_id"]), fresh=True, session=session)
+    return account
+
+
+async def debit(query: dict, amount: float, description: str, transaction_type: str = "withdrawal", reference: str = None, session=None) -> dict:
+    """Take `amount` from the account matching `query` and record it.
+
+    Returns the account's id, owner, number and new balance. Raises
+    InsufficientFunds or AccountNotFound without changing anything, and
+    ValueError for an amount that isn't positive.
+    """
+    _check_amount(amount)
+    rows = []
+
+    async def operation(s):
+        rows[:] = []
+        account = await _recorded(query, reference, s)
+        if account:
+            return account
+        account = await _take(query, amount, s, reference)
+        rows[:] = await _insert_rows([ledger_row(str(account["_id"]), -amount, transaction_type, description, reference=reference)], s)
+        if reference:
+            await _settle_refs([(account["_id"], reference)], s)
+        return account
+
+    account = await _run(operation, session)
+    await transactions_written(rows)
+    return account
+
+
+async def credit(query: dict, amount: float, description: str, transaction_type: str = "deposit", reference: str = None, session=None) -> dict:
+    """Add `amount` to the account matching `query` and record it; raises AccountNotFound"""
+    _check_amount(amount)
+    rows = []
+
+    async def operation(s):
+        rows[:] = []
+        account = await _recorded(query, reference, s)
+        if account:
+            return account
+        account = await _apply(query, amount, s, reference) or await _replayed(query, reference, s)
+        if account is None:
+            raise AccountNotFound()
+        rows[:] = await _insert_rows([ledger_row(str(account["_id"]), amount, transaction_type, description, reference=reference)], s)
+        if reference:
+            await _settle_refs([(account["_id"], reference)], s)
+        return account
+
+    account = await _run(operation, session)
+    await transactions_written(rows)
+    return account
+
+
+async def move(from_query: dict, to_query: dict, amount: float, debit_description: str, credit_description: str, transaction_type: str = "transfer", session=None):
+    """Debit one account and credit another; both ledger rows go in one insert.
+
+    Returns (sender, receiver) as debit/credit do. Without transactions a
+    failed credit reverses the debit, so money is never left in flight.
+    """
+    _check_amount(amount)
+    rows = []
+
+    async def operation(s):
+        sender = await _take(from_query, amount, s)
+        receiver = await _apply(to_query, amount, s)
+        if receiver is None:
+            if s is None:
+                await database.collection(models.Account).update_one({"_id": sender["_id"]}, {"$inc": {"balance": amount}})
+            raise AccountNotFound()
+        rows[:] = [
+            ledger_row(str(sender["_id"]), -amount, transaction_type, debit_description, related_account_id=str(receiver["_id"])),
+            ledger_row(str(receiver["_id"]), amount, transaction_type, credit_description, related_account_id=str(sender["_id"])),
+        ]
+        await database.collection(models.Transaction).insert_many(rows, session=s)
+        return sender, receiver
+
+    sender, receiver = await _run(operation, session)
+    await transactions_written(rows)
+    return sender, receiver
+
+
+async def credit_batch(entries: list, transaction_type: str = "deposit", session=None) -> list:
+    """Credit many accounts with one bulk write and one ledger insert.
+
+    `entries` are dicts of account_id, amount, description and a unique
+    reference. Entries already recorded by an earlier call, and entries whose
+    account no longer exists, are skipped. Returns the ledger rows written.
+    """
+    for entry in entries:
+        _check_amount(entry["amount"])
+    accounts = database.collection(models.Account)
+    rows = []
+
+    async def operation(s):
+        rows[:] = []
+        references = [entry["reference"] for entry in entries]
+        done = {
+            doc["reference"]
+            async for doc in database.collection(models.Transaction).find(
+                {"reference": {"$in": references}}, projection={"reference": 1}, session=s
+            )
+        }
+        todo = [entry for entry in entries if entry["reference"] not in done]
+        if not todo:
+            return
+        await accounts.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": ObjectId(entry["account_id"]), "pending_refs": {"$ne": entry["reference"]}},
+                    {"$inc": {"balance": entry["amount"]}, "$push": {"pending_refs": entry["reference"]}},
+                )
+                for entry in todo
+            ],
+            ordered=False,
+            session=s,
+        )
+        # Every existing account now carries its markers, from this call or an interrupted one
+        marked = set()
+        async for doc in accounts.find(
+            {"_id": {"$in": list({ObjectId(entry["account_id"]) for entry in todo})}},
+            projection={"pending_refs": 1},
+            session=s,
+        ):
+            marked.update((str(doc["_id"]), reference) for reference in doc.get("pending_refs", []))
+        applied = [entry for entry in todo if (entry["account_id"], entry["reference"]) in marked]
+        if not applied:
+            return
+        rows[:] = await _insert_rows(
+            [ledger_row(entry["account_id"], entry["amount"], transaction_type, entry["description"], reference=entry["reference"]) for entry in applied],
+            s,
+        )
+        await _settle_refs([(ObjectId(entry["account_id"]), entry["reference"]) for entry in applied], s)
+
+    await _run(operation, session)
+    await transactions_written(rows)
+    return rows
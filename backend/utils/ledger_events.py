@@ -0,0 +1,12 @@
+# Ledger Events for Vitta Bank
+# Single fan-out point for derived data that must follow every ledger write.
+# Beanie's Insert hook covers Transaction.create(); bulk writers that bypass
+# it (insert_many, raw collections) call transactions_written themselves.
+from utils import analytics
+
+
+async def transactions_written(transactions):
+    transactions = list(transactions)
+    if not transactions:
+        return
+    await analytics.record_transactions(transactions)
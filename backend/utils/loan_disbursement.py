@@ -0,0 +1,84 @@
+# Loan Disbursement for Vitta Bank
+# Approval marks a loan active with disbursement_pending set, then credits
+# the borrower's primary account through the ledger under a per-loan
+# reference and clears the flag. The reference makes the credit happen at
+# most once, so loans left pending by a crash are simply disbursed again. A
+# loan that can't be credited is flagged and left out, never failing the rest.
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import database
+import models
+from utils import ledger
+
+logger = logging.getLogger('python-logstash-logger')
+
+# Younger pending loans are most likely still being disbursed by their request
+RETRY_AFTER = timedelta(minutes=5)
+
+
+def disbursement_reference(loan_id) -> str:
+    return f"loan-disbursement:{loan_id}"
+
+
+async def disburse(loans: list) -> int:
+    """Credit approved loans to their borrowers' primary accounts; returns the credits written"""
+    invalid = [loan for loan in loans if not ledger.valid_amount(loan["amount"])]
+    if invalid:
+        logger.error(f"Loan disbursement skipped {len(invalid)} loans with invalid amounts: {[str(loan['_id']) for loan in invalid]}")
+        await database.collection(models.Loan).update_many(
+            {"_id": {"$in": [loan["_id"] for loan in invalid]}},
+            {"$set": {"disbursement_pending": False, "disbursement_error": "Invalid amount"}},
+        )
+        loans = [loan for loan in loans if ledger.valid_amount(loan["amount"])]
+    if not loans:
+        return 0
+    # Primary account = oldest, the same rule as ledger.by_owner
+    account_by_user = {}
+    cursor = database.collection(models.Account).find(
+        {"user_id": {"$in": list({loan["user_id"] for loan in loans})}},
+        projection={"user_id": 1},
+        sort=[("_id", 1)],
+    )
+    async for account in cursor:
+        account_by_user.setdefault(account["user_id"], str(account["_id"]))
+
+    rows = await ledger.credit_batch([
+        {
+            "account_id": account_by_user[loan["user_id"]],
+            "amount": loan["amount"],
+            "description": f"Loan Disbursement: {loan['loan_type']}",
+            "reference": disbursement_reference(loan["_id"]),
+        }
+        for loan in loans if loan["user_id"] in account_by_user
+    ])
+    # Borrowers without an account get nothing, as before; the loan is settled either way
+    await database.collection(models.Loan).update_many(
+        {"_id": {"$in": [loan["_id"] for loan in loans]}},
+        {"$set": {"disbursement_pending": False}},
+    )
+    return len(rows)
+
+
+async def retry_pending(now: datetime = None) -> dict:
+    """Disburse approved loans a crashed request left uncredited"""
+    now = now or datetime.utcnow()
+    cursor = database.collection(models.Loan).find(
+        {"status": "active", "disbursement_pending": True, "disbursed_at": {"$lt": now - RETRY_AFTER}},
+        projection={"user_id": 1, "amount": 1, "loan_type": 1},
+    )
+    loans = [loan async for loan in cursor]
+    credited = await disburse(loans)
+    if loans:
+        logger.info(f"Loan disbursement retry: {len(loans)} pending, {credited} credited")
+    return {"pending": len(loans), "credited": credited}
+
+
+async def main():
+    await database.init_db()
+    print(await retry_pending())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+# Loan Math for Vitta Bank
+# EMI, amortization and outstanding principal, vectorized with NumPy so a
+# whole batch of loans is computed in one pass instead of a Python loop.
+import numpy as np
+from datetime import datetime
+
+
+def _as_arrays(principal, annual_rate, tenure_months):
+    principal = np.asarray(principal, dtype=np.float64)
+    rate = np.asarray(annual_rate, dtype=np.float64) / 1200.0  # monthly rate
+    tenure = np.maximum(np.asarray(tenure_months, dtype=np.int64), 1)
+    return np.broadcast_arrays(principal, rate, tenure)
+
+
+def emi(principal, annual_rate, tenure_months):
+    """Equated monthly instalment for one loan or an array of loans"""
+    principal, rate, tenure = _as_arrays(principal, annual_rate, tenure_months)
+    growth = np.power(1.0 + rate, tenure)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = principal * rate * growth / (growth - 1.0)
+    return np.where(rate > 0, amortized, principal / tenure)
+
+
+def outstanding_principal(principal, annual_rate, tenure_months, months_paid):
+    """Principal still owed after `months_paid` instalments (closed form)"""
+    principal, rate, tenure = _as_arrays(principal, annual_rate, tenure_months)
+    paid = np.clip(np.asarray(months_paid, dtype=np.int64), 0, tenure)
+    instalment = emi(principal, rate * 1200.0, tenure)
+    growth = np.power(1.0 + rate, paid)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amortized = principal * growth - instalment * (growth - 1.0) / rate
+    balance = np.where(rate > 0, amortized, principal - instalment * paid)
+    # Clamp float noise on fully repaid loans
+    return np.where(paid >= tenure, 0.0, np.maximum(balance, 0.0))
+
+
+def amortization_schedules(principal, annual_rate, tenure_months):
+    """Month-by-month schedules for a batch of loans.
+
+    Returns a dict of 2-D arrays shaped (loans, max_tenure). Months past a
+    loan's own tenure are zero-filled.
+    """
+    principal, rate, tenure = _as_arrays(
+        np.atleast_1d(principal), np.atleast_1d(annual_rate), np.atleast_1d(tenure_months)
+    )
+    months = np.arange(1, int(tenure.max()) + 1)
+    active = months[None, :] <= tenure[:, None]
+
+    opening = outstanding_principal(
+        principal[:, None], rate[:, None] * 1200.0, tenure[:, None], months[None, :] - 1
+    )
+    interest = opening * rate[:, None]
+    instalment = np.broadcast_to(emi(principal, rate * 1200.0, tenure)[:, None], opening.shape)
+    # The final instalment clears whatever principal remains
+    principal_part = np.where(months[None, :] == tenure[:, None], opening, instalment - interest)
+    payment = principal_part + interest
+    closing = opening - principal_part
+
+    return {
+        "month": months,
+        "payment": np.where(active, payment, 0.0),
+        "interest": np.where(active, interest, 0.0),
+        "principal": np.where(active, principal_part, 0.0),
+        "balance": np.where(active, np.maximum(closing, 0.0), 0.0),
+    }
+
+
+def amortization_schedule(principal: float, annual_rate: float, tenure_months: int) -> list:
+    """Schedule for a single loan as a list of rows"""
+    schedules = amortization_schedules([principal], [annual_rate], [tenure_months])
+    n = max(int(tenure_months), 1)
+    return [
+        {
+            "month": int(schedules["month"][i]),
+            "payment": round(float(schedules["payment"][0, i]), 2),
+            "principal": round(float(schedules["principal"][0, i]), 2),
+            "interest": round(float(schedules["interest"][0, i]), 2),
+            "balance": round(float(schedules["balance"][0, i]), 2),
+        }
+        for i in range(n)
+    ]
+
+
+def months_elapsed(start, now=None):
+    """Whole months between start date(s) and now, vectorized over datetime64"""
+    now = np.datetime64(now or datetime.utcnow(), "M")
+    start = np.asarray(start, dtype="datetime64[M]")
+    return np.maximum((now - start).astype(np.int64), 0)
+
+
+class LoanBookSummary:
+    """Accumulates loan-book totals chunk by chunk while streaming a cursor"""
+
+    def __init__(self):
+        self.loan_count = 0
+        self.total_principal = 0.0
+        self.total_outstanding = 0.0
+        self.interest_due_next_month = 0.0
+        self.emi_due_next_month = 0.0
+
+    def add_chunk(self, principal, annual_rate, tenure_months, start_dates, now=None):
+        if len(principal) == 0:
+            return
+        principal, rate, tenure = _as_arrays(principal, annual_rate, tenure_months)
+        paid = np.minimum(months_elapsed(start_dates, now), tenure)
+        balance = outstanding_principal(principal, rate * 1200.0, tenure, paid)
+        running = paid < tenure
+
+        self.loan_count += len(principal)
+        self.total_principal += float(principal.sum())
+        self.total_outstanding += float(balance.sum())
+        self.interest_due_next_month += float((balance * rate).sum())
+        self.emi_due_next_month += float(np.where(running, emi(principal, rate * 1200.0, tenure), 0.0).sum())
+
+    def as_dict(self) -> dict:
+        return {
+            "loan_count": self.loan_count,
+            "total_principal": round(self.total_principal, 2),
+            "total_outstanding": round(self.total_outstanding, 2),
+            "interest_due_next_month": round(self.interest_due_next_month, 2),
+            "emi_due_next_month": round(self.emi_due_next_month, 2),
+        }
@@ -0,0 +1,159 @@
+# Notification Digests for Vitta Bank
+# Transfer alerts are buffered per recipient in notification_events and sent
+# as one email per recipient per window, so a busy account gets a summary
+# instead of an SMTP session for every transfer. Security mail (OTP, password
+# and PIN changes) never passes through here and is still sent immediately.
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+import database
+import models
+from utils.email_service import send_bulk_emails_each, transfer_email, credit_email, activity_digest_email
+
+logger = logging.getLogger('python-logstash-logger')
+
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", "60"))
+DIGEST_MAX_ROWS = 50  # Newest transfers listed in a digest; totals still cover all
+DIGEST_SEND_BATCH = 200  # Messages per SMTP session
+CLAIM_TIMEOUT = timedelta(minutes=10)  # Events claimed by a flush that died are retried after this
+DIGEST_MAX_AGE = timedelta(days=1)  # Unsent events older than this are dropped instead of retried
+
+_task = None
+
+
+def debit_event(to_email: str, user_name: str, amount: float, to_account: str, balance: float) -> dict:
+    return _event(to_email, user_name, "debit", amount, to_account, balance)
+
+
+def credit_event(to_email: str, user_name: str, amount: float, from_account: str, balance: float) -> dict:
+    return _event(to_email, user_name, "credit", amount, from_account, balance)
+
+
+def _event(to_email, user_name, kind, amount, counterparty, balance) -> dict:
+    return {
+        "to_email": to_email,
+        "user_name": user_name,
+        "kind": kind,
+        "amount": float(amount),
+        "counterparty": counterparty,
+        "balance": float(balance),
+        "created_at": datetime.utcnow(),
+        "digest_batch": None,
+        "claimed_at": None,
+    }
+
+
+async def queue(events: list):
+    """Buffer transfer events until the next flush"""
+    if events:
+        await database.collection(models.NotificationEvent).insert_many(events, ordered=False)
+
+
+def _local(utc: datetime) -> datetime:
+    # Stored in UTC; the single-event emails have always shown server-local time
+    return utc.replace(tzinfo=timezone.utc).astimezone()
+
+
+def digest_message(docs: list):
+    """(to_email, subject, html) for one recipient's events, oldest first"""
+    last = docs[-1]
+    if len(docs) == 1:
+        build = transfer_email if last["kind"] == "debit" else credit_email
+        return (last["to_email"], *build(last["user_name"], last["amount"], last["counterparty"], last["balance"], _local(last["created_at"])))
+
+    debits = sum(d["amount"] for d in docs if d["kind"] == "debit")
+    credits = sum(d["amount"] for d in docs if d["kind"] == "credit")
+    rows = [
+        (_local(d["created_at"]), d["kind"], d["amount"], d["counterparty"], d["balance"])
+        for d in docs[-DIGEST_MAX_ROWS:]
+    ]
+    return (last["to_email"], *activity_digest_email(last["user_name"], rows, len(docs), debits, credits))
+
+
+async def _send(events, pending: list) -> int:
+    """Send (message, event ids) pairs and delete the events of each message SMTP accepted"""
+    # smtplib blocks, so each batch gets its own thread
+    results = await asyncio.to_thread(send_bulk_emails_each, [message for message, _ in pending])
+    mailed = [event_id for (_, ids), ok in zip(pending, results) if ok for event_id in ids]
+    if mailed:
+        await events.delete_many({"_id": {"$in": mailed}})
+    return sum(results)
+
+
+async def flush(now: datetime = None) -> dict:
+    """Send one email per recipient for everything buffered up to `now`.
+
+    Each flush claims its events with a fresh batch id, so several workers
+    can flush at once without mailing the same event twice. Only events
+    whose email SMTP accepted are deleted; the rest are released for the
+    next flush, until they are older than DIGEST_MAX_AGE.
+    """
+    now = now or datetime.utcnow()
+    events = database.collection(models.NotificationEvent)
+    batch_id = uuid4().hex
+    claimed = await events.update_many(
+        {
+            "$or": [{"digest_batch": None}, {"claimed_at": {"$lt": now - CLAIM_TIMEOUT}}],
+            "created_at": {"$lte": now},
+        },
+        {"$set": {"digest_batch": batch_id, "claimed_at": now}},
+    )
+    if not claimed.modified_count:
+        return {"events": 0, "recipients": 0, "sent": 0}
+
+    cursor = events.find({"digest_batch": batch_id}, sort=[("to_email", 1), ("created_at", 1)])
+    pending = []
+    recipients = sent = 0
+    docs = []
+    async for doc in cursor:
+        if docs and doc["to_email"] != docs[-1]["to_email"]:
+            pending.append((digest_message(docs), [d["_id"] for d in docs]))
+            docs = []
+        docs.append(doc)
+        if len(pending) >= DIGEST_SEND_BATCH:
+            recipients += len(pending)
+            sent += await _send(events, pending)
+            pending = []
+    if docs:
+        pending.append((digest_message(docs), [d["_id"] for d in docs]))
+    if pending:
+        recipients += len(pending)
+        sent += await _send(events, pending)
+
+    expired = await events.delete_many({"digest_batch": batch_id, "created_at": {"$lt": now - DIGEST_MAX_AGE}})
+    if expired.deleted_count:
+        logger.warning(f"Dropped {expired.deleted_count} transfer alerts that could not be sent for {DIGEST_MAX_AGE}")
+    # Whatever SMTP didn't take is claimable again on the next flush
+    await events.update_many({"digest_batch": batch_id}, {"$set": {"digest_batch": None, "claimed_at": None}})
+    return {"events": claimed.modified_count, "recipients": recipients, "sent": sent}
+
+
+async def run():
+    while True:
+        await asyncio.sleep(DIGEST_WINDOW_SECONDS)
+        try:
+            stats = await flush()
+            if stats["events"]:
+                logger.info(f"Notification digest flush: {stats}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Notification digest flush failed: {e}")
+
+
+async def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(run())
+
+
+async def stop():
+    # Unsent events stay in Mongo; the next worker to flush picks them up
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
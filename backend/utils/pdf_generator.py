@@ -8,6 +8,72 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
 from io import BytesIO
 from datetime import datetime
 
+# Bump whenever the statement layout changes; cached statements are keyed on it
+TEMPLATE_VERSION = "1"
+
+# Styles are built once per process; generate_statement_pdf only reads them
+styles = getSampleStyleSheet()
+
+title_style = ParagraphStyle(
+    'CustomTitle',
+    parent=styles['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#00D4FF'),
+    spaceAfter=12,
+    alignment=TA_CENTER
+)
+
+subtitle_style = ParagraphStyle(
+    'Subtitle',
+    parent=styles['Normal'],
+    fontSize=10,
+    textColor=colors.HexColor('#64748b'),
+    alignment=TA_CENTER
+)
+
+header_style = ParagraphStyle(
+    'Header',
+    parent=styles['Heading2'],
+    fontSize=14,
+    textColor=colors.HexColor('#1e293b'),
+    spaceAfter=6
+)
+
+footer_style = ParagraphStyle(
+    'Footer',
+    parent=styles['Normal'],
+    fontSize=8,
+    textColor=colors.HexColor('#94a3b8'),
+    alignment=TA_CENTER
+)
+
+account_table_style = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f1f5f9')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#1e293b')),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
+])
+
+txn_table_style = TableStyle([
+    # Header row
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0B1221')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    # Data rows
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
+    # Alternating row colors
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
+    # Amount column right-aligned
+    ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
+])
+
 def generate_statement_pdf(
     account_holder: str,
     account_number: str,
@@ -23,34 +89,6 @@ def generate_statement_pdf(
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
     elements = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#00D4FF'),
-        spaceAfter=12,
-        alignment=TA_CENTER
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#64748b'),
-        alignment=TA_CENTER
-    )
-    
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e293b'),
-        spaceAfter=6
-    )
-    
     # Bank Header
     elements.append(Paragraph("🏦 VITTA BANK", title_style))
     elements.append(Paragraph("Your Trusted Banking Partner", subtitle_style))
@@ -71,15 +109,7 @@ def generate_statement_pdf(
     ]
     
     account_table = Table(account_data, colWidths=[2.5*inch, 4*inch])
-    account_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f1f5f9')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#1e293b')),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-    ]))
+    account_table.setStyle(account_table_style)
     elements.append(account_table)
     elements.append(Spacer(1, 30))
     
@@ -116,22 +146,7 @@ def generate_statement_pdf(
             ])
         
         txn_table = Table(txn_data, colWidths=[1.2*inch, 2.8*inch, 1*inch, 1.5*inch])
-        txn_table.setStyle(TableStyle([
-            # Header row
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0B1221')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            # Data rows
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#e2e8f0')),
-            # Alternating row colors
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8fafc')]),
-            # Amount column right-aligned
-            ('ALIGN', (3, 0), (3, -1), 'RIGHT'),
-        ]))
+        txn_table.setStyle(txn_table_style)
         elements.append(txn_table)
     else:
         elements.append(Paragraph("No transactions found for this period.", styles['Normal']))
@@ -139,13 +154,6 @@ def generate_statement_pdf(
     elements.append(Spacer(1, 40))
     
     # Footer
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.HexColor('#94a3b8'),
-        alignment=TA_CENTER
-    )
     elements.append(Paragraph("This is a computer-generated statement and does not require a signature.", footer_style))
     elements.append(Paragraph(f"Generated on {datetime.now().strftime('%d %b %Y at %I:%M %p')}", footer_style))
     elements.append(Paragraph("© Vitta Bank Pvt. Ltd. All rights reserved.", footer_style))
@@ -153,3 +161,7 @@ def generate_statement_pdf(
     doc.build(elements)
     buffer.seek(0)
     return buffer
+
+def render_statement(fields: dict) -> bytes:
+    """generate_statement_pdf as plain bytes, for rendering in worker processes"""
+    return generate_statement_pdf(**fields).getvalue()
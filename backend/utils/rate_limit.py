@@ -0,0 +1,282 @@
+# Admission Control for Vitta Bank
+# Token-bucket rate limits per user or per client IP (and, on credential
+# routes, per targeted account as well), plus concurrency
+# bulkheads for expensive routes. Over-limit requests get a fast 429 with
+# Retry-After instead of queueing bcrypt or PDF work behind everyone else.
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+
+import auth
+
+logger = logging.getLogger('python-logstash-logger')
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+MEMORY_SWEEP_EVERY = 10000
+TARGET_BODY_LIMIT = 16 * 1024  # Larger bodies aren't parsed for a target
+
+# (method, path, scope, tokens per second, burst). Scope "user" falls back
+# to the client IP when the request carries no valid token.
+PER_MINUTE = 1 / 60
+RATE_RULES = [
+    ("POST", "/auth/login", "ip", 10 * PER_MINUTE, 10),
+    ("POST", "/auth/register", "ip", 5 * PER_MINUTE, 5),
+    ("POST", "/auth/refresh", "ip", 30 * PER_MINUTE, 30),
+    ("POST", "/auth/forgot-password", "ip", 5 * PER_MINUTE, 5),
+    ("POST", "/auth/verify-reset-otp", "ip", 10 * PER_MINUTE, 10),
+    ("POST", "/auth/reset-password", "ip", 5 * PER_MINUTE, 5),
+    # PIN- and password-guarded actions: each one is a bcrypt verify
+    ("POST", "/auth/verify-pin", "user", 20 * PER_MINUTE, 10),
+    ("POST", "/auth/set-pin", "user", 5 * PER_MINUTE, 5),
+    ("POST", "/auth/change-password", "user", 5 * PER_MINUTE, 5),
+    ("POST", "/auth/change-password-with-otp", "user", 5 * PER_MINUTE, 5),
+    ("POST", "/accounts/transfer", "user", 30 * PER_MINUTE, 10),
+    ("POST", "/accounts/fixed-deposit", "user", 20 * PER_MINUTE, 10),
+    ("POST", "/investments/invest", "user", 20 * PER_MINUTE, 10),
+    ("POST", "/investments/sell", "user", 20 * PER_MINUTE, 10),
+    ("POST", "/insurance/buy", "user", 20 * PER_MINUTE, 10),
+    ("POST", "/loans/apply", "user", 10 * PER_MINUTE, 5),
+    # Everything else: generous, just stops runaway clients
+    ("*", "*", "user", 50, 100),
+]
+
+# (method, path, JSON body field, tokens per second, burst). A second bucket
+# keyed on the account a credential request targets, so guesses spread over
+# many IPs still run out; a request needs a token from both buckets.
+TARGET_RULES = [
+    ("POST", "/auth/login", "email", 10 * PER_MINUTE, 10),
+    ("POST", "/auth/forgot-password", "email", 3 * PER_MINUTE, 3),
+    ("POST", "/auth/verify-reset-otp", "email", 10 * PER_MINUTE, 10),
+    ("POST", "/auth/reset-password", "email", 5 * PER_MINUTE, 5),
+]
+
+# (method, path, max concurrent requests per worker)
+BULKHEAD_RULES = [
+    ("GET", "/accounts/{id}/statement", int(os.getenv("STATEMENT_CONCURRENCY", "4"))),
+    ("GET", "/accounts/{id}/transactions/export", int(os.getenv("EXPORT_CONCURRENCY", "8"))),
+    ("GET", "/auth/users", 2),
+    ("GET", "/auth/stats", 2),
+    ("GET", "/auth/deletion-requests", 2),
+    ("GET", "/loans/admin/all", 2),
+    ("GET", "/loans/admin/summary", 2),
+    ("GET", "/cards/admin/all", 2),
+]
+
+
+def compile_path(path: str):
+    if path == "*":
+        return None
+    return re.compile("^" + re.sub(r"\\{[^/]+\\}", "[^/]+", re.escape(path)) + "$")
+
+
+class MemoryBuckets:
+    """Single-process token buckets; state is lost on restart"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.calls = 0
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0):
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+
+        self.calls += 1
+        if self.calls % MEMORY_SWEEP_EVERY == 0:
+            self.sweep(now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def sweep(self, now: float):
+        # A bucket that has been idle long enough to refill can be forgotten
+        for key, (tokens, updated) in list(self.buckets.items()):
+            if now - updated > 3600:
+                del self.buckets[key]
+
+
+# Refill, spend and persist in one atomic step. Uses the server clock so
+# workers with skewed clocks still agree.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every worker through one Lua script"""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+        self.fallback = MemoryBuckets()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0):
+        try:
+            allowed, retry = await self.script(keys=[f"ratelimit:{key}"], args=[rate, burst, cost])
+            return bool(int(allowed)), float(retry)
+        except Exception as e:
+            # Redis trouble must not take the API down; limit per worker until it recovers
+            logger.error(f"Rate limit backend unavailable, using in-memory buckets: {e}")
+            return await self.fallback.take(key, rate, burst, cost)
+
+
+class Bulkhead:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+def client_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def bearer_identity(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                # Cheap on repeat requests: verified claims are cached
+                return auth.decode_access_token(token)
+    return None
+
+
+async def read_target(receive, field: str):
+    """(receive that replays the body, normalized `field` from a JSON body or None)"""
+    messages = []
+    body = b""
+    more = True
+    while more and len(body) <= TARGET_BODY_LIMIT:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+
+    if more:
+        return replay, None
+    try:
+        value = json.loads(body).get(field)
+    except (ValueError, AttributeError):
+        return replay, None
+    if not isinstance(value, str) or not value.strip():
+        return replay, None
+    # Keys outlive the request in Redis; don't keep the address itself there
+    return replay, hashlib.sha256(value.strip().lower().encode()).hexdigest()
+
+
+async def too_many_requests(send, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControl:
+    """Pure ASGI middleware, so bulkhead slots stay held until a streamed body has finished"""
+
+    def __init__(self, app, backend=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.app = app
+        self.enabled = enabled
+        self.backend = backend or (RedisBuckets() if RATE_LIMIT_BACKEND == "redis" else MemoryBuckets())
+        self.rate_rules = [(method, compile_path(path), path, scope, rate, burst) for method, path, scope, rate, burst in RATE_RULES]
+        self.target_rules = {(method, path): (field, rate, burst) for method, path, field, rate, burst in TARGET_RULES}
+        self.bulkheads = [(method, compile_path(path), path, Bulkhead(limit)) for method, path, limit in BULKHEAD_RULES]
+
+    def match_rate_rule(self, method: str, path: str):
+        for rule_method, pattern, name, scope, rate, burst in self.rate_rules:
+            if rule_method in ("*", method) and (pattern is None or pattern.match(path)):
+                return name, scope, rate, burst
+        return None
+
+    def match_bulkhead(self, method: str, path: str):
+        for rule_method, pattern, name, bulkhead in self.bulkheads:
+            if rule_method == method and pattern.match(path):
+                return bulkhead
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        rule = self.match_rate_rule(method, path)
+        if rule:
+            name, rule_scope, rate, burst = rule
+            identity = bearer_identity(scope) if rule_scope == "user" else None
+            key = f"{name}:{'user:' + identity if identity else 'ip:' + client_ip(scope)}"
+            allowed, retry_after = await self.backend.take(key, rate, burst)
+            if not allowed:
+                await too_many_requests(send, "Too many requests. Please slow down.", retry_after)
+                return
+
+        target_rule = self.target_rules.get((method, path))
+        if target_rule:
+            field, rate, burst = target_rule
+            receive, target = await read_target(receive, field)
+            if target:
+                allowed, retry_after = await self.backend.take(f"{path}:target:{target}", rate, burst)
+                if not allowed:
+                    await too_many_requests(send, "Too many attempts for this account. Please try again later.", retry_after)
+                    return
+
+        bulkhead = self.match_bulkhead(method, path)
+        if bulkhead is None:
+            await self.app(scope, receive, send)
+            return
+        if not bulkhead.try_acquire():
+            await too_many_requests(send, "Server busy. Please retry shortly.", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
@@ -0,0 +1,43 @@
+# Lean Read Models for Vitta Bank
+# List endpoints fetch only their response schema's fields as raw dicts and
+# render them with orjson, skipping Beanie document hydration and the second
+# round of response_model validation.
+import orjson
+from fastapi.responses import JSONResponse
+
+import database
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class ReadModel:
+    """Projection and defaults derived once from a response schema"""
+
+    def __init__(self, schema):
+        fields = schema.model_fields
+        self.projection = {name: 1 for name in fields if name != "id"}
+        self.defaults = {
+            name: field.default
+            for name, field in fields.items()
+            if name != "id" and not field.is_required()
+        }
+
+    def row(self, doc: dict) -> dict:
+        row = {"id": str(doc.pop("_id")), **doc}
+        for name, default in self.defaults.items():
+            row.setdefault(name, default)
+        return row
+
+
+async def fetch_rows(document_model, read_model: ReadModel, query: dict, sort=None) -> list:
+    cursor = database.collection(document_model).find(query, projection=read_model.projection, sort=sort)
+    return [read_model.row(doc) async for doc in cursor]
+
+
+async def list_response(document_model, read_model: ReadModel, query: dict, sort=None) -> FastJSONResponse:
+    return FastJSONResponse(await fetch_rows(document_model, read_model, query, sort))
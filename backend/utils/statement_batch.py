@@ -0,0 +1,264 @@
+# Month-End Statement Run for Vitta Bank
+# Streams every account in _id order, reads each batch's transactions for the
+# period through the (account_id, timestamp) index, renders PDFs across a
+# process pool and writes them under STATEMENT_OUTPUT_DIR/<YYYY-MM>/. Progress
+# is checkpointed per batch, so an interrupted run resumes where it stopped.
+# An account whose statement fails to render is recorded on the run and
+# skipped; the rest of the run carries on.
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from bson import ObjectId
+
+import database
+import models
+from utils import balance_shards, transaction_archive
+from utils.pdf_generator import render_statement
+
+logger = logging.getLogger('python-logstash-logger')
+
+STATEMENT_OUTPUT_DIR = os.getenv("STATEMENT_OUTPUT_DIR", "statements")
+STATEMENT_BATCH = int(os.getenv("STATEMENT_BATCH", "200"))
+STATEMENT_BATCH_WORKERS = int(os.getenv("STATEMENT_BATCH_WORKERS", str(os.cpu_count() or 2)))
+
+RUNS = "statement_runs"
+
+_render_pool = None
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        # Spawned, not forked: the parent has Motor and event-loop threads running
+        _render_pool = ProcessPoolExecutor(
+            max_workers=STATEMENT_BATCH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _render_pool
+
+
+def previous_month(now: datetime = None):
+    """(start, end) of the last full calendar month; end is exclusive"""
+    now = now or datetime.utcnow()
+    end = datetime(now.year, now.month, 1)
+    start = datetime(end.year - 1, 12, 1) if end.month == 1 else datetime(end.year, end.month - 1, 1)
+    return start, end
+
+
+def write_statement(fields: dict, path: str) -> int:
+    """Render one statement and write it atomically; runs in a pool worker"""
+    pdf_bytes = render_statement(fields)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return len(pdf_bytes)
+
+
+async def _period_rows(account_ids: list, start: datetime, end: datetime) -> dict:
+    """account_id -> newest-first transactions in [start, end), one indexed query per batch and tier"""
+    rows = {account_id: [] for account_id in account_ids}
+    for collection, bounds in await transaction_archive.tiers(start, end, inclusive_end=False):
+        cursor = collection.find(
+            {"account_id": {"$in": account_ids}, "timestamp": bounds},
+            projection={"_id": 0, "account_id": 1, "timestamp": 1, "description": 1, "transaction_type": 1, "amount": 1},
+            sort=[("account_id", 1), ("timestamp", -1)],
+        )
+        async for txn in cursor:
+            rows[txn["account_id"]].append(txn)
+    return rows
+
+
+async def _net_since(account_ids: list, since: datetime) -> dict:
+    """account_id -> sum of amounts at or after `since`, to wind balances back to period end"""
+    net = {}
+    for collection, bounds in await transaction_archive.tiers(since):
+        pipeline = [
+            {"$match": {"account_id": {"$in": account_ids}, "timestamp": bounds}},
+            {"$group": {"_id": "$account_id", "net": {"$sum": "$amount"}}},
+        ]
+        async for doc in collection.aggregate(pipeline):
+            net[doc["_id"]] = net.get(doc["_id"], 0.0) + doc["net"]
+    return net
+
+
+async def prepare_batch(accounts: list, start: datetime, end: datetime, out_dir: str) -> list:
+    """(fields, path) render jobs for one batch of accounts"""
+    account_ids = [str(a["_id"]) for a in accounts]
+    user_ids = {ObjectId(a["user_id"]) for a in accounts if ObjectId.is_valid(a["user_id"])}
+    names = {
+        str(u["_id"]): u["full_name"]
+        async for u in database.collection(models.User).find({"_id": {"$in": list(user_ids)}}, projection={"full_name": 1})
+    }
+    rows = await _period_rows(account_ids, start, end)
+    later = await _net_since(account_ids, end)
+    shards = await balance_shards.shard_totals(account_ids)
+
+    start_label = start.strftime('%d %b %Y')
+    end_label = datetime.fromordinal(end.toordinal() - 1).strftime('%d %b %Y')
+    jobs = []
+    for account, account_id in zip(accounts, account_ids):
+        transactions = rows[account_id]
+        closing_balance = account.get("balance", 0.0) + shards.get(account_id, 0.0) - later.get(account_id, 0.0)
+        fields = {
+            "account_holder": names.get(account["user_id"], "Account Holder"),
+            "account_number": account["account_number"],
+            "opening_balance": closing_balance - sum(t["amount"] for t in transactions),
+            "closing_balance": closing_balance,
+            "transactions": transactions,
+            "start_date": start_label,
+            "end_date": end_label,
+        }
+        jobs.append((fields, os.path.join(out_dir, f"{account['account_number']}.pdf")))
+    return jobs
+
+
+async def render_batch(jobs: list) -> dict:
+    """Render a batch; a statement that fails is reported in "failed", not raised"""
+    global _render_pool
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, write_statement, fields, path) for fields, path in jobs),
+        return_exceptions=True,
+    )
+    written = [(fields, size) for (fields, _), size in zip(jobs, results) if not isinstance(size, BaseException)]
+    failed = [
+        {"account_number": fields["account_number"], "error": repr(error)}
+        for (fields, _), error in zip(jobs, results) if isinstance(error, BaseException)
+    ]
+    for failure in failed:
+        logger.error(f"Statement for account {failure['account_number']} failed: {failure['error']}")
+    if any(isinstance(error, BrokenProcessPool) for error in results) and _render_pool is pool:
+        # A worker died (e.g. OOM); the next batch gets a fresh pool
+        _render_pool = None
+    return {
+        "statements": len(written),
+        "transactions": sum(len(fields["transactions"]) for fields, _ in written),
+        "bytes": sum(size for _, size in written),
+        "failed": failed,
+    }
+
+
+async def run_statements(start: datetime = None, end: datetime = None, output_dir: str = STATEMENT_OUTPUT_DIR, batch_size: int = STATEMENT_BATCH, restart: bool = False) -> dict:
+    """Write a statement for every account for [start, end), the previous month by default.
+
+    The run is checkpointed in statement_runs under the period's id. A re-run
+    skips batches that were already written and returns the stored stats of
+    a completed run unless `restart` is set.
+    """
+    if start is None or end is None:
+        start, end = previous_month()
+    run_id = f"{start:%Y%m%d}-{end:%Y%m%d}"
+    out_dir = os.path.join(output_dir, f"{start:%Y-%m}" if start.day == 1 else run_id)
+    os.makedirs(out_dir, exist_ok=True)
+
+    runs = database.db[RUNS]
+    if restart:
+        await runs.delete_one({"_id": run_id})
+    run = await runs.find_one({"_id": run_id}) or {}
+    if run.get("completed_at"):
+        return run["stats"]
+
+    stats = run.get("stats") or {"accounts": 0, "statements": 0, "transactions": 0, "bytes": 0, "failed": 0, "batches": 0}
+    stats.setdefault("failed", 0)
+    resume_after = run.get("last_account_id")
+    await runs.update_one(
+        {"_id": run_id},
+        {"$set": {"output_dir": out_dir}, "$setOnInsert": {"started_at": datetime.utcnow(), "stats": stats}},
+        upsert=True,
+    )
+    if resume_after:
+        logger.info(f"Statement run {run_id} resuming after account {resume_after} ({stats['accounts']} done)")
+
+    started = time.perf_counter()
+    done_at_start = stats["accounts"]
+    cursor = database.collection(models.Account).find(
+        {"_id": {"$gt": resume_after}} if resume_after else {},
+        projection={"user_id": 1, "account_number": 1, "balance": 1},
+        sort=[("_id", 1)],
+        batch_size=batch_size,
+    )
+
+    async def checkpoint(accounts: list, rendering: asyncio.Future):
+        result = await rendering
+        stats["accounts"] += len(accounts)
+        stats["batches"] += 1
+        for key in ("statements", "transactions", "bytes"):
+            stats[key] += result[key]
+        stats["failed"] += len(result["failed"])
+        update = {"$set": {"last_account_id": accounts[-1]["_id"], "stats": stats}}
+        if result["failed"]:
+            update["$push"] = {"failures": {"$each": result["failed"]}}
+        await runs.update_one({"_id": run_id}, update)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Statement run {run_id} batch {stats['batches']}: {stats['accounts']} accounts "
+            f"({(stats['accounts'] - done_at_start) / max(elapsed, 1e-9):.0f}/s)"
+        )
+
+    # Batch k renders in the pool while batch k+1 is read from Mongo
+    in_flight = None
+
+    async def submit(accounts: list):
+        nonlocal in_flight
+        jobs = await prepare_batch(accounts, start, end, out_dir)
+        previous, in_flight = in_flight, (accounts, asyncio.ensure_future(render_batch(jobs)))
+        if previous:
+            await checkpoint(*previous)
+
+    batch = []
+    try:
+        async for account in cursor:
+            batch.append(account)
+            if len(batch) >= batch_size:
+                await submit(batch)
+                batch = []
+        if batch:
+            await submit(batch)
+    except BaseException:
+        # Never leave a batch rendering unobserved; it isn't checkpointed, so a re-run redoes it
+        if in_flight:
+            await asyncio.gather(in_flight[1], return_exceptions=True)
+        raise
+    if in_flight:
+        await checkpoint(*in_flight)
+
+    elapsed = time.perf_counter() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["per_second"] = round((stats["accounts"] - done_at_start) / elapsed, 1) if elapsed > 0 else 0.0
+    await runs.update_one({"_id": run_id}, {"$set": {"stats": stats, "completed_at": datetime.utcnow()}})
+    logger.info(f"Statement run {run_id} complete: {stats}")
+    return stats
+
+
+def parse_month(value: str):
+    """(start, end) for a YYYY-MM month; end is exclusive"""
+    start = datetime.strptime(value, "%Y-%m")
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Write month-end statements for every account")
+    parser.add_argument("--month", help="YYYY-MM (default: last full month)")
+    parser.add_argument("--output", default=STATEMENT_OUTPUT_DIR)
+    parser.add_argument("--batch-size", type=int, default=STATEMENT_BATCH)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    start, end = parse_month(args.month) if args.month else previous_month()
+    await database.init_db()
+    stats = await run_statements(start, end, args.output, args.batch_size, args.restart)
+    print(stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
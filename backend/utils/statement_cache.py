@@ -0,0 +1,175 @@
+# Statement Cache for Vitta Bank
+# Rendered statement PDFs are stored on local disk under a content key:
+# account, period, the newest transaction in the period, the balances shown
+# and the template version. A repeat download is served from disk with no
+# query or render, and each distinct statement is emailed only once.
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+import database
+import models
+from utils import transaction_archive
+from utils.pdf_generator import TEMPLATE_VERSION
+
+STATEMENT_CACHE_DIR = os.getenv("STATEMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "vitta_statements"))
+STATEMENT_CACHE_MAX_BYTES = int(os.getenv("STATEMENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+EVICT_TO = 0.9  # Eviction trims the cache to this fraction of the limit
+# Statements idle this long are dropped; same as the statement_emails TTL index in models.py
+STATEMENT_CACHE_MAX_AGE = 30 * 86400
+EVICT_EVERY = 3600  # Seconds between age sweeps when the cache is under its size limit
+
+logger = logging.getLogger('python-logstash-logger')
+
+# Bytes written by this process since the last scan; a scan resets it to the true size
+_cache_bytes = None
+_evicted_at = 0.0
+
+
+async def period_fingerprint(account_id: str, start_date: datetime, end_date: datetime):
+    """(newest transaction id, count) for the period, both answered by the history index.
+
+    The ledger is append-only, so any new or aged-out row changes one of them.
+    """
+    newest = None
+    async for doc in transaction_archive.find(account_id, start_date, end_date, projection={"_id": 1}, limit=1):
+        newest = str(doc["_id"])
+    return (newest, await transaction_archive.count(account_id, start_date, end_date))
+
+
+def statement_key(account_id: str, start_label: str, end_label: str, fingerprint: tuple, account_holder: str, closing_balance: float) -> str:
+    # Period labels are what the PDF prints, so a moving default window reuses one entry per day
+    parts = [TEMPLATE_VERSION, account_id, start_label, end_label, *map(str, fingerprint), account_holder, f"{closing_balance:.2f}"]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(STATEMENT_CACHE_DIR, f"{key}.pdf")
+
+
+def _read(key: str):
+    path = _path(key)
+    try:
+        os.utime(path)
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+async def lookup(key: str):
+    """Bytes of a cached statement, or None; a hit refreshes its LRU position.
+
+    The bytes are read here rather than handed out as a path, since another
+    worker may evict the file before a response could stream it.
+    """
+    return await asyncio.to_thread(_read, key)
+
+
+async def store(key: str, pdf_bytes: bytes):
+    """Cache a rendered statement off the event loop; returns its path, or None if the disk write failed"""
+    return await asyncio.to_thread(_store, key, pdf_bytes)
+
+
+def _store(key: str, pdf_bytes: bytes):
+    global _cache_bytes
+    path = _path(key)
+    try:
+        os.makedirs(STATEMENT_CACHE_DIR, exist_ok=True)
+        # Write then rename, so a concurrent reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=STATEMENT_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Statement cache write failed: {e}")
+        return None
+
+    if _cache_bytes is None:
+        _cache_bytes = _scan_size()
+    else:
+        _cache_bytes += len(pdf_bytes)
+    if _cache_bytes > STATEMENT_CACHE_MAX_BYTES or time.time() - _evicted_at > EVICT_EVERY:
+        evict()
+    return path
+
+
+def _entries():
+    with os.scandir(STATEMENT_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".pdf"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another worker mid-scan
+                yield entry.path, stat.st_mtime, stat.st_size
+
+
+def _scan_size() -> int:
+    return sum(size for _, _, size in _entries())
+
+
+def evict():
+    """Drop statements idle for STATEMENT_CACHE_MAX_AGE, then least recently used
+    ones until the cache is under EVICT_TO of its limit.
+
+    Workers sharing the directory all see the same mtimes, so they agree on
+    which files are oldest.
+    """
+    global _cache_bytes, _evicted_at
+    _evicted_at = time.time()
+    entries = sorted(_entries(), key=lambda e: e[1])
+    total = sum(size for _, _, size in entries)
+    target = STATEMENT_CACHE_MAX_BYTES * EVICT_TO
+    for path, mtime, size in entries:
+        if total <= target and mtime >= _evicted_at - STATEMENT_CACHE_MAX_AGE:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    _cache_bytes = total
+
+
+async def claim_email(key: str, user_id: str) -> bool:
+    """True when this download should email the statement.
+
+    Every download records itself on the statement's claim, which keeps the
+    claim alive as long as the cached file; only the first download (or the
+    first after a failed send) gets to email it.
+    """
+    claims = database.collection(models.StatementEmail)
+    now = datetime.utcnow()
+    claim = await claims.find_one_and_update(
+        {"_id": key},
+        {"$set": {"seen_at": now}, "$setOnInsert": {"user_id": user_id, "emailed_at": None}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if claim.get("emailed_at") is not None:
+        return False
+    result = await claims.update_one({"_id": key, "emailed_at": None}, {"$set": {"emailed_at": now}})
+    return result.modified_count == 1
+
+
+async def release_email(key: str):
+    """Let the next download retry an email that failed to send"""
+    await database.collection(models.StatementEmail).update_one({"_id": key}, {"$set": {"emailed_at": None}})
+
+
+async def forget_user(user_id: str):
+    """Remove a deleted user's cached statements; every cached statement has a claim"""
+    claims = database.collection(models.StatementEmail)
+    async for claim in claims.find({"user_id": user_id}, projection={"_id": 1}):
+        try:
+            os.remove(_path(claim["_id"]))
+        except FileNotFoundError:
+            pass
+    await claims.delete_many({"user_id": user_id})
@@ -0,0 +1,106 @@
+# Statement Rendering Service for Vitta Bank
+# ReportLab is CPU-bound, so statements are rendered in a pool of worker
+# processes that import pdf_generator, and build its styles, once at start-up.
+# The pool's call queue is the job queue; a semaphore caps the jobs each web
+# worker has in flight, so a burst of large statements waits here instead of
+# stalling the event loop.
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from utils.pdf_generator import render_statement
+
+logger = logging.getLogger('python-logstash-logger')
+
+STATEMENT_RENDER_WORKERS = int(os.getenv("STATEMENT_RENDER_WORKERS", str(min(4, os.cpu_count() or 2))))
+STATEMENT_RENDER_CONCURRENCY = int(os.getenv("STATEMENT_RENDER_CONCURRENCY", str(STATEMENT_RENDER_WORKERS * 2)))
+
+RENDER_SECONDS = Histogram(
+    "statement_render_seconds",
+    "Time to render a statement PDF in the worker pool, including queueing in the pool",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+RENDER_WAITING = Gauge("statement_render_waiting", "Statement renders waiting for a concurrency slot")
+RENDER_IN_FLIGHT = Gauge("statement_render_in_flight", "Statement renders submitted to the worker pool")
+RENDER_FAILURES = Counter("statement_render_failures_total", "Statement renders that raised")
+
+_pool = None
+_slots = asyncio.Semaphore(STATEMENT_RENDER_CONCURRENCY)
+
+
+def _warm():
+    # Importing the generator builds the shared style sheet in each worker
+    import utils.pdf_generator  # noqa: F401
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned, not forked: the web worker has Motor and event-loop threads running
+        _pool = ProcessPoolExecutor(
+            max_workers=STATEMENT_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm,
+        )
+    return _pool
+
+
+async def render(**fields) -> bytes:
+    """Render a statement (generate_statement_pdf's arguments) to PDF bytes"""
+    global _pool
+    RENDER_WAITING.inc()
+    async with _slots:
+        RENDER_WAITING.dec()
+        RENDER_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_pool(), render_statement, fields)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next job
+            RENDER_FAILURES.inc()
+            _pool = None
+            raise
+        except Exception:
+            RENDER_FAILURES.inc()
+            raise
+        finally:
+            RENDER_SECONDS.observe(time.perf_counter() - started)
+            RENDER_IN_FLIGHT.dec()
+
+
+async def start():
+    """Spawn and warm every worker before the first statement is requested.
+
+    The pool only spawns a process when a job finds no idle worker, so one
+    job per worker is submitted at once and awaited; each new process runs
+    _warm before taking its job.
+    """
+    global _pool
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    try:
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(STATEMENT_RENDER_WORKERS)))
+    except BrokenProcessPool as e:
+        # Serve anyway; the first render starts a fresh pool
+        logger.error(f"Statement render pool failed to start: {e}")
+        _pool = None
+        return
+    logger.info(f"Statement render pool warm: {len(set(pids))} workers")
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,229 @@
+# Transaction Tiering for Vitta Bank
+# Rows older than TRANSACTION_HOT_DAYS move out of `transactions` into monthly
+# archive collections (transactions_archive_YYYYMM). A watermark records where
+# the hot tier starts, and readers route each time range to the tier that owns
+# it, so the hot collection and its indexes only hold recent data.
+#
+# Time-series collections were ruled out: they can't carry the unique
+# reference index, the text index or the change streams `transactions` uses.
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import BulkWriteError
+
+import database
+import models
+
+logger = logging.getLogger('python-logstash-logger')
+
+TRANSACTION_HOT_DAYS = int(os.getenv("TRANSACTION_HOT_DAYS", "180"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "5000"))
+ARCHIVE_PREFIX = "transactions_archive_"
+TIERS = "transaction_tiers"
+WATERMARK_ID = "watermark"
+WATERMARK_CACHE_SECONDS = 60
+
+_cached = (None, -WATERMARK_CACHE_SECONDS)  # (tiers doc, monotonic load time)
+
+# Mirrors the read indexes on `transactions` (history, counterparty and text search)
+ARCHIVE_INDEXES = [
+    IndexModel([("account_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("account_id", ASCENDING), ("related_account_id", ASCENDING), ("timestamp", DESCENDING)]),
+    IndexModel([("account_id", ASCENDING), ("description", TEXT)], name="account_description_text"),
+]
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + 1, 1, 1) if dt.month == 12 else datetime(dt.year, dt.month + 1, 1)
+
+
+def archive_name(month: datetime) -> str:
+    return f"{ARCHIVE_PREFIX}{month:%Y%m}"
+
+
+async def _tier_state(refresh: bool = False) -> dict:
+    global _cached
+    doc, loaded_at = _cached
+    if refresh or time.monotonic() - loaded_at >= WATERMARK_CACHE_SECONDS:
+        doc = await database.db[TIERS].find_one({"_id": WATERMARK_ID}) or {}
+        _cached = (doc, time.monotonic())
+    return doc
+
+
+async def tiers(start: datetime = None, end: datetime = None, inclusive_end: bool = True, newest_first: bool = True) -> list:
+    """(collection, timestamp filter) pairs covering [start, end], newest tier first.
+
+    Rows below the watermark are read only from archives and rows at or
+    above it only from `transactions`, so a row being moved is never seen
+    twice or missed.
+    """
+    bounds = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lte" if inclusive_end else "$lt"] = end
+
+    state = await _tier_state()
+    mark = state.get("archived_before")
+    hot = database.collection(models.Transaction)
+    if not mark:
+        return [(hot, bounds)]
+
+    result = []
+    if end is None or end >= mark:
+        result.append((hot, {**bounds, "$gte": max(start, mark) if start else mark}))
+    if start is None or start < mark:
+        for key in sorted(state.get("months", []), reverse=True):
+            month = datetime.strptime(key, "%Y%m")
+            if month >= mark or (start and next_month(month) <= start) or (end and month > end):
+                continue
+            result.append((database.db[archive_name(month)], {**bounds, "$lt": min(end, mark) if end and not inclusive_end else mark}))
+    return result if newest_first else result[::-1]
+
+
+async def find(account_id: str, start: datetime = None, end: datetime = None, newest_first: bool = True, projection: dict = None, limit: int = 0, batch_size: int = 0):
+    """Async iterator over one account's transactions across every tier, in time order"""
+    direction = DESCENDING if newest_first else ASCENDING
+    remaining = limit
+    for collection, bounds in await tiers(start, end, newest_first=newest_first):
+        query = {"account_id": account_id}
+        if bounds:
+            query["timestamp"] = bounds
+        cursor = collection.find(
+            query,
+            projection=projection,
+            sort=[("timestamp", direction), ("_id", direction)],
+            limit=remaining,
+            batch_size=batch_size,
+        )
+        async for doc in cursor:
+            yield doc
+            if limit:
+                remaining -= 1
+                if not remaining:
+                    return
+
+
+async def count(account_id: str, start: datetime = None, end: datetime = None) -> int:
+    total = 0
+    for collection, bounds in await tiers(start, end):
+        query = {"account_id": account_id}
+        if bounds:
+            query["timestamp"] = bounds
+        total += await collection.count_documents(query)
+    return total
+
+
+async def count_all() -> int:
+    """Transactions across every tier, each counted once even while a month is being moved"""
+    total = 0
+    for collection, bounds in await tiers():
+        total += await collection.count_documents({"timestamp": bounds} if bounds else {})
+    return total
+
+
+async def delete_accounts(account_ids: list):
+    """Remove archived rows for deleted accounts (the hot tier is cleared by the caller)"""
+    state = await _tier_state(refresh=True)
+    for key in state.get("months", []):
+        await database.db[archive_name(datetime.strptime(key, "%Y%m"))].delete_many({"account_id": {"$in": account_ids}})
+
+
+async def _copy_month(month: datetime) -> int:
+    """Copy one month of hot rows into its archive; safe to repeat"""
+    archive = database.db[archive_name(month)]
+    await archive.create_indexes(ARCHIVE_INDEXES)
+    cursor = database.collection(models.Transaction).find(
+        {"timestamp": {"$gte": month, "$lt": next_month(month)}},
+        batch_size=ARCHIVE_BATCH,
+    )
+    copied = 0
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= ARCHIVE_BATCH:
+            copied += await _insert_new(archive, batch)
+            batch = []
+    if batch:
+        copied += await _insert_new(archive, batch)
+    await database.db[TIERS].update_one({"_id": WATERMARK_ID}, {"$addToSet": {"months": f"{month:%Y%m}"}}, upsert=True)
+    return copied
+
+
+async def _insert_new(archive, docs: list) -> int:
+    # _id is kept, so rows copied by an earlier, interrupted run are duplicates
+    try:
+        await archive.insert_many(docs, ordered=False)
+        return len(docs)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+        return len(docs) - len(e.details.get("writeErrors", []))
+
+
+async def archive_transactions(now: datetime = None, hot_days: int = TRANSACTION_HOT_DAYS) -> dict:
+    """Move whole months older than `hot_days` into archive collections.
+
+    Months are copied first, then the watermark is raised. Hot rows below
+    the watermark are deleted only once it has been published for longer
+    than readers cache it, which is normally on the following run.
+    """
+    now = now or datetime.utcnow()
+    cutoff = month_start(now - timedelta(days=hot_days))
+    hot = database.collection(models.Transaction)
+    state = await _tier_state(refresh=True)
+    mark = state.get("archived_before")
+    stats = {"copied": 0, "deleted": 0, "months": [], "archived_before": mark}
+    for key in state.get("months", []):
+        # Archives written before an index was added pick it up here
+        await database.db[archive_name(datetime.strptime(key, "%Y%m"))].create_indexes(ARCHIVE_INDEXES)
+
+    # 1. Drop hot rows every reader already routes to the archives
+    if mark and state.get("set_at") and state["set_at"] <= now - timedelta(seconds=2 * WATERMARK_CACHE_SECONDS):
+        oldest = await hot.find_one({"timestamp": {"$lt": mark}}, sort=[("timestamp", ASCENDING)])
+        if oldest:
+            month = month_start(oldest["timestamp"])
+            while month < mark:
+                # Re-copy first: anything written below the mark since the last run is kept
+                stats["copied"] += await _copy_month(month)
+                month = next_month(month)
+            result = await hot.delete_many({"timestamp": {"$lt": mark}})
+            stats["deleted"] = result.deleted_count
+
+    # 2. Copy the months that are newly out of the hot window, then publish the new watermark
+    if mark and mark >= cutoff:
+        return stats
+    oldest = await hot.find_one({"timestamp": {"$gte": mark}} if mark else {}, sort=[("timestamp", ASCENDING)])
+    if oldest:
+        month = month_start(oldest["timestamp"])
+        while month < cutoff:
+            stats["copied"] += await _copy_month(month)
+            stats["months"].append(f"{month:%Y%m}")
+            month = next_month(month)
+    await database.db[TIERS].update_one(
+        {"_id": WATERMARK_ID},
+        {"$set": {"archived_before": cutoff, "set_at": now}},
+        upsert=True,
+    )
+    stats["archived_before"] = cutoff
+    await _tier_state(refresh=True)
+    logger.info(f"Transaction archival: {stats}")
+    return stats
+
+
+async def main():
+    await database.init_db()
+    print(await archive_transactions())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
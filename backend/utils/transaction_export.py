@@ -0,0 +1,88 @@
+# Transaction Export for Vitta Bank
+# Streams an account's ledger as CSV or NDJSON straight from a Motor cursor,
+# optionally gzip-compressed on the fly. Rows are buffered into ~64 KB
+# chunks, so memory stays flat however long the history is.
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+from utils import transaction_archive
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+EXPORT_FIELDS = ("id", "timestamp", "transaction_type", "amount", "description", "related_account_id", "reference")
+
+
+def export_cursor(account_id: str, start_date: datetime = None, end_date: datetime = None):
+    """Oldest-first rows over the (account_id, timestamp) index, archives before the hot tier"""
+    return transaction_archive.find(
+        account_id,
+        start_date,
+        end_date,
+        newest_first=False,
+        projection={field: 1 for field in EXPORT_FIELDS if field != "id"},
+        batch_size=EXPORT_BATCH_SIZE,
+    )
+
+
+def _row(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "timestamp": doc["timestamp"].isoformat(),
+        "transaction_type": doc.get("transaction_type"),
+        "amount": doc.get("amount"),
+        "description": doc.get("description"),
+        "related_account_id": doc.get("related_account_id"),
+        "reference": doc.get("reference"),
+    }
+
+
+async def csv_chunks(cursor):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    async for doc in cursor:
+        writer.writerow(_row(doc))
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def ndjson_chunks(cursor):
+    lines = []
+    size = 0
+    async for doc in cursor:
+        line = json.dumps(_row(doc), separators=(",", ":")) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(lines).encode()
+            lines = []
+            size = 0
+    if lines:
+        yield "".join(lines).encode()
+
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(account_id: str, file_format: str, start_date: datetime = None, end_date: datetime = None, compress: bool = False):
+    cursor = export_cursor(account_id, start_date, end_date)
+    chunks = csv_chunks(cursor) if file_format == "csv" else ndjson_chunks(cursor)
+    return gzip_chunks(chunks) if compress else chunks
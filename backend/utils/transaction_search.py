@@ -0,0 +1,91 @@
+# Transaction Search for Vitta Bank
+# Finds an account's transactions by words in the description (MongoDB text
+# index prefixed by account_id) or by counterparty account number, newest
+# first, with opaque keyset cursors instead of skip/offset. Archived months
+# are searched too, newest tier first, until the page is full.
+import base64
+import re
+from datetime import datetime
+
+from bson import ObjectId
+
+import models
+from utils import transaction_archive
+
+SEARCH_MAX_LIMIT = 100
+ACCOUNT_NUMBER_PATTERN = re.compile(r"^\d{6,20}$")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(txn) -> str:
+    raw = f"{txn.timestamp.isoformat()}|{txn.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, txn_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(txn_id)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def keyset_filter(cursor: str) -> dict:
+    """Rows strictly after the cursor in (timestamp desc, _id desc) order"""
+    timestamp, txn_id = decode_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$lt": txn_id}},
+    ]}
+
+
+def text_query(q: str) -> str:
+    # Quoting each term makes $text match all of them instead of any
+    return " ".join(f'"{term}"' for term in q.replace('"', " ").split())
+
+
+async def search_transactions(
+    account_id: str,
+    q: str,
+    start_date: datetime = None,
+    end_date: datetime = None,
+    cursor: str = None,
+    limit: int = 20,
+) -> dict:
+    q = q.strip()
+    clauses = [{"account_id": account_id}]
+
+    counterparty = None
+    if ACCOUNT_NUMBER_PATTERN.match(q):
+        counterparty = await models.Account.find_one(models.Account.account_number == q)
+    if counterparty:
+        # Exact account number: match on the link, not the description text
+        clauses.append({"related_account_id": str(counterparty.id)})
+    else:
+        clauses.append({"$text": {"$search": text_query(q)}})
+
+    if cursor:
+        cursor_time = decode_cursor(cursor)[0]
+        clauses.append(keyset_filter(cursor))
+        # Tiers newer than the cursor can't hold the next page
+        end_date = min(end_date, cursor_time) if end_date else cursor_time
+
+    # One extra row tells us whether there is another page
+    items = []
+    for collection, bounds in await transaction_archive.tiers(start_date, end_date):
+        query = {"$and": clauses + [{"timestamp": bounds}]} if bounds else {"$and": clauses}
+        docs = await collection.find(
+            query,
+            sort=[("timestamp", -1), ("_id", -1)],
+            limit=limit + 1 - len(items),
+        ).to_list(None)
+        items.extend(models.Transaction.model_validate(doc) for doc in docs)
+        if len(items) > limit:
+            break
+
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return {"items": items[:limit], "next_cursor": next_cursor}
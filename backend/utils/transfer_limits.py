@@ -0,0 +1,263 @@
+# Transfer Velocity Limits for Vitta Bank
+# Hourly and daily amount/count limits per sending account, plus a rapid-fire
+# detector, checked on every transfer without touching Mongo. Each window is
+# a sliding-window counter: the current fixed bucket plus the previous one
+# weighted by how much of it still overlaps the window. Redis checks every
+# window and increments them in one script call; without Redis each worker
+# keeps its own counters.
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger('python-logstash-logger')
+
+TRANSFER_LIMITS_ENABLED = os.getenv("TRANSFER_LIMITS_ENABLED", "true").lower() == "true"
+TRANSFER_LIMITS_BACKEND = os.getenv("TRANSFER_LIMITS_BACKEND", os.getenv("RATE_LIMIT_BACKEND", "memory"))  # memory | redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+MEMORY_SWEEP_EVERY = 10000
+
+HOUR = 3600
+DAY = 86400
+
+# account type -> {window: (seconds, "amount" | "count", limit)}. TRANSFER_LIMITS
+# (JSON, same shape) overrides individual windows, e.g.
+# {"savings": {"daily_amount": [86400, "amount", 500000]}}
+DEFAULT_LIMITS = {
+    "savings": {
+        "hourly_amount": (HOUR, "amount", 100000),
+        "daily_amount": (DAY, "amount", 200000),
+        "daily_count": (DAY, "count", 50),
+        "rapid_fire": (60, "count", 5),
+    },
+    "current": {
+        "hourly_amount": (HOUR, "amount", 500000),
+        "daily_amount": (DAY, "amount", 1000000),
+        "daily_count": (DAY, "count", 200),
+        "rapid_fire": (60, "count", 20),
+    },
+}
+
+WINDOW_NAMES = {
+    "hourly_amount": "hourly transfer limit",
+    "daily_amount": "daily transfer limit",
+    "daily_count": "daily number of transfers",
+    "rapid_fire": "limit on transfers in quick succession",
+}
+
+
+def load_limits(overrides: str = None) -> dict:
+    limits = {account_type: dict(windows) for account_type, windows in DEFAULT_LIMITS.items()}
+    for account_type, windows in json.loads(overrides or "{}").items():
+        limits.setdefault(account_type, {}).update({name: tuple(window) for name, window in windows.items()})
+    return limits
+
+
+LIMITS = load_limits(os.getenv("TRANSFER_LIMITS"))
+
+
+class TransferLimitExceeded(Exception):
+    def __init__(self, window: str, retry_after: float = None):
+        super().__init__(window)
+        self.window = window
+        self.retry_after = retry_after  # None when the transfer alone exceeds the limit
+
+    @property
+    def detail(self) -> str:
+        name = WINDOW_NAMES.get(self.window, self.window)
+        if self.retry_after is None:
+            return f"Amount exceeds the {name}"
+        return f"You have reached the {name}. Please try again later."
+
+
+def retry_after(current: float, previous: float, elapsed: float, width: float, cost: float, limit: float) -> float:
+    """Seconds until the sliding count falls to `limit - cost`"""
+    room = limit - cost
+    if current <= room:
+        # The previous bucket still has to decay far enough
+        needed = 1 - (room - current) / previous if previous else 0.0
+        return max(0.0, needed * width - elapsed)
+    # The current bucket becomes the previous one and then has to decay
+    return (width - elapsed) + width * (1 - room / current)
+
+
+class MemoryWindows:
+    """Single-process sliding-window counters; state is lost on restart"""
+
+    def __init__(self):
+        self.buckets = {}  # (key, width, bucket index) -> used
+        self.calls = 0
+
+    async def take(self, key: str, windows: list, amount: float):
+        """Check every window, then count the transfer in all of them.
+
+        Returns (refused window or None, retry seconds, clock used, backend
+        that counted it).
+        """
+        now = time.time()
+        charges = []
+        for name, width, metric, limit in windows:
+            cost = 1 if metric == "count" else amount
+            bucket = int(now // width)
+            current = self.buckets.get((f"{key}:{name}", width, bucket), 0.0)
+            previous = self.buckets.get((f"{key}:{name}", width, bucket - 1), 0.0)
+            elapsed = now - bucket * width
+            if current + previous * (1 - elapsed / width) + cost > limit:
+                return name, retry_after(current, previous, elapsed, width, cost, limit), now, self
+            charges.append(((f"{key}:{name}", width, bucket), cost))
+        for bucket_key, cost in charges:
+            self.buckets[bucket_key] = self.buckets.get(bucket_key, 0.0) + cost
+
+        self.calls += 1
+        if self.calls % MEMORY_SWEEP_EVERY == 0:
+            self.sweep(now)
+        return None, 0.0, now, self
+
+    async def give_back(self, key: str, windows: list, amount: float, now: float):
+        for name, width, metric, _ in windows:
+            bucket_key = (f"{key}:{name}", width, int(now // width))
+            if bucket_key in self.buckets:
+                self.buckets[bucket_key] -= 1 if metric == "count" else amount
+
+    def sweep(self, now: float):
+        # Only the current and previous bucket of a window are ever read
+        for bucket_key in list(self.buckets):
+            _, width, bucket = bucket_key
+            if bucket < int(now // width) - 1:
+                del self.buckets[bucket_key]
+
+
+# Check every window and count the transfer in all of them, or in none. Uses
+# the server clock so workers with skewed clocks still agree. KEYS are window
+# key prefixes; ARGV is the amount, then width, limit and is_count per window.
+SLIDING_WINDOW_LUA = """
+local amount = tonumber(ARGV[1])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local charges = {}
+for i = 1, #KEYS do
+    local width = tonumber(ARGV[i * 3 - 1])
+    local limit = tonumber(ARGV[i * 3])
+    local cost = amount
+    if ARGV[i * 3 + 1] == '1' then cost = 1 end
+    local bucket = math.floor(now / width)
+    local key = KEYS[i] .. ':' .. bucket
+    local current = tonumber(redis.call('GET', key) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[i] .. ':' .. (bucket - 1)) or '0')
+    local elapsed = now - bucket * width
+    if current + previous * (1 - elapsed / width) + cost > limit then
+        return {i, tostring(current), tostring(previous), tostring(elapsed), tostring(now)}
+    end
+    charges[i] = {key, cost, width}
+end
+for i = 1, #charges do
+    redis.call('INCRBYFLOAT', charges[i][1], charges[i][2])
+    redis.call('EXPIRE', charges[i][1], charges[i][3] * 2)
+end
+return {0, '0', '0', '0', tostring(now)}
+"""
+
+# Uncount a transfer in the buckets it was counted in. KEYS are bucket keys;
+# ARGV is the amount to remove, then the width of each key's window. A bucket
+# that has already expired is left alone rather than recreated below zero.
+GIVE_BACK_LUA = """
+for i = 1, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBYFLOAT', KEYS[i], -tonumber(ARGV[i * 2 - 1]))
+        redis.call('EXPIRE', KEYS[i], tonumber(ARGV[i * 2]) * 2)
+    end
+end
+return 0
+"""
+
+
+class RedisWindows:
+    """Sliding-window counters shared by every worker through one Lua script"""
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.script = self.client.register_script(SLIDING_WINDOW_LUA)
+        self.give_back_script = self.client.register_script(GIVE_BACK_LUA)
+        self.fallback = MemoryWindows()
+
+    async def take(self, key: str, windows: list, amount: float):
+        args = [amount]
+        for _, width, metric, limit in windows:
+            args += [width, limit, 1 if metric == "count" else 0]
+        try:
+            result = await self.script(keys=[f"velocity:{key}:{name}" for name, _, _, _ in windows], args=args)
+        except Exception as e:
+            # Redis trouble must not stop transfers; limit per worker until it recovers
+            logger.error(f"Transfer limit backend unavailable, using in-memory counters: {e}")
+            return await self.fallback.take(key, windows, amount)
+        refused = int(result[0])
+        current, previous, elapsed, now = (float(v) for v in result[1:5])
+        if not refused:
+            return None, 0.0, now, self
+        name, width, metric, limit = windows[refused - 1]
+        return name, retry_after(current, previous, elapsed, width, 1 if metric == "count" else amount, limit), now, self
+
+    async def give_back(self, key: str, windows: list, amount: float, now: float):
+        args = []
+        for _, width, metric, _ in windows:
+            args += [1 if metric == "count" else amount, width]
+        try:
+            await self.give_back_script(
+                keys=[f"velocity:{key}:{name}:{int(now // width)}" for name, width, _, _ in windows], args=args
+            )
+        except Exception as e:
+            # The buckets expire on their own; the transfer just stays counted until then
+            logger.error(f"Transfer limit give-back failed: {e}")
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = RedisWindows() if TRANSFER_LIMITS_BACKEND == "redis" else MemoryWindows()
+    return _backend
+
+
+def warn_if_per_worker():
+    """Say so at startup when each worker enforces the limits on its own"""
+    if TRANSFER_LIMITS_ENABLED and TRANSFER_LIMITS_BACKEND != "redis":
+        logger.warning(
+            "Transfer limits are counted per worker (TRANSFER_LIMITS_BACKEND=memory): with N workers an "
+            "account can move up to N times each limit. Set TRANSFER_LIMITS_BACKEND=redis to share them."
+        )
+
+
+def _windows(account_type: str) -> list:
+    limits = LIMITS.get(account_type) or LIMITS["savings"]
+    return [(name, width, metric, limit) for name, (width, metric, limit) in limits.items()]
+
+
+async def check_transfer(account_id: str, account_type: str, amount: float):
+    """Count a transfer against the sending account's windows.
+
+    Raises TransferLimitExceeded. Returns a receipt for give_back, or None
+    when limits are off.
+    """
+    if not TRANSFER_LIMITS_ENABLED:
+        return None
+    windows = _windows(account_type)
+    for name, _, metric, limit in windows:
+        if metric == "amount" and amount > limit:
+            raise TransferLimitExceeded(name)
+    refused, retry, now, counted_by = await get_backend().take(account_id, windows, amount)
+    if refused:
+        raise TransferLimitExceeded(refused, math.ceil(retry))
+    # Released to the backend that counted it, which is the in-memory fallback while Redis is down
+    return (account_id, account_type, amount, now, counted_by)
+
+
+async def give_back(receipt):
+    """Uncount a transfer that failed after passing check_transfer"""
+    if receipt is None:
+        return
+    account_id, account_type, amount, now, counted_by = receipt
+    await counted_by.give_back(account_id, _windows(account_type), amount, now)
@@ -1,19 +1,36 @@
 from fastapi import WebSocket
-from typing import List
+from typing import Dict, List
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
+        # Authenticated sockets, keyed by user id, for per-user events
+        self.user_connections: Dict[str, List[WebSocket]] = {}
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, user_id: str = None, accepted: bool = False):
+        if not accepted:
+            await websocket.accept()
         self.active_connections.append(websocket)
+        if user_id:
+            self.user_connections.setdefault(user_id, []).append(websocket)
 
-    def disconnect(self, websocket: WebSocket):
+    def disconnect(self, websocket: WebSocket, user_id: str = None):
         self.active_connections.remove(websocket)
+        if user_id and user_id in self.user_connections:
+            self.user_connections[user_id].remove(websocket)
+            if not self.user_connections[user_id]:
+                del self.user_connections[user_id]
 
     async def broadcast(self, message: str):
         for connection in self.active_connections:
             await connection.send_text(message)
 
+    async def send_to_user(self, user_id: str, message: str):
+        for connection in list(self.user_connections.get(user_id, [])):
+            try:
+                await connection.send_text(message)
+            except Exception:
+                # The receive loop notices the closed socket and unregisters it
+                pass
+
 manager = ConnectionManager()
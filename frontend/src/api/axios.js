@@ -12,11 +12,39 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+let refreshing = null;
+
+const refreshSession = async () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) {
+        throw new Error('No refresh token');
+    }
+    // Plain axios so the refresh call skips these interceptors
+    const response = await axios.post(`${api.defaults.baseURL}/auth/refresh`, { refresh_token: refreshToken });
+    localStorage.setItem('token', response.data.access_token);
+    localStorage.setItem('refreshToken', response.data.refresh_token);
+    return response.data.access_token;
+};
+
 api.interceptors.response.use(
     (response) => response,
-    (error) => {
+    async (error) => {
+        const original = error.config;
+        if (error.response && error.response.status === 401 && original && !original._retry && !original.url.startsWith('/auth/login')) {
+            original._retry = true;
+            try {
+                // Concurrent 401s share one refresh; refresh tokens are single-use
+                refreshing = refreshing || refreshSession().finally(() => { refreshing = null; });
+                const token = await refreshing;
+                original.headers.Authorization = `Bearer ${token}`;
+                return api(original);
+            } catch (refreshError) {
+                console.error("Session refresh failed", refreshError);
+            }
+        }
         if (error.response && error.response.status === 401) {
             localStorage.removeItem('token');
+            localStorage.removeItem('refreshToken');
             window.location.href = '/login';
         }
         return Promise.reject(error);
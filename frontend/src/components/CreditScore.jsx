@@ -13,28 +13,12 @@ const CreditScore = () => {
 
     const calculateScore = async () => {
         try {
-            const [accountsRes, loansRes] = await Promise.all([
-                api.get('/accounts/'),
-                api.get('/loans/')
-            ]);
-
-            const totalBalance = accountsRes.data.reduce((sum, acc) => sum + acc.balance, 0);
-            const totalDebt = loansRes.data.reduce((sum, loan) => sum + loan.amount, 0);
-            const net = totalBalance - totalDebt;
-
-            setNetWorth(net);
-
-            // Simple Score Logic
-            // Base: 500
-            // +1 point per $100 net worth
-            // Min: 300, Max: 850
-            let calculatedScore = 500 + Math.floor(net / 100);
-            if (calculatedScore > 850) calculatedScore = 850;
-            if (calculatedScore < 300) calculatedScore = 300;
-
-            setScore(calculatedScore);
+            // Scored server-side from incrementally maintained features
+            const res = await api.get('/credit-score/');
+            setScore(res.data.score);
+            setNetWorth(res.data.net_assets);
         } catch (error) {
-            console.error("Failed to calculate credit score", error);
+            console.error("Failed to load credit score", error);
         } finally {
             setLoading(false);
         }
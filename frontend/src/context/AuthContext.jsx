@@ -46,6 +46,7 @@ export const AuthProvider = ({ children }) => {
         try {
             const response = await api.post('/auth/login', { email, password });
             localStorage.setItem('token', response.data.access_token);
+            localStorage.setItem('refreshToken', response.data.refresh_token);
             localStorage.setItem('userFullName', response.data.user_name);
             localStorage.setItem('isAdmin', response.data.is_admin);
             setUser({ full_name: response.data.user_name, is_admin: response.data.is_admin });
@@ -60,6 +61,7 @@ export const AuthProvider = ({ children }) => {
         try {
             const response = await api.post('/auth/register', userData);
             localStorage.setItem('token', response.data.access_token);
+            localStorage.setItem('refreshToken', response.data.refresh_token);
             localStorage.setItem('userFullName', response.data.user_name);
             localStorage.setItem('isAdmin', response.data.is_admin);
             setUser({ full_name: response.data.user_name, is_admin: response.data.is_admin });
@@ -71,7 +73,13 @@ export const AuthProvider = ({ children }) => {
     };
 
     const logout = () => {
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (refreshToken) {
+            // Revoke server-side; local sign-out does not wait for it
+            api.post('/auth/logout', { refresh_token: refreshToken }).catch(() => {});
+        }
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
         localStorage.removeItem('userFullName');
         localStorage.removeItem('isAdmin');
         setUser(null);
@@ -24,12 +24,24 @@ const Dashboard = () => {
     }, []);
 
     useEffect(() => {
-        // Connect to WebSocket
-        const clientId = Math.floor(Math.random() * 1000);
-        const ws = new WebSocket(`ws://localhost:8000/ws/${clientId}`);
+        // Connect to the per-user event stream
+        const token = localStorage.getItem('token');
+        const ws = new WebSocket('ws://localhost:8000/ws/events');
+
+        ws.onopen = () => {
+            // Authenticate with the first message rather than the URL, which gets logged
+            ws.send(JSON.stringify({ type: 'auth', token }));
+        };
 
         ws.onmessage = (event) => {
-            if (event.data === "update") {
+            // Change-feed events are JSON; "update" is the fallback broadcast
+            let message = event.data;
+            try {
+                message = JSON.parse(event.data).type;
+            } catch {
+                // Plain-text broadcast
+            }
+            if (message === "update") {
                 setRefreshTrigger(prev => prev + 1);
             }
         };